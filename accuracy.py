@@ -0,0 +1,141 @@
+# accuracy.py - Round-trip accuracy sweep for the single precision format
+#
+# Every value from 0 to 2^max_exp at the given number of decimal places is encoded
+# and decoded again; a value counts as an error when it does not come back unchanged.
+# Two encoders are checked:
+#   scalar  Precision.dec2spbin / spbin2dec, the 32-bit strings the VM stores
+#   bulk    Precision.dec2spword / spword2dec, packed integer words
+# and two more columns flag where they part ways:
+#   malformed  the scalar string is not a packed word (wrong length, or the "-" dec2spbin
+#              writes into the fraction field for 0 < |x| < 1)
+#   disagree   the scalar string and the bulk word hold different bits
+# The range is split into chunks that are checked in a process pool. The scalar path
+# runs one value at a time and takes most of the time; --encoder bulk skips it.
+#
+#   python accuracy.py                          # 0..2^16, 2 places, Length.whole/fraction
+#   python accuracy.py --split 8:23 --split 7:24 --max-exp 12 --show 10 --encoder bulk
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from convert import Length, Precision
+
+ENCODERS = ("scalar", "bulk")
+CHECKS = {"scalar": ("scalar", "malformed"), "bulk": ("bulk",)}     # columns each encoder adds
+
+
+def columns(encoders):
+    names = [name for encoder in ENCODERS if encoder in encoders for name in CHECKS[encoder]]
+    return names + ["disagree"] if len(encoders) == len(ENCODERS) else names
+
+
+def sweepChunk(start, stop, places, whole, fraction, encoders=ENCODERS, show=0):
+    # Check the values start/10^places .. (stop-1)/10^places; returns
+    # ({band: [values, {column: [count, max error]}]},
+    #  [(column, value, decoded value or, for malformed/disagree, the scalar string)])
+    values = np.arange(start, stop, dtype=np.int64) / 10**places
+    flagged, errors, decoded = {}, {}, {}
+    if "bulk" in encoders:
+        words = Precision.dec2spword(values, whole, fraction)
+        decoded["bulk"] = Precision.spword2dec(words, whole, fraction, places)
+    if "scalar" in encoders:
+        strings = [Precision.dec2spbin(value, whole, fraction) for value in values.tolist()]
+        decoded["scalar"] = np.array([Precision.spbin2dec(string, whole) for string in strings])
+        width = 1 + whole + fraction
+        flagged["malformed"] = np.array([len(string) != width or "-" in string for string in strings])
+        if "bulk" in encoders:
+            flagged["disagree"] = np.array(strings) != np.array(Precision.spword2spbin(words, whole, fraction))
+    for encoder, back in decoded.items():
+        errors[encoder] = np.abs(back - values)
+        flagged[encoder] = errors[encoder] != 0
+
+    # exponent band = floor(log2(value)); zero gets its own band below the smallest one
+    bands = np.frexp(values)[1].astype(np.int64) - 1
+    bands[values == 0] = -places * 4 - 1
+    result = {}
+    for band in np.unique(bands):
+        inBand = bands == band
+        counts = {}
+        for column, wrong in flagged.items():
+            hit = inBand & wrong
+            worst = float(errors[column][hit].max()) if column in errors and hit.any() else 0.
+            counts[column] = [int(hit.sum()), worst]
+        result[int(band)] = [int(inBand.sum()), counts]
+    samples = []
+    for column in columns(encoders):
+        for i in np.flatnonzero(flagged[column])[:show]:
+            detail = float(decoded[column][i]) if column in decoded else strings[i]
+            samples.append((column, float(values[i]), detail))
+    return result, samples
+
+
+def mergeBands(total, part):
+    for band, (count, counts) in part.items():
+        if band not in total:
+            total[band] = [0, {column: [0, 0.] for column in counts}]
+        total[band][0] += count
+        for column, (errors, max_error) in counts.items():
+            total[band][1][column][0] += errors
+            total[band][1][column][1] = max(total[band][1][column][1], max_error)
+
+
+def sweep(max_exp=16, places=Length.dec_place, whole=Length.whole, fraction=Length.fraction,
+          workers=None, chunk=2**20, show=0, encoders=ENCODERS):
+    stop = 2**max_exp * 10**places
+    bands, samples = {}, []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(sweepChunk, start, min(start + chunk, stop), places, whole, fraction, encoders, show)
+                for start in range(0, stop, chunk)]
+        for job in jobs:
+            part, found = job.result()
+            mergeBands(bands, part)
+            for column in columns(encoders):
+                have = sum(1 for sample in samples if sample[0] == column)
+                samples.extend([sample for sample in found if sample[0] == column][:show - have])
+    return bands, samples
+
+
+def report(bands, samples, max_exp, places, whole, fraction, encoders=ENCODERS):
+    names = columns(encoders)
+    total = sum(count for count, _ in bands.values())
+    print(f"Split {whole}:{fraction} - from 0 to {2**max_exp}, for {places} decimal places:")
+    for column in names:
+        flagged = sum(counts[column][0] for _, counts in bands.values())
+        line = f"{column:>10}: {flagged} of {total} ({round(flagged / total * 100, int(max_exp / 5))}%)"
+        if column in ENCODERS:
+            line += f" errors, max error {max(counts[column][1] for _, counts in bands.values())}"
+        print(line)
+    print(f"{'band':>12} {'values':>10}" + "".join(f" {column:>10}" for column in names))
+    for band in sorted(bands):
+        count, counts = bands[band]
+        label = "0" if band < -places * 4 else f"2^{band}"
+        print(f"{label:>12} {count:>10}" + "".join(f" {counts[column][0]:>10}" for column in names))
+    for column, value, detail in samples:
+        print(f"{column} {value} {detail}")
+
+
+def parseSplit(text):
+    whole, fraction = text.split(":")
+    return int(whole), int(fraction)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round-trip accuracy sweep of the single precision format")
+    parser.add_argument("--max-exp", type=int, default=16, help="check values from 0 to 2^MAX_EXP (default 16)")
+    parser.add_argument("--places", type=int, default=Length.dec_place, help="decimal places per value")
+    parser.add_argument("--split", type=parseSplit, action="append",
+                        help=f"WHOLE:FRACTION bit split, repeatable (default {Length.whole}:{Length.fraction})")
+    parser.add_argument("--encoder", choices=("both",) + ENCODERS, default="both",
+                        help="encoder to sweep (default both, with the malformed/disagree columns)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument("--chunk", type=int, default=2**20, help="values per task")
+    parser.add_argument("--show", type=int, default=0, help="print up to SHOW flagged values per column")
+    args = parser.parse_args()
+
+    encoders = ENCODERS if args.encoder == "both" else (args.encoder,)
+    for whole, fraction in args.split or [(Length.whole, Length.fraction)]:
+        bands, samples = sweep(args.max_exp, args.places, whole, fraction, args.workers, args.chunk, args.show, encoders)
+        report(bands, samples, args.max_exp, args.places, whole, fraction, encoders)
+        print()
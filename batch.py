@@ -0,0 +1,160 @@
+# batch.py - Runs many .inc programs across a process pool
+#
+# Every program gets a fresh storage.Machine inside the worker, so programs never see
+# each other's registers or memory. The final register/memory state and timing of each
+# program are collected into one JSON or CSV report. With --diff only the cells the run
+# changed (Machine.diff after loading the program) are reported. With --check a program
+# whose control-flow graph shows it can never end (cfg.Graph.neverTerminates) is
+# reported as "rejected" without being run. Every run is limited to --budget instructions
+# and --timeout seconds (scheduler.VM, one quantum at a time); a program that hits a
+# limit is reported with status "budget" or "timeout" and the state it had reached.
+#
+#   python batch.py programs/                    # every .inc file in the directory
+#   python batch.py "tests/**/*.inc" --workers 8 --output report.csv --cache .images --optimize
+#   python batch.py submissions/ --check --budget 100000 --timeout 2
+
+import argparse
+import contextlib
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cfg
+import storage
+from convert import Length
+from run import Program
+from scheduler import QUANTUM, VM
+
+BUDGET = 10**7          # instructions per program before it is stopped
+TIMEOUT = 60.           # wall-clock seconds per program
+
+
+def findPrograms(patterns):
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.inc")
+        files.extend(sorted(glob.glob(pattern, recursive=True)))
+    return files
+
+
+def dumpState(machine, diff=None):
+    # Final state as plain decimals; instruction words are kept as their 32-bit strings.
+    # With a Machine.diff() only its cells are dumped, None for a removed one
+    if diff is None:
+        registers = {str(k): machine.register.load(k) for k, _ in machine.register.items()}
+        memory = {}
+        for k, v in machine.memory.items():
+            memory[str(k)] = v if machine.memory.inCode(k) else machine.memory.load(k)
+        return registers, memory
+    registers = {str(k): None if v is None else machine.register.load(k) for k, v in diff["register"].items()}
+    memory = {}
+    for k, v in diff["memory"].items():
+        if v is None:
+            memory[str(k)] = None
+        elif machine.memory.inCode(k):
+            memory[str(k)] = Length.addZeros(v, Length.instrxn)
+        else:
+            memory[str(k)] = machine.memory.load(k)
+    return registers, memory
+
+
+def runFile(filename, cache=None, optimize=False, diff=False, check=False, budget=BUDGET, timeout=TIMEOUT):
+    result = {"file": filename, "status": "ok", "error": "", "optimized": 0, "assemble_seconds": 0., "run_seconds": 0.}
+    machine = storage.Machine()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            program = Program(Program.readFile(filename), machine, cache=cache, optimize=optimize)
+            if diff:
+                machine.checkpoint()
+            graph = cfg.Graph(machine) if check else None
+            assembled = time.perf_counter()
+            if graph is not None and graph.neverTerminates():
+                result["status"] = "rejected"
+                result["error"] = f"never terminates: blocks {graph.stuck()} cannot reach the end"
+            else:
+                vm = VM(program, budget=budget, timeout=timeout)
+                while vm.turn(QUANTUM):
+                    pass
+                if vm.status != "done":
+                    result["status"] = vm.status
+                    result["error"] = vm.error or f"stopped after {vm.executed} instructions"
+            done = time.perf_counter()
+        result["optimized"] = len(program.changes)
+        result["assemble_seconds"] = assembled - start
+        result["run_seconds"] = done - assembled
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    changes = machine.diff() if diff and machine.data[0].journal is not None else None
+    result["registers"], result["memory"] = dumpState(machine, changes)
+    return result
+
+
+def runBatch(files, workers=None, cache=None, optimize=False, diff=False, check=False, budget=BUDGET, timeout=TIMEOUT):
+    n = len(files)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(runFile, files, [cache] * n, [optimize] * n, [diff] * n, [check] * n,
+                             [budget] * n, [timeout] * n))
+
+
+def writeJSON(results, out):
+    json.dump(results, out, indent=2)
+    out.write("\n")
+
+
+def writeCSV(results, out):
+    # One row per program; registers and memory slots become reg:<k> / mem:<k> columns
+    fields = ["file", "status", "error", "optimized", "assemble_seconds", "run_seconds"]
+    slots = []
+    for result in results:
+        for scope in ("registers", "memory"):
+            for k in result[scope]:
+                column = ("reg:" if scope == "registers" else "mem:") + k
+                if column not in slots:
+                    slots.append(column)
+    writer = csv.DictWriter(out, fields + slots)
+    writer.writeheader()
+    for result in results:
+        row = {field: result[field] for field in fields}
+        row.update({"reg:" + k: v for k, v in result["registers"].items()})
+        row.update({"mem:" + k: v for k, v in result["memory"].items()})
+        writer.writerow(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many .inc programs in parallel and report their final state")
+    parser.add_argument("paths", nargs="+", help="directories (all *.inc inside) or glob patterns")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument("--cache", default=None, help="directory for cached program images (default: no cache)")
+    parser.add_argument("--optimize", action="store_true", help="run the peephole pass before encoding")
+    parser.add_argument("--diff", action="store_true", help="report only the cells each run changed")
+    parser.add_argument("--check", action="store_true", help="reject programs that provably never terminate")
+    parser.add_argument("--budget", type=int, default=BUDGET, help=f"instructions per program, 0 for no limit (default {BUDGET})")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help=f"seconds per program, 0 for no limit (default {TIMEOUT:g})")
+    parser.add_argument("--output", default="-", help="report file, .csv or .json (default: JSON on stdout)")
+    args = parser.parse_args()
+
+    files = findPrograms(args.paths)
+    if not files:
+        print(f"[ERROR] No .inc files found in {' '.join(args.paths)}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    results = runBatch(files, args.workers, args.cache, args.optimize, args.diff, args.check,
+                       args.budget or None, args.timeout or None)
+    elapsed = time.perf_counter() - start
+
+    write = writeCSV if args.output.endswith(".csv") else writeJSON
+    if args.output == "-":
+        write(results, sys.stdout)
+    else:
+        with open(args.output, "w", newline="") as out:
+            write(results, out)
+    failed = sum(result["status"] != "ok" for result in results)
+    print(f"[INFO] Ran {len(results)} programs ({failed} failed) in {elapsed:.2f}s", file=sys.stderr)
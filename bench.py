@@ -0,0 +1,181 @@
+# bench.py - Benchmarks for the assembler, interpreter, storage and conversions
+#
+# Cases (ops are counted per instruction, operand, word, access or value):
+#   encode/<mix>      Instruction.encode over a synthetic program
+#   encodeOp          Instruction.encodeOp over the operands of the mixed program
+#   decode            Program.decode over its encoded words
+#   run/<mix>         Program.run, per executed instruction
+#   lanes/<mix>       lanes.Lanes.run over LANES initial states, per instruction and lane
+#                     (only with NumPy installed)
+#   storage/<op>      Storage.load / store on data memory (native/<op>: NativeStorage,
+#                     paged/<op>: PagedStorage)
+#   precision/<op>    Precision.dec2spbin / spbin2dec per value, dec2spword per batch value
+#   schedule          scheduler.Scheduler.run over VMS programs (the mixed one, each on its
+#                     own machine) a QUANTUM at a time, per executed instruction
+#   reset/<how>       one test vector of the mixed program: a fresh machine and Program per
+#                     run (new) or one run then Machine.restore of a snapshot (restore)
+# Programs come from synth.generate, one per mix in synth.MIXES. Every case is timed for
+# at least --min-time seconds, best of --repeat; one extra pass under tracemalloc gives
+# the peak and retained bytes per call. Results go to JSON so runs can be compared:
+#
+#   python bench.py --output base.json
+#   python bench.py --compare base.json --threshold 0.10    # exit status 1 on a regression
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import lanes
+import scheduler
+import storage
+import synth
+import tracing
+from compiler import Instruction
+from convert import Precision
+from profiler import Profiler
+from run import Program
+
+DATA = range(storage.mapr, storage.mem_len)     # data memory addresses past the instruction region
+LANES = 1000
+VMS = 200
+
+
+def machineFor(source, native=False):
+    machine = storage.Machine(native)
+    program = Program(source, machine, tracer=tracing.Tracer(tracing.OFF))
+    return machine, program
+
+
+def cases(length, seed):
+    # name -> (function to time, ops per call)
+    result = {}
+    sources = {mix: synth.generate(length, mix, seed) for mix in synth.MIXES}
+    parsed = {mix: Instruction.preEncode([[part.strip(",") for part in line.split()] for line in source])
+              for mix, source in sources.items()}
+    machine, program = machineFor(sources["mixed"])
+
+    for mix, insts in parsed.items():
+        result[f"encode/{mix}"] = (lambda insts=insts: [Instruction.encode(inst, machine) for inst in insts], len(insts))
+    operands = [op for inst in parsed["mixed"] for op in inst[1:]]
+    result["encodeOp"] = (lambda: [Instruction.encodeOp(op, machine) for op in operands], len(operands))
+    words = [machine.memory.loadInstruction(pc) for pc in range(storage.mbr, storage.mbr + len(parsed["mixed"]))]
+    result["decode"] = (lambda: [Program.decode(word) for word in words], len(words))
+
+    for mix, source in sources.items():
+        _, runner = machineFor(source)
+        profiler = Profiler()
+        runner.run(profiler=profiler)
+        result[f"run/{mix}"] = (runner.run, profiler.instructions())
+        if lanes.np is not None:
+            _, runner = machineFor(source, native=True)
+            result[f"lanes/{mix}"] = (lambda runner=runner: lanes.Lanes(runner, LANES).run(), profiler.instructions() * LANES)
+
+    for name, options in (("storage", {}), ("native", {"native": True}), ("paged", {"pageSize": storage.page_len})):
+        memory = storage.Machine(**options).memory
+        result[f"{name}/load"] = (lambda memory=memory: [memory.load(a) for a in DATA], len(DATA))
+        result[f"{name}/store"] = (lambda memory=memory: [memory.store(a, a * 0.25) for a in DATA], len(DATA))
+
+    source = sources["mixed"]
+    programs = [machineFor(source)[1] for _ in range(VMS)]
+    def schedule():
+        runner = scheduler.Scheduler()
+        for program in programs:
+            runner.add(program)
+        return runner.run()
+    result["schedule"] = (schedule, sum(vm.executed for vm in schedule()))
+    result["reset/new"] = (lambda: machineFor(source)[1].run(), 1)
+    machine, runner = machineFor(source)
+    snapshot = machine.snapshot()
+    result["reset/restore"] = (lambda: (runner.run(), machine.restore(snapshot)), 1)
+
+    values = [i * 0.25 for i in range(1000)]
+    bins = [Precision.dec2spbin(v) for v in values]
+    result["precision/dec2spbin"] = (lambda: [Precision.dec2spbin(v) for v in values], len(values))
+    result["precision/spbin2dec"] = (lambda: [Precision.spbin2dec(b) for b in bins], len(bins))
+    result["precision/dec2spword"] = (lambda: Precision.dec2spword(values), len(values))
+    return result
+
+
+def measure(fn, ops, min_time, repeat):
+    best = 0.
+    for _ in range(repeat):
+        calls, start = 0, time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = max(best, calls * ops / elapsed)
+    tracemalloc.start()
+    try:
+        fn()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"ops": ops, "ops_per_sec": best, "seconds_per_op": 1 / best if best else 0.,
+            "alloc_peak_bytes": peak, "alloc_retained_bytes": retained}
+
+
+def revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(old, new, threshold):
+    # Print old/new ops per second for the cases in both runs; True when any got slower
+    # by more than `threshold` (a fraction)
+    regressed = False
+    print(f"{'case':<24} {'old ops/s':>12} {'new ops/s':>12} {'change':>8}")
+    for name, result in new["cases"].items():
+        if name not in old["cases"]:
+            continue
+        before, after = old["cases"][name]["ops_per_sec"], result["ops_per_sec"]
+        change = after / before - 1 if before else 0.
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{name:<24} {before:>12.0f} {after:>12.0f} {change:>+8.1%}{flag}")
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark assembly, decode, execution, storage and conversions")
+    parser.add_argument("--length", type=int, default=synth.MAX_LENGTH, help="instruction words per synthetic program")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic programs")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing round")
+    parser.add_argument("--repeat", type=int, default=3, help="timing rounds per case (best is kept)")
+    parser.add_argument("--filter", default="", help="only cases whose name contains FILTER")
+    parser.add_argument("--output", default=None, help="write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    results = {"revision": revision(), "python": platform.python_version(),
+               "length": args.length, "seed": args.seed, "cases": {}}
+    print(f"{'case':<24} {'ops/s':>12} {'us/op':>9} {'peak B':>9} {'kept B':>9}")
+    for name, (fn, ops) in cases(args.length, args.seed).items():
+        if args.filter not in name:
+            continue
+        result = results["cases"][name] = measure(fn, ops, args.min_time, args.repeat)
+        print(f"{name:<24} {result['ops_per_sec']:>12.0f} {result['seconds_per_op'] * 1e6:>9.2f} "
+              f"{result['alloc_peak_bytes']:>9} {result['alloc_retained_bytes']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+            out.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print()
+        if compare(old, results, args.threshold):
+            sys.exit(1)
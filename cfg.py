@@ -0,0 +1,342 @@
+# cfg.py - Control-flow graph and static analysis of an assembled program
+#
+# Built from the encoded instruction memory (what Program.run executes), so it sees
+# resolved labels and the peephole pass's output. A block starts at the first
+# instruction, at every constant jump/CALL target and after every jump, CALL, RET or
+# EOP. Edges follow run.Program:
+#   fall      to the next instruction (also the not-taken side of a branch)
+#   jump      JMP to a constant target inside the instruction region
+#   branch    JEQ..JGE taken side
+#   call      CALL to its target; the instruction after the CALL is reached by RET
+#   return    RET to the instruction after every CALL (and fall, on a stack error)
+#   computed  JMP/Jcc/CALL whose target is only known at run time: every instruction
+# EOP, an empty word past the assembled program (Machine.programEnd) and running off
+# the end of the program leave through EXIT.
+#
+# On top of the graph: reachability from the entry, dominators and natural loops with
+# their nesting depth, register liveness (R0..regLen-1, which include the special
+# registers of storage.register_list, plus the SPR stack pointer) and the blocks
+# that cannot reach EXIT. A program whose entry cannot reach EXIT never terminates,
+# whatever its data; one with stuck blocks elsewhere loops forever if it gets there.
+# Self-modifying programs (a write that can land in the instruction region, SCAN
+# included) are analyzed as currently encoded and flagged; the graph may not be the
+# one that runs, so they are never reported as non-terminating.
+#
+#   python cfg.py isk.inc
+
+import argparse
+
+import storage
+import tracing
+from compiler import arithmetic, conditions, opnames
+from run import Program
+
+EXIT = None             # successor standing for the end of the program
+STACK = ("SPR",)
+
+
+class Block:
+    def __init__(self, start):
+        self.start = start
+        self.end = start            # one past the last instruction
+        self.insts = []             # (pc, name, op1, op2, compared register) per instruction
+        self.succs = {}             # successor start (or EXIT) -> edge kind
+        self.preds = set()
+        self.use = set()            # registers read before being written in the block
+        self.defs = set()           # registers written in the block
+        self.liveIn = set()
+        self.liveOut = set()
+        self.depth = 0              # number of loops containing the block
+
+
+class Loop:
+    def __init__(self, header):
+        self.header = header
+        self.body = {header}        # block starts
+        self.parent = None          # innermost enclosing Loop
+        self.depth = 1
+
+
+def reads(operand):
+    # (registers, stack pointers) an operand read touches (see Program.readers)
+    mode, addr = operand
+    if mode in (0b000, 0b001):
+        return {addr}
+    if mode in (0b101, 0b110):
+        return {"SPR"}
+    return set()
+
+
+class Graph:
+    def __init__(self, machine, observable=None):
+        # observable: registers live when the program ends (default: all of them)
+        self.machine = machine
+        self.registers = set(range(machine.regLen)) | set(STACK)
+        self.observable = self.registers if observable is None else set(observable)
+        memory = machine.memory
+        words = {pc: memory.loadInstruction(pc) for pc in range(machine.codeBase, machine.codeEnd)}
+        used = [pc for pc, word in words.items() if word]
+        self.entry = machine.codeBase
+        self.end = max(used[-1] + 1 if used else self.entry, machine.programEnd)   # falling through to here stops
+        self.insts = {}
+        for pc in range(self.entry, self.end):
+            word, opid, op1, op2, compared = Program.decode(words[pc])
+            # an empty word inside the assembled program is PRNT R0
+            stop = not word and pc >= machine.programEnd
+            self.insts[pc] = (pc, "STOP" if stop else opnames[opid], op1, op2, compared)
+        self.computed = any(self.target(inst) == "computed" for inst in self.insts.values())
+        self.selfModifying = any(self.writesCode(inst) for inst in self.insts.values())
+        self.build()
+        self.reachable = self.reach(self.entry)
+        self.dominators()
+        self.findLoops()
+        self.liveness()
+        self.exits = self.reachExit()
+
+    def target(self, inst):
+        # constant target of a jump/CALL, EXIT, "computed", or None when it falls through
+        pc, name, op1 = inst[:3]
+        if name not in ("JMP", "CALL") and name not in conditions:
+            return None
+        mode, addr = op1
+        if mode != 0b100:
+            return "computed"
+        if not self.machine.codeBase <= addr < self.machine.codeEnd:
+            return None  # out of the instruction region: execJMP and friends fall through
+        return addr if addr < self.end else EXIT
+
+    def writesCode(self, inst):
+        pc, name, op1 = inst[:3]
+        if name not in ("MOV", "POP", "SCAN") and name not in arithmetic:
+            return False
+        mode, addr = op1
+        return mode in (0b001, 0b011) or mode == 0b010 and self.machine.memory.inCode(addr)
+
+    def build(self):
+        leaders = {self.entry}
+        for pc, inst in self.insts.items():
+            name = inst[1]
+            if self.computed:
+                leaders.add(pc)
+            target = self.target(inst)
+            if target not in (None, EXIT, "computed"):
+                leaders.add(target)
+            if name in ("JMP", "CALL", "RET", "EOP", "STOP") or name in conditions:
+                leaders.add(pc + 1)
+        self.blocks = {}
+        block = None
+        for pc, inst in self.insts.items():
+            if pc in leaders or block is None:
+                block = self.blocks[pc] = Block(pc)
+            block.insts.append(inst)
+            block.end = pc + 1
+        returns = {inst[0] + 1 for inst in self.insts.values() if inst[1] == "CALL"}
+        for block in self.blocks.values():
+            pc, name = block.insts[-1][:2]
+            follow = pc + 1 if pc + 1 < self.end else EXIT
+            target = self.target(block.insts[-1])
+            if name in ("EOP", "STOP"):
+                block.succs[EXIT] = "exit"
+                continue
+            if target == "computed":
+                block.succs.update({start: "computed" for start in self.blocks})
+                block.succs[EXIT] = "computed"
+            elif name == "RET":
+                block.succs.update({start if start < self.end else EXIT: "return" for start in returns})
+            elif target is not None or name in ("JMP", "CALL") or name in conditions:
+                if target is not None:
+                    block.succs[target] = "jump" if name == "JMP" else "call" if name == "CALL" else "branch"
+                if name != "JMP" or target is None:
+                    # not taken, out of range, or a CALL that failed to push / the return site
+                    block.succs.setdefault(follow, "fall")
+                continue
+            block.succs.setdefault(follow, "fall")
+        for start, block in self.blocks.items():
+            for succ in block.succs:
+                if succ is not EXIT:
+                    self.blocks[succ].preds.add(start)
+
+    def reach(self, start):
+        seen, todo = set(), [start]
+        while todo:
+            at = todo.pop()
+            if at is EXIT or at in seen or at not in self.blocks:
+                continue
+            seen.add(at)
+            todo.extend(self.blocks[at].succs)
+        return seen
+
+    def reachExit(self):
+        # blocks from which EXIT can be reached
+        seen = {start for start, block in self.blocks.items() if EXIT in block.succs}
+        todo = list(seen)
+        while todo:
+            for pred in self.blocks[todo.pop()].preds:
+                if pred not in seen:
+                    seen.add(pred)
+                    todo.append(pred)
+        return seen
+
+    def dominators(self):
+        order = sorted(self.reachable)
+        self.dom = {start: set(order) for start in order}
+        self.dom[self.entry] = {self.entry}
+        changed = True
+        while changed:
+            changed = False
+            for start in order:
+                if start == self.entry:
+                    continue
+                preds = [self.dom[p] for p in self.blocks[start].preds if p in self.reachable]
+                dom = set.intersection(*preds) | {start} if preds else {start}
+                if dom != self.dom[start]:
+                    self.dom[start] = dom
+                    changed = True
+
+    def findLoops(self):
+        # natural loops of the back edges (tail -> header that dominates it), merged per header
+        loops = {}
+        for tail in self.reachable:
+            for header in self.blocks[tail].succs:
+                if header is EXIT or header not in self.dom[tail]:
+                    continue
+                loop = loops.setdefault(header, Loop(header))
+                todo = [tail]
+                while todo:
+                    at = todo.pop()
+                    if at not in loop.body:
+                        loop.body.add(at)
+                        todo.extend(p for p in self.blocks[at].preds if p in self.reachable)
+        self.loops = sorted(loops.values(), key=lambda loop: len(loop.body))
+        for i, loop in enumerate(self.loops):
+            for outer in self.loops[i + 1:]:
+                if loop.header in outer.body:
+                    loop.parent = outer
+                    break
+        for loop in reversed(self.loops):
+            loop.depth = loop.parent.depth + 1 if loop.parent else 1
+        for start, block in self.blocks.items():
+            block.depth = sum(start in loop.body for loop in self.loops)
+
+    def effects(self, inst):
+        # (registers read, registers fully written) by one instruction (see Program.exec*)
+        pc, name, op1, op2, compared = inst
+        use, defs = set(), set()
+        def write(operand):
+            mode, addr = operand
+            if mode == 0b000:
+                defs.add(addr)
+            elif mode == 0b001:
+                use.add(addr)
+            elif mode == 0b101:
+                use.add("SPR")
+                defs.add("SPR")
+        if name == "MOV":
+            use |= reads(op2)
+            write(op1)
+        elif name in arithmetic:
+            use |= reads(op1) | reads(op2)
+            write(op1)
+        elif name == "PUSH":
+            use |= reads(op1) | {"SPR"}
+        elif name == "POP":
+            use.add("SPR")
+            write(op1)
+        elif name in ("JMP", "PRNT"):
+            use |= reads(op1)
+        elif name == "SCAN":
+            write(op1)
+        elif name in conditions:
+            use |= reads(op1) | reads(op2) | {compared}
+        elif name in ("CALL", "RET"):
+            use |= reads(op1) if name == "CALL" else set()
+            use.add("SPR")
+        # a stack pointer is read and written back: still live through the instruction
+        return use & self.registers, defs & self.registers
+
+    def liveness(self):
+        for block in self.blocks.values():
+            for inst in reversed(block.insts):
+                use, defs = self.effects(inst)
+                block.use = (block.use - defs) | use
+                block.defs |= defs
+        changed = True
+        while changed:
+            changed = False
+            for block in sorted(self.blocks.values(), key=lambda block: -block.start):
+                out = set()
+                for succ in block.succs:
+                    out |= self.observable if succ is EXIT else self.blocks[succ].liveIn
+                live = block.use | (out - block.defs)
+                if out != block.liveOut or live != block.liveIn:
+                    block.liveOut, block.liveIn = out, live
+                    changed = True
+
+    def deadStores(self):
+        """(pc, register) of register writes nothing reads before they are overwritten or the program ends"""
+        dead = []
+        for start in sorted(self.reachable):
+            block = self.blocks[start]
+            live = set(block.liveOut)
+            for inst in reversed(block.insts):
+                use, defs = self.effects(inst)
+                dead += [(inst[0], register) for register in sorted(defs - live, key=str)]
+                live = (live - defs) | use
+        return sorted(dead)
+
+    def unreachable(self):
+        """Start addresses of the blocks no path from the entry reaches"""
+        return sorted(set(self.blocks) - self.reachable)
+
+    def stuck(self):
+        """Reachable blocks from which the program can never end (provably infinite loops)"""
+        return sorted(self.reachable - self.exits)
+
+    def neverTerminates(self):
+        """True when no path from the entry reaches EXIT; False when it can, or when the
+        program may rewrite its own code and the graph proves nothing"""
+        return not self.selfModifying and self.entry not in self.exits
+
+    def report(self):
+        def label(register):
+            if isinstance(register, int) and storage.br <= register < storage.br + len(storage.register_list):
+                return f"R{register}({storage.register_list[register - storage.br]})"
+            return f"R{register}" if isinstance(register, int) else register
+        def names(registers):
+            return " ".join(label(r) for r in sorted(registers, key=lambda r: (isinstance(r, str), r))) or "-"
+        lines = [f"{len(self.insts)} instructions ({self.entry}-{self.end - 1}), {len(self.blocks)} blocks"]
+        if self.selfModifying:
+            lines.append("self-modifying: analyzed as currently encoded")
+        lines.append("")
+        for start in sorted(self.blocks):
+            block = self.blocks[start]
+            succs = ", ".join(f"{'EXIT' if succ is EXIT else succ} ({kind})" for succ, kind in block.succs.items())
+            flags = "" if start in self.reachable else "  UNREACHABLE"
+            flags += "  STUCK" if start in self.reachable and start not in self.exits else ""
+            lines.append(f"block {start}-{block.end - 1} depth {block.depth} -> {succs or '-'}{flags}")
+            lines.append(f"    live in: {'all' if block.liveIn == self.registers else names(block.liveIn)}")
+        lines.append("")
+        for loop in self.loops:
+            parent = f" inside {loop.parent.header}" if loop.parent else ""
+            lines.append(f"loop at {loop.header}: blocks {sorted(loop.body)}, depth {loop.depth}{parent}")
+        lines.append(f"unreachable: {self.unreachable() or '-'}")
+        lines.append(f"stuck (never end once reached): {self.stuck() or '-'}")
+        lines.append(f"dead register stores: {', '.join(f'{pc}:{label(r)}' for pc, r in self.deadStores()) or '-'}")
+        lines.append("never terminates" if self.neverTerminates() else "can terminate")
+        return "\n".join(lines)
+
+
+def analyze(program, machine=None):
+    """Graph of an assembled run.Program (or of a machine's instruction memory)"""
+    return Graph(program.machine if machine is None else machine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Control-flow graph, loops, liveness and termination of a .inc program")
+    parser.add_argument("program", help=".inc file to analyze")
+    parser.add_argument("--optimize", action="store_true", help="analyze the output of the peephole pass")
+    args = parser.parse_args()
+
+    machine = storage.Machine()
+    program = Program(Program.readFile(args.program), machine, tracer=tracing.Tracer(tracing.OFF), optimize=args.optimize)
+    print(analyze(program).report())
@@ -1,4 +1,5 @@
 import storage
+import tracing
 from addressing import Access, AddressingMode
 from convert import Length, Precision, Value
 
@@ -16,6 +17,34 @@ operationCodes = [
     ["000", "001", "010", "011", "100", "101", "110", "111"]  # Category codes
 ]
 
+# mnemonic -> 5-bit opcode and opcode -> mnemonic (None for unused codes), built once
+opcodes = {}
+opnames = [None] * 2**5
+for i, group in enumerate(operations):
+    for j, name in enumerate(group):
+        opcodes[name] = int(operationCodes[0][i] + operationCodes[1][j], 2)
+        opnames[opcodes[name]] = name
+opcodes["DEF"] = opcodes["MOV"]                             # def treated as Mov to preserve DEF in metadata
+
+# arithmetic mnemonic -> op1 <op> op2 (run.Program.execArithmetic, peephole constant folding)
+arithmetic = {
+    "ADD": lambda a, b: a + b,
+    "SUB": lambda a, b: a - b,
+    "MUL": lambda a, b: a * b,
+    "DIV": lambda a, b: a / b,
+    "MOD": lambda a, b: a % b,
+}
+
+# conditional jump mnemonic -> test on (a, b) (run.Program.execBranch, lanes.Lanes)
+conditions = {
+    "JEQ": lambda a, b: a == b,
+    "JNE": lambda a, b: a != b,
+    "JLT": lambda a, b: a < b,
+    "JLE": lambda a, b: a <= b,
+    "JGT": lambda a, b: a > b,
+    "JGE": lambda a, b: a >= b,
+}
+
 class Instruction:
     @staticmethod
     def preEncode(instrxns):
@@ -26,6 +55,12 @@ class Instruction:
             
             if len(inst) == 0:
                 continue
+
+            if isinstance(inst[0], str) and inst[0].endswith(":"):  # Label, alone or before an instruction
+                result.append([inst[0]])
+                inst = inst[1:]
+                if len(inst) == 0:
+                    continue
                 
             if inst[0] == "DEV":                              # DEV treated same as MOV 
                 if len(inst) >= 3:
@@ -43,51 +78,61 @@ class Instruction:
         return result
 
     @staticmethod
-    def encode(inst):                                       # Encode a single instruction into 32-bit binary string
-       
-        if inst[0] == "FUNC":                               # FUNC treated same as EOP (end of program)
-            return "0" * 32
+    def isWord(inst):
+        # False for lines that take no instruction word: DEF/DEB and labels ("NAME:")
+        return inst[0] not in ("DEF", "DEB") and not inst[0].endswith(":")
 
-        # Step 1: Find opcode (5 bits)
-        opcode = "00000"                                    # default opcode
-
-        if inst[0] == "DEF":                                # def treated as Mov to preserve DEF in metadata
+    @staticmethod
+    def labels(program, start):
+        """First pass: label name -> address of the instruction word that follows it"""
+        labels = {}
+        pc = start
+        for inst in program:
+            if inst[0].endswith(":"):
+                labels[inst[0][:-1]] = pc
+            elif Instruction.isWord(inst):
+                pc += 1
+        return labels
 
-            # Find MOV opcode
-            for i, group in enumerate(operations):   
-                if "MOV" in group:
-                    opcode = operationCodes[0][i] + operationCodes[1][group.index("MOV")]
-                    break
-        else:
+    @staticmethod
+    def encode(inst, machine=None, labels=None):            # Encode a single instruction into a 32-bit word (int)
+        # Word layout, most significant bit first:
+        # opcode (5) | op1 mode (3) | op1 addr (8) | op2 mode (3) | op2 addr (8) | unused (5)
+        # Conditional jumps (Jcc target, a, b) keep register b in the unused bits (R0 if omitted).
 
-            # Normal opcode lookup for other instructions
-            for i, group in enumerate(operations):
-                if inst[0] in group:
+        if inst[0] == "FUNC":                               # FUNC treated same as EOP (end of program)
+            return opcodes["EOP"] << 27                     # not 0: the all-zero word is PRNT R0
 
-                    # group code = 2 bits, instruction code = 3 bits
-                    opcode = operationCodes[0][i] + operationCodes[1][group.index(inst[0])]
-                    break
+        # Step 1: Find opcode (5 bits); 0 is PRNT, so an unknown mnemonic is an error
+        if inst[0] not in opcodes:
+            raise ValueError(f"unknown mnemonic {inst[0]}")
+        opcode = opcodes[inst[0]]
 
         # Initialize operand modes and addresses 
-        op1_mode, op1_addr = "000", "00000000"
-        op2_mode, op2_addr = "000", "00000000"
+        op1_mode, op1_addr = 0b000, 0
+        op2_mode, op2_addr = 0b000, 0
 
         # Encode operands if present
         if len(inst) > 1:
-            op1_mode, op1_addr = Instruction.encodeOp(inst[1])
+            op1_mode, op1_addr = Instruction.encodeOp(inst[1], machine, labels)
         if len(inst) > 2:
-            op2_mode, op2_addr = Instruction.encodeOp(inst[2])
-
-        # Compose 32-bit instruction binary string
-        inst_code = opcode + op1_mode + op1_addr + op2_mode + op2_addr + "00000"  # total should be 32 bits
-
-        # Ensure inst_code is exactly 32 bits
-        inst_code = Length.addZeros(inst_code, 32)
-
-        return inst_code
+            op2_mode, op2_addr = Instruction.encodeOp(inst[2], machine, labels)
+        compared = 0
+        if inst[0] in conditions and len(inst) > 3:
+            if Instruction.encodeOp(inst[3], machine)[0] != 0b000 or int(inst[3][1:]) >= 32:
+                raise ValueError(f"{inst[0]} compares with a register R0-R31, got {inst[3]}")
+            compared = int(inst[3][1:])
+
+        # Compose the 32-bit word; operand values and addresses must fit their 8-bit fields
+        addr_mask = (1 << Length.opAddr) - 1
+        for operand, addr in ((inst[1:2], op1_addr), (inst[2:3], op2_addr)):
+            if not 0 <= addr <= addr_mask:
+                raise ValueError(f"{inst[0]} operand {operand[0]} is {addr}, outside the {Length.opAddr}-bit operand field (0-{addr_mask})")
+        return (opcode << 27 | op1_mode << 24 | (op1_addr & addr_mask) << 16
+                | op2_mode << 13 | (op2_addr & addr_mask) << 5 | compared)
 
     @staticmethod
-    def encodeOp(operand):
+    def encodeOp(operand, machine=None, labels=None):
         """
         Addressing Modes:
         000 - Register Direct     (e.g., R1)
@@ -98,101 +143,106 @@ class Instruction:
         101 - Stack Push         (PUSH)
         110 - Stack Pop          (POP)
         111 - Auto Inc/Dec       (R1+, -R1)
+
+        A name in `labels` (see Instruction.labels) is the immediate address it labels.
+        Returns (mode, addr) as ints.
         """
+        machine = machine or storage.machine
         if not operand:
-            return ("000", "00000000")
+            return (0b000, 0)
 
         if isinstance(operand, str):
             # Autoincrement mode (e.g. "R1+")
             if operand.endswith("+") and operand[:-1].startswith("R") and operand[1:-1].isdigit():
-                reg_num_bin = Length.addZeros(bin(int(operand[1:-1]))[2:], 8)
-                return ("111", reg_num_bin)
+                return (0b111, int(operand[1:-1]))
 
             # Autodecrement mode (e.g. "-R1")
             elif operand.startswith("-R") and operand[2:].isdigit():
-                reg_num_bin = Length.addZeros(bin(int(operand[2:]))[2:], 8)
-                return ("111", reg_num_bin)
+                return (0b111, int(operand[2:]))
 
             # Immediate value (e.g. "#5")
             if operand.startswith("#"):
                 try:
                     value = int(operand[1:])
-                    value_bin = Length.addZeros(bin(value)[2:], 8)
-                    return ("100", value_bin)
+                    return (0b100, value)
                 except ValueError:
-                    return ("100", "00000000")
+                    return (0b100, 0)
 
             # Register direct mode (e.g. "R1")
             if operand.startswith("R") and operand[1:].isdigit():
-                reg_num_bin = Length.addZeros(bin(int(operand[1:]))[2:], 8)
-                return ("000", reg_num_bin)
+                return (0b000, int(operand[1:]))
 
             # Register indirect mode (e.g. "*R1")
             elif operand.startswith("*R") and operand[2:].isdigit():
-                reg_num_bin = Length.addZeros(bin(int(operand[2:]))[2:], 8)
-                return ("001", reg_num_bin)
+                return (0b001, int(operand[2:]))
 
             # Stack operations
             elif operand == "PUSH":
-                return ("101", "00000000")
+                return (0b101, 0)
             elif operand == "POP":
-                return ("110", "00000000")
+                return (0b110, 0)
 
             # Try to convert string to number for immediate value
             elif operand.isdigit():
                 value = int(operand)
-                value_bin = Length.addZeros(bin(value)[2:], 8)
-                return ("100", value_bin)
+                return (0b100, value)
 
             # Indirect mode variable (e.g. "*var")
             elif operand.startswith("*") and not operand.startswith("*R"):
                 try:
-                    addr = storage.variable.load(operand[1:])
-                    addr_bin = Length.addZeros(bin(int(addr))[2:], 8) if addr is not None else "00000000"
-                    return ("011", addr_bin)
+                    addr = machine.variable.load(operand[1:])
+                    return (0b011, int(addr) if addr is not None else 0)
                 except KeyError:
-                    return ("011", "00000000")  # Default to zero address if variable not found
+                    return (0b011, 0)  # Default to zero address if variable not found
+
+            # Label: its address as a constant (jump and CALL targets)
+            elif labels and operand in labels:
+                if labels[operand] >= 1 << Length.opAddr:
+                    raise ValueError(f"label {operand} is at {labels[operand]}, past the {Length.opAddr}-bit operand field")
+                return (0b100, labels[operand])
 
             # Direct addressing mode (variable name)
             else:
                 try:
-                    addr = storage.variable.load(operand)
-                    addr_bin = Length.addZeros(bin(int(addr))[2:], 8) if addr is not None else "00000000"
-                    return ("010", addr_bin)
+                    addr = machine.variable.load(operand)
+                    return (0b010, int(addr) if addr is not None else 0)
                 except KeyError:
                     # For undefined variables (like in DEF instructions), use address 0
-                    return ("010", "00000000")
+                    return (0b010, 0)
 
         # Indexed addressing mode (base and offset)
         elif isinstance(operand, list) and len(operand) == 2:
             try:
-                base_addr = storage.variable.load(operand[0])
+                base_addr = machine.variable.load(operand[0])
                 base_int = int(base_addr) if base_addr is not None else 0
                 offset = int(operand[1])
                 combined = base_int + offset
-                combined_bin = Length.addZeros(bin(combined)[2:], 8)
-                return ("100", combined_bin)
+                return (0b100, combined)
             except KeyError:
-                return ("100", "00000000")  # zero as default if var is not found
+                return (0b100, 0)  # zero as default if var is not found
 
-        return ("000", "00000000")          # Default mode
+        return (0b000, 0)          # Default mode
         # add print statement here about unrecognized
 
     @staticmethod
-    def encodeProgram(program):
-        pc = int(storage.register.load("PC"))
+    def encodeProgram(program, machine=None, tracer=None):
+        machine = machine or storage.machine
+        tracer = tracer or tracing.default
+        pc = int(machine.register.load("PC"))
         encoded_program = Instruction.preEncode(program)
+        labels = Instruction.labels(encoded_program, pc)
 
-        print("[INFO] Encoding program instructions...")
+        tracer.info("encode_start")
         for inst in encoded_program:
-            if inst[0] in ["DEF", "DEB"]:
-                print(f"[DEBUG] Skipping {inst[0]} instruction")
+            if not Instruction.isWord(inst):
+                tracer.debug("encode_skip", inst[0])
                 continue
             
-            bin_code = Instruction.encode(inst)
-            print(f"[DEBUG] Encoded {inst[0]}: {bin_code}")
-            storage.memory.store(pc, bin_code)
+            word = Instruction.encode(inst, machine, labels)
+            tracer.debug("encoded", inst[0], word)
+            machine.memory.storeInstruction(pc, word)
             pc = int(pc + 1)
 
-        storage.register.store("PC", int(pc))
-        print("[INFO] Program encoding complete")
+        machine.register.store("PC", int(pc))
+        machine.programEnd = max(machine.programEnd, pc)
+        tracer.info("encode_done")
@@ -1,5 +1,17 @@
 import math
 
+np = None	# numpy, imported by numpy() on the first bulk conversion
+
+def numpy():
+	"""Import numpy on first use (it is slow to load); False when it is not installed"""
+	global np
+	if np is None:
+		try:
+			import numpy as np
+		except ImportError:	# bulk conversions fall back to plain Python loops
+			np = False
+	return np
+
 class Length:
 	whole = 8
 	precision = 32	#length of precision
@@ -51,9 +63,9 @@ class Precision:
 		e = int(binum[1:binlen+1],2)
 		f = BinaryFraction.ibin2dec(binum[binlen+1:])
 		return Length.trimDec((-1)**s*2**(e-de)*(1+f))
-	def dec2spbin(decnum,binlen=Length.whole):
+	def dec2spbin(decnum,binlen=Length.whole,fraclen=Length.fraction):
 		if decnum==0:
-			return "0"+"0"*binlen+"0"*(Length.fraction)
+			return "0"+"0"*binlen+"0"*(fraclen)
 		de = 2**(binlen-1)-1
 		s = 0
 		if decnum<0:
@@ -62,7 +74,7 @@ class Precision:
 		e = str(bin(p+de))[2:]
 		lead = "0"*(binlen-len(e))
 		e = lead+e
-		f = BinaryFraction.idec2bin(abs(decnum)/(2**p)-1)
+		f = BinaryFraction.idec2bin(abs(decnum)/(2**p)-1,fraclen)
 		return str(s)+str(e)+str(f)
 	def spbin2bin(bin_str,binlen):
 		result = Precision.spbin2dec(bin_str)
@@ -72,37 +84,63 @@ class Precision:
 		result = int(bin_str,2)
 		result = Precision.dec2spbin(result)
 		return result
-
-find_fake = False
-if find_fake:
-	fake_cntr = 0
-	dec = 2
-	max_e = 16
-	max_num = 2**max_e
-	too_much_fake = max_num
-	total_num = max_num*10**dec
-	print_cmp = True
-	print_errors = True
-	print_innerrors = False
-	round_fake = False
-	for i in range(max_num):
-		for j in range(10**dec):
-			k = round(i+j*1.0/(10**dec),dec)
-			fake_k = Precision.spbin2dec(Precision.dec2spbin(k))
-			if round_fake:
-				fake_k = round(fake_k,dec)
-			if k!=fake_k:
-				if print_cmp:
-					print(f"{k} {fake_k}")
-				fake_cntr += 1
-		if too_much_fake<=fake_cntr:
-			break
-		if print_innerrors:
-			fake_pcnt = fake_cntr/total_num
-			print(f"From 0 to {max_num}, for {dec} decimal places:")
-			print(str(fake_cntr)+" errors out of "+str(total_num)+" ("+str(round(fake_pcnt*100,int(max_e/5)))+"%)")
-	if print_errors:
-		fake_pcnt = fake_cntr/total_num
-		print(f"From 0 to {max_num}, for {dec} decimal places:")
-		print(str(fake_cntr)+" errors out of "+str(total_num)+" ("+str(round(fake_pcnt*100,int(max_e/5)))+"%)")
-
+	# bulk conversions: whole arrays of decimals <-> packed integer words
+	# (sign | exponent | fraction), bit-identical to dec2spbin/spbin2dec for 0 and |x|>=1.
+	# For 0<|x|<1 dec2spbin writes a negative fraction field (a "-" in the string) that has
+	# no packed form, so those values get the normalized encoding instead; they still
+	# decode to the same trimmed decimal.
+	def dec2spword(decnums,binlen=Length.whole,fraclen=Length.fraction):
+		de = 2**(binlen-1)-1
+		if not numpy():
+			words = []
+			for decnum in decnums:
+				if decnum==0:
+					words.append(0)
+					continue
+				m,e = math.frexp(abs(decnum))
+				f = int((m*2-1)*2**fraclen)
+				words.append((decnum<0)<<(binlen+fraclen) | (e-1+de)<<fraclen | f)
+			return words
+		x = np.asarray(decnums,dtype=np.float64)
+		m,e = np.frexp(np.abs(x))
+		f = np.floor((m*2-1)*2.**fraclen).astype(np.uint64)
+		e = (e.astype(np.int64)-1+de).astype(np.uint64)
+		s = (x<0).astype(np.uint64)
+		words = s<<np.uint64(binlen+fraclen) | e<<np.uint64(fraclen) | f
+		words[x==0] = 0
+		return words.astype(Precision.wordType(binlen,fraclen))
+	def spword2dec(words,binlen=Length.whole,fraclen=Length.fraction,places=Length.dec_place):
+		de = 2**(binlen-1)-1
+		if not numpy():
+			decnums = []
+			for w in words:
+				s = w>>(binlen+fraclen)&1
+				e = w>>fraclen&(2**binlen-1)
+				f = (w&(2**fraclen-1))/2.**fraclen
+				decnums.append(round((-1)**s*2**(e-de)*(1+f),places))
+			return decnums
+		w = np.asarray(words).astype(np.uint64)
+		s = (w>>np.uint64(binlen+fraclen))&np.uint64(1)
+		e = ((w>>np.uint64(fraclen))&np.uint64(2**binlen-1)).astype(np.int64)
+		f = (w&np.uint64(2**fraclen-1)).astype(np.float64)/2.**fraclen
+		return np.round(np.where(s==1,-1.,1.)*np.ldexp(1+f,e-de),places)
+	def spword2spbin(words,binlen=Length.whole,fraclen=Length.fraction):
+		width = 1+binlen+fraclen
+		if not numpy():
+			return [Length.addZeros(int(w),width) for w in words]
+		w = np.asarray(words).astype(np.uint64)
+		shifts = np.arange(width-1,-1,-1,dtype=np.uint64)
+		bits = ((w[:,None]>>shifts)&np.uint64(1)).astype(np.uint8)+ord("0")
+		text = bits.tobytes().decode("ascii")
+		return [text[i:i+width] for i in range(0,len(text),width)]
+	def spbin2spword(binums,binlen=Length.whole,fraclen=Length.fraction):
+		width = 1+binlen+fraclen
+		if not numpy():
+			return [int(b,2) for b in binums]
+		if len(binums)==0:
+			return np.zeros(0,dtype=Precision.wordType(binlen,fraclen))
+		bits = np.frombuffer("".join(binums).encode("ascii"),dtype=np.uint8).reshape(-1,width)-ord("0")
+		weights = np.uint64(1)<<np.arange(width-1,-1,-1,dtype=np.uint64)
+		return (bits.astype(np.uint64)*weights).sum(axis=1,dtype=np.uint64).astype(Precision.wordType(binlen,fraclen))
+	def wordType(binlen=Length.whole,fraclen=Length.fraction):
+		return np.uint32 if 1+binlen+fraclen<=32 else np.uint64
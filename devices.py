@@ -0,0 +1,131 @@
+# devices.py - Buffered I/O channels behind PRNT and SCAN
+#
+# Every storage.Machine has an output channel (machine.output) and an input channel
+# (machine.input). PRNT appends its operand's value to the output buffer, which goes to
+# the sink in one write per `capacity` values and whenever the program ends, so an
+# output-heavy program does not pay for a console write per value. SCAN takes the next
+# value from the input channel and stores it to its operand.
+#
+# An input channel is fed up front (InputChannel([1, 2, 3])), with feed() while the
+# program runs, or from an asyncio stream (pump(reader): whitespace-separated numbers
+# until EOF). A closed channel with nothing left reads 0. An open one that is empty
+# raises Blocked: Program.step then stops at the SCAN, scheduler.Scheduler parks the VM
+# until feed() or close() wakes it, and Program.run, which cannot wait, stops there.
+#
+#   machine.output = OutputChannel(MemorySink())    # machine.output.sink.values
+#   machine.input = InputChannel(closed=False)
+#   asyncio.create_task(machine.input.pump(reader))
+
+import sys
+from collections import deque
+
+BUFFER = 256            # values an output channel holds before it writes them out
+
+
+class Blocked(Exception):
+    # SCAN found an open input channel empty
+    def __init__(self, channel):
+        super().__init__("waiting for input")
+        self.channel = channel
+
+
+class StreamSink:
+    # Writes each batch as one line per value to a text stream (default: the current sys.stdout)
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def write(self, values):
+        (self.stream or sys.stdout).write("".join(f"{value}\n" for value in values))
+
+    def close(self):
+        pass
+
+
+class FileSink(StreamSink):
+    # Appends to a file, one line per value
+    def __init__(self, path, mode="a"):
+        super().__init__(open(path, mode))
+
+    def close(self):
+        self.stream.close()
+
+
+class MemorySink:
+    # Keeps every value in a list
+    def __init__(self):
+        self.values = []
+
+    def write(self, values):
+        self.values.extend(values)
+
+    def close(self):
+        pass
+
+
+class OutputChannel:
+    def __init__(self, sink=None, capacity=BUFFER):
+        self.sink = sink or StreamSink()
+        self.capacity = capacity
+        self.buffer = []
+
+    def write(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.sink.write(self.buffer)
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+
+class InputChannel:
+    def __init__(self, values=(), closed=True):
+        self.values = deque(values)
+        self.closed = closed        # no more values will come: an empty channel reads 0
+        self.listeners = []         # called once on the next feed() or close()
+
+    def read(self):
+        if self.values:
+            return self.values.popleft()
+        if self.closed:
+            return 0
+        raise Blocked(self)
+
+    def ready(self):
+        return bool(self.values) or self.closed
+
+    def listen(self, callback):
+        self.listeners.append(callback)
+
+    def wake(self):
+        listeners, self.listeners = self.listeners, []
+        for callback in listeners:
+            callback()
+
+    def feed(self, *values):
+        self.values.extend(values)
+        self.wake()
+
+    def close(self):
+        self.closed = True
+        self.wake()
+
+    async def wait(self):
+        """Return once read() will not block"""
+        if not self.ready():
+            import asyncio      # only async drivers need it; it is slow to import
+            future = asyncio.get_running_loop().create_future()
+            self.listen(lambda: future.done() or future.set_result(None))
+            await future
+
+    async def pump(self, reader):
+        """Feed the numbers read from an asyncio.StreamReader, then close the channel at EOF"""
+        self.closed = False
+        while line := await reader.readline():
+            self.feed(*[float(token) for token in line.split()])
+        self.close()
@@ -0,0 +1,134 @@
+# image.py - Compiled program images cached on disk
+#
+# An image is the result of assembling one program: the packed 32-bit instruction
+# words and the symbol table. Assembly writes nothing else, so data memory is not part
+# of it: a cache hit leaves the data the machine already holds alone. Images are stored under a
+# cache directory as <key>.img, where the key hashes the program source, the ISA
+# tables in compiler.py, the symbol table the program is assembled against, the
+# machine layout (instruction region, which assembly starts at, and the memory and
+# register sizes) and whether the peephole pass ran, so a change to any of them simply
+# misses the cache.
+# Program looks the image up before parsing, so a hit skips preEncode and the peephole
+# pass; the image keeps the pass's change list for Program.changes.
+#
+# File layout (little endian):
+#   header   magic "ISKI", version, start address, PC after assembly,
+#            word count, symbol count
+#   words    word count x uint32
+#   symbols  symbol count x (name length uint16, utf-8 name, address double)
+#   changes  uint32 length, utf-8 JSON list of the peephole changes
+
+import hashlib
+import json
+import os
+import struct
+from array import array
+
+import compiler
+
+MAGIC = b"ISKI"
+VERSION = 4
+HEADER = struct.Struct("<4sHIIII")
+SYMBOL = struct.Struct("<H")
+LENGTH = struct.Struct("<I")
+
+
+class Image:
+    def __init__(self, start, pc, words, symbols, changes=()):
+        self.start = start          # address of the first instruction word
+        self.pc = pc                # PC register value after assembly
+        self.words = words          # array('I') of instruction words
+        self.symbols = symbols      # [(name, address)] symbol table
+        self.changes = list(changes)  # peephole.Optimizer.changes of the assembly
+
+    @staticmethod
+    def key(source, machine, optimize=False):
+        digest = hashlib.sha256()
+        digest.update(f"{VERSION}\n".encode())
+        if optimize:
+            digest.update(b"peephole\n")
+        digest.update(repr(compiler.operations).encode())
+        digest.update(repr(compiler.operationCodes).encode())
+        digest.update(repr(sorted(machine.variable.data.items())).encode())
+        # Program assembles from codeBase, so the region also fixes the start PC
+        digest.update(repr((machine.codeBase, machine.codeEnd, machine.memLen, machine.regLen)).encode())
+        digest.update("\n".join(source).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def capture(machine, start, changes=()):
+        # Build an image from a machine that has just been assembled into
+        pc = int(machine.register.load("PC"))
+        words = array("I", [machine.memory.loadInstruction(address) for address in range(start, pc)])
+        symbols = [(name, machine.variable.load(name)) for name in machine.variable.data]
+        return Image(start, pc, words, symbols, changes)
+
+    def apply(self, machine):
+        for offset, word in enumerate(self.words):
+            machine.memory.storeInstruction(self.start + offset, word)
+        for name, address in self.symbols:
+            machine.variable.store(name, address)
+        machine.register.store("PC", self.pc)
+        machine.programEnd = max(machine.programEnd, self.pc)
+
+    def save(self, path):
+        # Write to a temporary file first so concurrent workers never read a partial image
+        parts = [HEADER.pack(MAGIC, VERSION, self.start, self.pc, len(self.words), len(self.symbols)),
+                 self.words.tobytes()]
+        for name, address in self.symbols:
+            encoded = name.encode()
+            parts.append(SYMBOL.pack(len(encoded)) + encoded + struct.pack("<d", address))
+        changes = json.dumps(self.changes).encode()
+        parts.append(LENGTH.pack(len(changes)) + changes)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(parts))
+        os.replace(tmp, path)
+
+    @staticmethod
+    def read(path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        magic, version, start, pc, nwords, nsymbols = HEADER.unpack_from(raw)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} program image")
+        offset = HEADER.size
+        words = array("I")
+        words.frombytes(raw[offset:offset + 4 * nwords])
+        offset += 4 * nwords
+        symbols = []
+        for _ in range(nsymbols):
+            (length,) = SYMBOL.unpack_from(raw, offset)
+            offset += SYMBOL.size
+            name = raw[offset:offset + length].decode()
+            offset += length
+            (address,) = struct.unpack_from("<d", raw, offset)
+            offset += 8
+            symbols.append((name, address))
+        (length,) = LENGTH.unpack_from(raw, offset)
+        offset += LENGTH.size
+        changes = [tuple(change) for change in json.loads(raw[offset:offset + length])]
+        return Image(start, pc, words, symbols, changes)
+
+
+def path(cache, source, machine, optimize=False):
+    # Where the image of `source` assembled into `machine` lives (taken before assembling)
+    return os.path.join(cache, Image.key(source, machine, optimize) + ".img")
+
+
+def load(path, machine):
+    # Apply the cached image at `path` to the machine; returns it, or None on a miss
+    if not os.path.exists(path):
+        return None
+    cached = Image.read(path)
+    cached.apply(machine)
+    return cached
+
+
+def assemble(path, program, machine, tracer, changes=()):
+    # Assemble `program` (pre-encoded, peephole-optimized if it was) into the machine
+    # and cache the result at `path`
+    start = int(machine.register.load("PC"))
+    compiler.Instruction.encodeProgram(program, machine, tracer)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    Image.capture(machine, start, changes).save(path)
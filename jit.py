@@ -0,0 +1,266 @@
+# jit.py - Basic-block translator for Program.run
+#
+# Instruction memory is split into basic blocks: a block starts at a leader (the
+# first instruction, a constant jump or CALL target, the instruction after a jump,
+# CALL or RET) or wherever the interpreter enters it, and runs up to the next leader,
+# a JMP, a conditional jump or an EOP. A conditional jump ends the block with both exits:
+# the block returns the taken target or the next PC, so a counted loop (body plus
+# SUB/Jcc) runs compiled; when the taken target is the block's own entry, the block
+# repeats itself up to SPIN times before returning to the dispatcher. A block is called
+# with the instruction budget left and returns (next pc or None at EOP, instructions
+# run), so a budget (Program.step, scheduler.VM) counts every instruction of every
+# repeat, and a repeating block never runs past it. Once an entry PC has been reached
+# `threshold` times, the block starting there is turned into Python source, compiled
+# once with compile(), and called directly from then on. CALL and RET are left to the
+# interpreter.
+#
+# Register and memory slots are read and written in the block itself: on a
+# NativeStorage the doubles in its values array, on a Storage the 32-bit strings in
+# its data dict (through the memoized spbin2dec/dec2spbin). Each block is also
+# compiled a second time with every access going through get/put; the inlined one
+# falls back to it while a snapshot journal is recording (the writes have to be
+# remembered) or when one of its NativeStorage slots holds a string. PagedStorage
+# memory always goes through get/put.
+#
+# Only instructions whose operands cannot fail are translated: register direct
+# (R0-R31), direct memory and immediate operands, and no direct writes into the
+# instruction region. A block stops in front of anything else and the interpreter runs
+# that instruction. Every write into instruction memory bumps Storage.codeVersion;
+# after that, a block is only reused if the words it was built from are unchanged.
+#
+#   program.run(jit.Translator(program.machine))
+
+import storage
+from compiler import arithmetic, conditions, opcodes, opnames
+from run import Program
+
+HOT = 2
+SPIN = 1000             # iterations a block jumping back to its own entry runs per call
+
+JUMPS = tuple(opcodes[name] for name in ("JMP", "CALL", "RET") + tuple(conditions))
+
+# operators written into the block (the same operations as compiler.arithmetic / conditions)
+OPERATOR = {"ADD": "+", "SUB": "-", "MUL": "*", "DIV": "/", "MOD": "%"}
+COMPARE = {"JEQ": "==", "JNE": "!=", "JLT": "<", "JLE": "<=", "JGT": ">", "JGE": ">="}
+
+class Translator:
+    def __init__(self, machine, threshold=HOT):
+        self.machine = machine
+        self.threshold = threshold
+        self.blocks = {}        # entry pc -> [block or None, words it was built from, codeVersion checked]
+        self.counts = {}        # entry pc -> times reached before translation
+        self.leaders = None
+        self.data = (machine.register.data, machine.memory.data)    # the dicts compiled blocks index
+
+    def enter(self, pc):
+        # Compiled block for pc, or None while it is still cold (or untranslatable)
+        memory = self.machine.memory
+        if memory.data is not self.data[1] or self.machine.register.data is not self.data[0]:
+            # reinstate() replaced a data dict the blocks hold on to
+            self.blocks.clear()
+            self.data = (self.machine.register.data, memory.data)
+        entry = self.blocks.get(pc)
+        if entry is not None:
+            if entry[2] == memory.codeVersion:
+                return entry[0]
+            if self.words(pc, len(entry[1])) == entry[1]:
+                entry[2] = memory.codeVersion
+                return entry[0]
+            # instruction memory under the block changed: leaders may have moved too
+            del self.blocks[pc]
+            self.leaders = None
+        count = self.counts.get(pc, 0) + 1
+        self.counts[pc] = count
+        if count < self.threshold:
+            return None
+        block, length = self.translate(pc)
+        self.blocks[pc] = [block, self.words(pc, length), memory.codeVersion]
+        return block
+
+    def words(self, pc, length):
+        memory = self.machine.memory
+        return memory.code[pc - memory.codeBase:pc - memory.codeBase + length]
+
+    def findLeaders(self):
+        memory = self.machine.memory
+        leaders = {self.machine.codeBase}
+        for pc in range(self.machine.codeBase, self.machine.codeEnd):
+            word, opid, op1, op2, _ = Program.decode(memory.loadInstruction(pc))
+            if opid in JUMPS:
+                leaders.add(pc + 1)
+                if op1[0] == 0b100:  # constant target
+                    leaders.add(op1[1])
+        return leaders
+
+    def readable(self, operand):
+        mode, addr = operand
+        return (mode == 0b000 and addr < self.machine.regLen
+                or mode == 0b010 and addr < self.machine.memLen
+                or mode in (0b100, 0b111))
+
+    def writable(self, operand):
+        mode, addr = operand
+        return (mode == 0b000 and addr < self.machine.regLen
+                or mode == 0b010 and addr < self.machine.memLen and not self.machine.memory.inCode(addr)
+                or mode in (0b100, 0b110, 0b111))
+
+    def slot(self, operand, slots):
+        # (prefix, storage kind) of a register ("r") or memory ("m") operand; the kind is
+        # "native" or "string" when the block indexes the slot itself (slots collects it
+        # for the guard), None when it goes through get/put
+        mode, addr = operand
+        prefix = "r" if mode == 0b000 else "m"
+        part = self.machine.register if mode == 0b000 else self.machine.memory
+        if slots is None or part.inCode(addr):
+            return prefix, None
+        if type(part) is storage.NativeStorage and addr < part.size:
+            slots[prefix].add(addr)
+            return prefix, "native"
+        if type(part) is storage.Storage:
+            slots[prefix].add(addr)
+            return prefix, "string"
+        return prefix, None
+
+    def read(self, operand, slots=None):
+        mode, addr = operand
+        if mode in (0b000, 0b010):
+            prefix, kind = self.slot(operand, slots)
+            if kind == "native":
+                return f"int({prefix}v[{addr}])"
+            if kind == "string":
+                return f"int(spbin2dec({prefix}d[{addr}]))"
+            return f"int({prefix}load({addr}))"
+        if mode == 0b100:
+            return str(addr)
+        return "0"
+
+    def write(self, operand, value, slots=None):
+        # value is an int expression (see read) or "result", which may be a float
+        mode, addr = operand
+        if value == "result":
+            value = "int(result)"
+        if mode in (0b000, 0b010):
+            prefix, kind = self.slot(operand, slots)
+            if kind == "native":
+                return [f"{prefix}v[{addr}] = {value}"]
+            if kind == "string":
+                return [f"{prefix}d[{addr}] = dec2spbin({value})"]
+            return [f"{prefix}store({addr}, {value})"]
+        return []
+
+    def source(self, pc, slots=None):
+        # (body lines of the block entered at pc, number of instruction words it covers,
+        # whether it repeats); the lines are None when the first instruction cannot be
+        # translated. slots: {"r": set(), "m": set()} to index the storages directly,
+        # None for get/put
+        if self.leaders is None:
+            self.leaders = self.findLeaders()
+        lines = []
+        entry = pc
+        spin = False            # the block jumps back to its entry
+        while pc < self.machine.codeEnd:
+            word = self.machine.memory.loadInstruction(pc)
+            if not word:
+                break   # PRNT R0 or the end of the program: left to the interpreter
+            word, opid, op1, op2, compared = Program.decode(word)
+            name = opnames[opid]
+            handler = Program.handlers[opid]
+            comment = f"    # {pc}: {name} {op1} {op2}"
+            length = pc + 1 - entry     # instructions run when the block leaves at this word
+            if handler is None or handler is Program.execNext:
+                lines.append(comment + " (skipped)")
+            elif name == "MOV" and self.readable(op2) and self.writable(op1):
+                lines.append(comment)
+                lines += ["    " + line for line in self.write(op1, self.read(op2, slots), slots)]
+            elif name in arithmetic and self.readable(op1) and self.readable(op2) and self.writable(op1):
+                lines.append(comment)
+                lines.append(f"    a = {self.read(op1, slots)}")
+                lines.append(f"    b = {self.read(op2, slots)}")
+                if name in ("DIV", "MOD"):
+                    lines.append(f"    result = a {OPERATOR[name]} b if b != 0 else 0")
+                else:
+                    lines.append(f"    result = a {OPERATOR[name]} b")
+                lines += ["    " + line for line in self.write(op1, "result", slots)]
+            elif name == "JMP" and self.readable(op1):
+                lines.append(comment)
+                lines.append(f"    target = {self.read(op1, slots)}")
+                lines.append(f"    if {self.machine.codeBase} <= target < {self.machine.codeEnd}:")
+                lines.append(f"        return target, {length}")
+                pc += 1
+                break
+            elif name in conditions and self.readable(op1) and self.readable(op2) and compared < self.machine.regLen:
+                # exits the block: taken target when it is inside the instruction region, else pc + 1
+                lines.append(comment)
+                test = f"{self.read(op2, slots)} {COMPARE[name]} {self.read((0b000, compared), slots)}"
+                if op1 == (0b100, entry):
+                    spin = True
+                    lines.append(f"    if {test}:")
+                    lines.append(f"        continue")
+                else:
+                    lines.append(f"    target = {self.read(op1, slots)}")
+                    lines.append(f"    if {test} and {self.machine.codeBase} <= target < {self.machine.codeEnd}:")
+                    lines.append(f"        return target, {length}")
+                pc += 1
+                break
+            elif name == "EOP":
+                # dispatch leaves the PC register alone when a block ends the program
+                lines.append(comment)
+                lines.append(f"    rs.put(\"PC\", {pc})")
+                lines.append(f"    return None, {length}")
+                return lines, length, False
+            else:
+                break  # left to the interpreter
+            pc += 1
+            if pc in self.leaders:
+                break
+        if pc == entry:
+            return None, 1, False
+        lines.append(f"    return {pc}, {'done + ' if spin else ''}{pc - entry}")
+        return lines, pc - entry, spin
+
+    def wrap(self, name, entry, lines, length, spin, guard=None):
+        # guard: condition under which the inlined block hands over to its get/put twin
+        head = [f"def {name}(budget):"]
+        if guard:
+            head += [f"    if {guard}:", f"        return {name}_safe(budget)"]
+        if spin:
+            # whole repeats that fit the budget; dispatch only calls the block when one does
+            head += [f"    runs = {SPIN} if budget < 0 else min({SPIN}, budget // {length})",
+                     f"    for done in range(0, runs * {length}, {length}):"]
+            lines = ["    " + line for line in lines] + [f"    return {entry}, runs * {length}"]
+        return "\n".join(head + lines)
+
+    def guard(self, slots):
+        # the inlined accesses are only valid while no journal records writes and no
+        # indexed NativeStorage slot is shadowed by a string in its data dict
+        machine = self.machine
+        terms = []
+        for prefix, part in (("r", machine.register), ("m", machine.memory)):
+            if slots[prefix]:
+                terms.append(f"{prefix}s.journal is not None")
+                if type(part) is storage.NativeStorage:
+                    terms += [f"{addr} in {prefix}d" for addr in sorted(slots[prefix])]
+        return " or ".join(terms)
+
+    def translate(self, pc):
+        # (compiled block or None, number of instruction words it covers); the block
+        # takes the budget left (-1: none) and returns (next pc or None, instructions run)
+        slots = {"r": set(), "m": set()}
+        lines, length, spin = self.source(pc, slots)
+        if lines is None:
+            return None, length
+        name = f"block_{pc}"
+        guard = self.guard(slots)
+        text = self.wrap(name, pc, lines, length, spin, guard)
+        if guard:
+            safe, _, _ = self.source(pc)
+            text += "\n\n" + self.wrap(name + "_safe", pc, safe, length, spin)
+        memory, register = self.machine.memory, self.machine.register
+        scope = {"rs": register, "ms": memory, "rd": register.data, "md": memory.data,
+                 "rv": getattr(register, "values", None), "mv": getattr(memory, "values", None),
+                 "rload": register.get, "rstore": register.put, "mload": memory.get, "mstore": memory.put,
+                 "spbin2dec": storage.spbin2dec, "dec2spbin": storage.dec2spbin}
+        exec(compile(text, f"<block {pc}>", "exec"), scope)
+        block = scope[name]
+        block.length = length
+        return block, length
@@ -0,0 +1,262 @@
+# lanes.py - Runs one assembled program over many initial states at once (NumPy)
+#
+# Every lane is one run of the program: registers R0..regLen-1, data memory
+# 0..memLen-1 and the SPR/PC registers are NumPy arrays with one row (or entry)
+# per lane, and MOV, ADD/SUB/MUL/DIV/MOD, PUSH, POP, JMP, the conditional jumps, CALL
+# and RET execute on all lanes
+# standing at the same PC with one array operation per operand. Lanes that jump
+# apart are masked: each step runs the lowest PC any running lane is at, for just
+# the lanes that are there, so they meet again where their paths join.
+#
+# Values follow NativeStorage: doubles, truncated to integers on every read and
+# write like Program.getOp / Program.write. The instruction region is shared, so a
+# lane that writes into it, writes outside 0..memLen-1 or 0..regLen-1, or reaches an
+# opcode this engine does not vectorize is finished by the scalar interpreter from its
+# initial state instead (Lanes.fallback); so does one whose stack pointer would leave
+# the stack region (storage.Stack raises there). Division or modulo by zero gives 0, as in
+# Program.execArithmetic, and sets the lane's divByZero flag. PRNT and SCAN always fall
+# back; those lanes share the machine's I/O channels (devices.py), one lane after another.
+#
+#   program = Program(source, storage.Machine(native=True))
+#   lanes = Lanes(program, 10000)
+#   lanes.registers[:, 1] = numpy.arange(10000)     # R1 = lane number
+#   lanes.run()                                     # lanes.registers, .memory, .divByZero
+
+try:
+    import numpy as np
+except ImportError:     # the engine needs NumPy; the rest of the VM does not
+    np = None
+
+from compiler import arithmetic, conditions, opnames
+from run import Program
+
+LIMIT = 1_000_000       # instructions per lane before it is stopped (backward JMPs never end)
+
+
+class Lanes:
+    def __init__(self, program, count, limit=LIMIT):
+        # Every lane starts from the state of program.machine (code already loaded)
+        if np is None:
+            raise ImportError("lanes.Lanes needs NumPy")
+        self.program = program
+        self.machine = machine = program.machine
+        self.count = count
+        self.limit = limit
+        register, memory = machine.register, machine.memory
+        self.registers = np.tile(np.array([self.cell(register, k) for k in range(machine.regLen)]), (count, 1))
+        self.memory = np.tile(np.array([self.cell(memory, k) for k in range(machine.memLen)]), (count, 1))
+        self.spr = np.full(count, int(register.get("SPR")), dtype=np.int64)
+        self.pc = np.full(count, int(register.get("PC")), dtype=np.int64)   # PC register as run() leaves it
+        self.divByZero = np.zeros(count, dtype=bool)
+        self.halted = np.zeros(count, dtype=bool)       # stopped by EOP, an empty word past the program or the code end
+        self.fallback = np.zeros(count, dtype=bool)     # finished by the scalar interpreter
+        self.executed = np.zeros(count, dtype=np.int64)
+        self.code = [None if not memory.loadInstruction(pc) and pc >= machine.programEnd
+                     else Program.decode(memory.loadInstruction(pc))
+                     for pc in range(machine.codeBase, machine.codeEnd)]
+
+    def inside(self, target):
+        return (target >= self.machine.codeBase) & (target < self.machine.codeEnd)
+
+    def bounded(self, lanes, sp, low, high):
+        # lanes whose stack pointer is outside low..high fall back (see storage.Stack.room/held)
+        self.fallback[lanes[(sp < low) | (sp > high)]] = True
+
+    @staticmethod
+    def cell(storage, address):
+        return storage.get(address) if storage.resolve(address) is not None else 0.
+
+    # Operand reads and writes for the lanes in `lanes` (an index array); see Program.readers/writers
+    def load(self, lanes, index):
+        # memory[lane, index] for valid indexes, 0 where Storage.get would miss
+        valid = (index >= 0) & (index < self.machine.memLen)
+        return np.where(valid, np.trunc(self.memory[lanes, np.where(valid, index, 0)]), 0.)
+
+    def read(self, operand, lanes):
+        mode, addr = operand
+        regLen = self.machine.regLen
+        if mode == 0b000:
+            return np.trunc(self.registers[lanes, addr]) if addr < regLen else np.zeros(len(lanes))
+        if mode == 0b001:
+            if addr >= regLen:
+                return np.zeros(len(lanes))
+            return self.load(lanes, np.trunc(self.registers[lanes, addr]).astype(np.int64))
+        if mode == 0b010:
+            return self.load(lanes, np.full(len(lanes), addr))
+        if mode == 0b011:
+            return self.load(lanes, self.load(lanes, np.full(len(lanes), addr)).astype(np.int64))
+        if mode == 0b100:
+            return np.full(len(lanes), float(addr))
+        stack = self.machine.stack
+        if mode == 0b101:
+            self.bounded(lanes, self.spr[lanes], stack.base, stack.limit - 1)
+            address = self.spr[lanes].astype(float)
+            self.spr[lanes] += 1
+            return address
+        if mode == 0b110:
+            self.bounded(lanes, self.spr[lanes], stack.base + 1, stack.limit)
+            self.spr[lanes] -= 1
+            return self.load(lanes, self.spr[lanes])
+        return np.zeros(len(lanes))
+
+    def store(self, lanes, index, value):
+        # memory[lane, index] = value; lanes whose index leaves data memory fall back
+        memory = self.machine.memory
+        bad = (index < 0) | (index >= self.machine.memLen) | ((index >= memory.codeBase) & (index < self.machine.codeEnd))
+        self.fallback[lanes[bad]] = True
+        good = ~bad
+        self.memory[lanes[good], index[good]] = value[good]
+
+    def write(self, operand, lanes, value):
+        mode, addr = operand
+        value = np.trunc(value)
+        regLen = self.machine.regLen
+        if mode == 0b000:
+            if addr < regLen:
+                self.registers[lanes, addr] = value
+            else:
+                self.fallback[lanes] = True
+        elif mode == 0b001:
+            if addr < regLen:
+                self.store(lanes, np.trunc(self.registers[lanes, addr]).astype(np.int64), value)
+        elif mode == 0b010:
+            self.store(lanes, np.full(len(lanes), addr), value)
+        elif mode == 0b011:
+            if addr < self.machine.memLen:
+                self.store(lanes, self.load(lanes, np.full(len(lanes), addr)).astype(np.int64), value)
+        elif mode == 0b101:
+            stack = self.machine.stack
+            self.bounded(lanes, self.spr[lanes], stack.base, stack.limit - 1)
+            self.store(lanes, self.spr[lanes], value)
+            self.spr[lanes] += 1
+
+    def step(self, pc, lanes):
+        # Execute the instruction at pc for `lanes`; returns their next PCs (-1: stopped)
+        inst = self.code[pc - self.machine.codeBase]
+        if inst is None:
+            return np.full(len(lanes), -1)
+        _, opid, op1, op2, compared = inst
+        name = opnames[opid]
+        handler = Program.handlers[opid]
+        after = np.full(len(lanes), pc + 1)
+        if handler is None:
+            return after
+        if name == "EOP":
+            return np.full(len(lanes), -1)
+        if name == "MOV":
+            self.write(op1, lanes, self.read(op2, lanes))
+        elif name in arithmetic:
+            a = self.read(op1, lanes)
+            b = self.read(op2, lanes)
+            if name in ("DIV", "MOD"):
+                zero = b == 0
+                self.divByZero[lanes[zero]] = True
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    result = np.where(zero, 0., a / b if name == "DIV" else np.mod(a, b))
+            else:
+                result = arithmetic[name](a, b)
+            self.write(op1, lanes, result)
+        elif name == "PUSH":
+            self.write((0b101, 0), lanes, self.read(op1, lanes))
+        elif name == "POP":
+            stack = self.machine.stack
+            self.bounded(lanes, self.spr[lanes], stack.base + 1, stack.limit)
+            index = self.spr[lanes] - 1
+            inside = (index >= 0) & (index < self.machine.memLen)
+            self.write(op1, lanes, self.memory[lanes, np.where(inside, index, 0)])
+            self.spr[lanes] -= 1
+        elif name == "JMP":
+            target = self.read(op1, lanes).astype(np.int64)
+            after = np.where(self.inside(target), target, after)
+        elif name in conditions:
+            target = self.read(op1, lanes).astype(np.int64)
+            a = self.read(op2, lanes)
+            b = self.read((0b000, compared), lanes)
+            after = np.where(conditions[name](a, b) & self.inside(target), target, after)
+        elif name == "CALL":
+            target = self.read(op1, lanes).astype(np.int64)
+            inside = self.inside(target)
+            calling = lanes[inside]
+            stack = self.machine.stack
+            self.bounded(calling, self.spr[calling], stack.base, stack.limit - 1)
+            self.store(calling, self.spr[calling], np.full(len(calling), pc + 1.))
+            self.spr[calling] += 1
+            after = np.where(inside, target, after)
+        elif name == "RET":
+            stack = self.machine.stack
+            self.bounded(lanes, self.spr[lanes], stack.base + 1, stack.limit)
+            self.spr[lanes] -= 1
+            target = self.load(lanes, self.spr[lanes]).astype(np.int64)
+            after = np.where(self.inside(target), target, after)
+        elif handler is not Program.execNext:
+            self.fallback[lanes] = True
+        self.pc[lanes] = after
+        return after
+
+    def run(self):
+        """Run every lane to its end (or `limit` instructions); returns self"""
+        codeEnd = self.machine.codeEnd
+        initial = (self.registers.copy(), self.memory.copy(), self.spr.copy())
+        at = np.full(self.count, self.machine.codeBase, dtype=np.int64)
+        running = np.ones(self.count, dtype=bool)
+        while True:
+            running &= ~self.fallback
+            ended = running & (at >= codeEnd)
+            self.halted |= ended
+            running &= ~ended
+            live = np.nonzero(running)[0]
+            if not live.size:
+                break
+            pc = int(at[live].min())
+            lanes = live[at[live] == pc]
+            after = self.step(pc, lanes)
+            at[lanes] = after
+            self.executed[lanes] += 1
+            stopped = lanes[after < 0]
+            self.halted[stopped] = True
+            running[stopped] = False
+            running[lanes[self.executed[lanes] >= self.limit]] = False
+        fallback = np.nonzero(self.fallback)[0]
+        if fallback.size:
+            self.snapshot = self.machine.snapshot()
+            for lane in fallback:
+                self.scalar(lane, initial)
+            self.machine.restore(self.snapshot)
+        return self
+
+    def scalar(self, lane, initial):
+        # Rerun one lane through Program.run from its initial state, then copy the result back
+        machine, program = self.machine, self.program
+        registers, memory, spr = initial
+        machine.restore(self.snapshot)
+        for k in range(machine.regLen):
+            machine.register.put(k, registers[lane, k])
+        for k in range(machine.memLen):
+            if not machine.memory.inCode(k):
+                machine.memory.put(k, memory[lane, k])
+        machine.register.put("SPR", spr[lane])
+
+        # execArithmetic reads the divisor last: keep the operands it asked for
+        operands = []
+        def getOp(operand):
+            value = Program.getOp(program, operand)
+            operands.append(value)
+            return value
+        def execArithmetic(program, opcode, op1, op2, pc):
+            operands.clear()
+            target = Program.execArithmetic(program, opcode, op1, op2, pc)
+            if opcode in ("DIV", "MOD") and operands[-1] == 0:
+                self.divByZero[lane] = True
+            return target
+        program.getOp = getOp
+        program.handlers = [execArithmetic if handler is Program.execArithmetic else handler
+                            for handler in Program.handlers]
+        try:
+            program.run()
+        finally:
+            del program.getOp, program.handlers
+        self.registers[lane] = [self.cell(machine.register, k) for k in range(machine.regLen)]
+        self.memory[lane] = [self.cell(machine.memory, k) for k in range(machine.memLen)]
+        self.spr[lane] = machine.register.get("SPR")
+        self.pc[lane] = machine.register.get("PC")
+        self.halted[lane] = True
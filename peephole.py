@@ -0,0 +1,311 @@
+# peephole.py - Optional optimization pass between Instruction.preEncode and Instruction.encode
+#
+# Rewrites a pre-encoded program (lists of tokens, commas stripped) into one that
+# executes fewer instructions and leaves the same final state. Inside each basic block:
+#   fold    arithmetic on registers holding known constants becomes MOV Rd, value
+#   dead    register stores overwritten later in the block without being read, and
+#           moves into operands nothing is written to (immediates), are dropped
+#   stack   a push (PUSH x, MOV PUSH, x) directly followed by a pop (POP d, MOV d, POP)
+#           becomes MOV d, x
+# and across the program:
+#   thread  a jump to an unconditional JMP goes straight to that JMP's target;
+#           a JMP to the next instruction is dropped
+#
+# The observable state is the register file, data memory and what PRNT writes (PRNT and
+# SCAN end a basic block like every instruction outside SIMPLE). The instruction region,
+# the PC register and stale stack slots above the stack pointer are not part of it,
+# pushed values are assumed to fit the single precision memory format and the stack
+# pointer to stay inside the stack region (storage.Stack).
+#
+# Dropping an instruction moves every instruction after it, so constant jump targets
+# are relocated, and nothing is changed up to the highest instruction address the
+# program reads or writes as data. An instruction with an indirect operand is left as
+# it is and ends its block like PRNT; the address it reaches is only known at run time
+# and is taken to be data memory. RET returns to the address CALL pushed at run time,
+# which already is the relocated one. A program with a computed jump target can enter
+# any instruction and is returned unchanged.
+#
+#   program = Program(source, optimize=True)    # program.changes lists what was done
+
+import storage
+import tracing
+from compiler import Instruction, arithmetic
+from convert import Length
+
+ADDR_MASK = (1 << Length.opAddr) - 1
+KNOWN = range(ADDR_MASK + 1)            # constants an immediate operand can hold
+
+STACK = (0b101, 0b110)                  # operand modes that move a stack pointer
+INDIRECT = (0b001, 0b011)               # operand modes that can reach any memory address
+UNWRITABLE = (0b100, 0b110, 0b111)      # destinations run.Program writes nowhere
+READS_REGISTER = (0b000, 0b001, 0b111)  # source modes that read the register named by addr
+SIMPLE = ("MOV", "PUSH", "POP") + tuple(arithmetic)  # everything else ends a basic block
+PUSHED = (0b101, 0)                     # operand PUSH
+POPPED = (0b110, 0)                     # operand POP
+
+
+def operand(inst, i, machine, labels=None):
+    # (mode, addr) of operand i as Instruction.encode lays it out (register 0 when absent)
+    if len(inst) <= i:
+        return (0b000, 0)
+    mode, addr = Instruction.encodeOp(inst[i], machine, labels)
+    return mode, addr & ADDR_MASK
+
+
+def text(inst):
+    return " ".join([inst[0], ", ".join(str(op) for op in inst[1:])]).strip()
+
+
+class Slot:
+    # One instruction word of the program being optimized
+    def __init__(self, address, inst, machine, labels=None):
+        self.address = address      # address before optimization
+        self.removed = False
+        self.set(inst, machine, labels)
+
+    def set(self, inst, machine, labels=None):
+        self.inst = inst
+        self.name = inst[0]
+        self.op1 = operand(inst, 1, machine, labels)
+        self.op2 = operand(inst, 2, machine, labels)
+        self.jump = self.name.startswith("J") or self.name == "CALL"
+        # constant jump target (an address before optimization), None for computed ones
+        self.target = self.op1[1] if self.jump and self.op1[0] == 0b100 else None
+
+    def writes(self):
+        # register fully overwritten by this instruction, or None
+        if (self.name == "MOV" or self.name in arithmetic) and self.op1[0] == 0b000:
+            return self.op1[1]
+        return None
+
+    def reads(self):
+        registers = set()
+        for i, op in enumerate((self.op1, self.op2)):
+            if op[0] not in READS_REGISTER:
+                continue
+            if i == 0 and op[0] == 0b000 and self.name in ("MOV", "POP"):
+                continue  # plain destination
+            registers.add(op[1])
+        return registers
+
+    def indirect(self):
+        return self.op1[0] in INDIRECT or self.op2[0] in INDIRECT
+
+    def pushed(self):
+        # operand a push instruction puts on the stack (PUSH x, MOV PUSH, x), or None
+        if self.name == "PUSH" and self.op1[0] not in STACK:
+            return self.inst[1]
+        if self.name == "MOV" and self.op1 == PUSHED and self.op2[0] not in STACK:
+            return self.inst[2]
+        return None
+
+    def popped(self):
+        # operand a pop instruction writes (POP d, MOV d, POP), or None
+        if self.name == "POP" and self.op1[0] not in STACK:
+            return self.inst[1]
+        if self.name == "MOV" and self.op2 == POPPED and self.op1[0] not in STACK:
+            return self.inst[1]
+        return None
+
+    def pure(self):
+        # True when dropping the instruction only loses its destination write
+        if self.name == "MOV":
+            return self.op2[0] not in STACK
+        return self.name in arithmetic and self.op1[0] not in STACK and self.op2[0] not in STACK
+
+
+class Optimizer:
+    def __init__(self, program, machine=None, tracer=None):
+        self.machine = machine or storage.machine
+        self.tracer = tracer or tracing.default
+        self.program = Instruction.preEncode(program)
+        self.changes = []       # (pass, address before optimization, instruction, replacement or None)
+
+        # Instruction words in program order; DEF/DEB and label lines take no address
+        self.start = int(self.machine.register.load("PC"))
+        self.labels = Instruction.labels(self.program, self.start)
+        self.slots = []
+        for inst in self.program:
+            if Instruction.isWord(inst):
+                self.slots.append(Slot(self.start + len(self.slots), inst, self.machine, self.labels))
+        self.end = self.start + len(self.slots)
+
+    def unsafe(self):
+        # Reason the program cannot be rearranged, or None
+        for slot in self.slots:
+            if slot.jump and slot.target is None:
+                return f"computed jump target at {slot.address}"
+        return None
+
+    def frozen(self):
+        # Highest address that has to keep its instruction word: instruction memory
+        # read or written as data, and constant jump targets of the instructions below it
+        memory = self.machine.memory
+        limit = self.start - 1
+        for slot in self.slots:
+            for op in (slot.op1, slot.op2):
+                if op[0] == 0b010 and memory.inCode(op[1]):
+                    limit = max(limit, op[1])
+        moved = True
+        while moved:
+            moved = False
+            for slot in self.slots[:max(0, limit + 1 - self.start)]:
+                if slot.target is not None and limit < slot.target < self.end:
+                    limit = slot.target
+                    moved = True
+        return limit
+
+    def live(self, address):
+        # First instruction still in the program at or after `address`
+        for slot in self.slots[max(0, address - self.start):]:
+            if not slot.removed:
+                return slot
+        return None
+
+    def blocks(self):
+        # Runs of consecutive simple instructions that are only entered at their first one
+        leaders = set()
+        for slot in self.slots:
+            if slot.target is not None and not slot.removed and self.start <= slot.target < self.end:
+                entry = self.live(slot.target)
+                if entry is not None:
+                    leaders.add(entry.address)
+        block = []
+        for slot in self.slots:
+            if slot.removed:
+                continue
+            if slot.address <= self.limit or slot.name not in SIMPLE or slot.indirect():
+                if block:
+                    yield block
+                block = []
+                continue
+            if slot.address in leaders and block:
+                yield block
+                block = []
+            block.append(slot)
+        if block:
+            yield block
+
+    def change(self, kind, slot, replacement=None):
+        self.changes.append((kind, slot.address, text(slot.inst), replacement and text(replacement)))
+        if self.tracer.debugging:
+            self.tracer.debug("optimized", kind, slot.address, text(slot.inst),
+                              text(replacement) if replacement else "(removed)")
+        if replacement is None:
+            slot.removed = True
+        else:
+            slot.set(replacement, self.machine, self.labels)
+
+    def stack(self, block):
+        for first, second in zip(block, block[1:]):
+            if first.removed or second.removed:
+                continue
+            source, dest = first.pushed(), second.popped()
+            if source is not None and dest is not None:
+                self.change("stack", first, ["MOV", dest, source])
+                self.change("stack", second)
+
+    def fold(self, block):
+        known = {}  # register -> constant it holds
+        for slot in block:
+            if slot.removed:
+                continue
+            dest = slot.writes()
+            if dest is None:
+                if slot.name == "POP" and slot.op1[0] == 0b000:
+                    known.pop(slot.op1[1], None)
+                continue
+            source = slot.op2 or (0b000, 0)
+            value = source[1] if source[0] == 0b100 else known.get(source[1]) if source[0] == 0b000 else None
+            if slot.name in arithmetic:
+                a = known.get(dest)
+                if a is None or value is None:
+                    value = None
+                elif slot.name in ("DIV", "MOD") and value == 0:
+                    value = 0
+                else:
+                    value = int(arithmetic[slot.name](a, value))
+                    if value in KNOWN:
+                        self.change("fold", slot, ["MOV", slot.inst[1], str(value)])
+            if value in KNOWN and dest < self.machine.regLen:
+                known[dest] = value
+            else:
+                known.pop(dest, None)
+
+    def dead(self, block):
+        live = None  # registers read before being overwritten again; None = all of them
+        for slot in reversed(block):
+            if slot.removed:
+                continue
+            dest = slot.writes()
+            if slot.pure() and (dest is not None and live is not None and dest not in live
+                                or slot.op1[0] in UNWRITABLE):
+                self.change("dead", slot)
+                continue
+            if live is None:
+                live = set(range(ADDR_MASK + 1))
+            if slot.name == "MOV" and dest is not None:
+                live.discard(dest)
+            live |= slot.reads()
+
+    def thread(self):
+        for slot in self.slots:
+            if slot.removed or slot.target is None or slot.address <= self.limit:
+                continue
+            target, seen = slot.target, {slot.address}
+            while self.start <= target < self.end:
+                hop = self.live(target)
+                if (hop is None or hop.name != "JMP" or hop.address <= self.limit or hop.address in seen
+                        or hop.target is None or not self.machine.codeBase <= hop.target < self.machine.codeEnd):
+                    break
+                seen.add(hop.address)
+                target = hop.target
+            if target != slot.target:
+                self.change("thread", slot, [slot.name, str(target)] + slot.inst[2:])
+            if (slot.name == "JMP" and self.start <= slot.target <= self.end
+                    and self.live(slot.address + 1) is self.live(slot.target)):
+                self.change("thread", slot)
+
+    def relocated(self, address):
+        if not self.start <= address <= self.end:
+            return address
+        return self.start + sum(not slot.removed for slot in self.slots[:address - self.start])
+
+    def run(self):
+        # (optimized program, changes)
+        reason = self.unsafe()
+        if reason is not None:
+            self.tracer.info("optimize_skip", reason)
+            return self.program, self.changes
+        self.limit = self.frozen()
+
+        done = -1
+        while done != len(self.changes):
+            done = len(self.changes)
+            for block in list(self.blocks()):
+                self.stack(block)
+                self.fold(block)
+                self.dead(block)
+            self.thread()
+
+        # Point constant jumps at where their targets ended up, then rebuild the program
+        for slot in self.slots:
+            if slot.target is not None and not slot.removed and self.relocated(slot.target) != slot.target:
+                prefix = "#" if slot.inst[1].startswith("#") else ""
+                slot.inst = [slot.name, prefix + str(self.relocated(slot.target))] + slot.inst[2:]
+        slots = iter(self.slots)
+        result = []
+        for inst in self.program:
+            if not Instruction.isWord(inst):
+                result.append(inst)
+                continue
+            slot = next(slots)
+            if not slot.removed:
+                result.append(slot.inst)
+        self.tracer.info("optimize_done", len(self.slots), sum(not slot.removed for slot in self.slots))
+        return result, self.changes
+
+
+def optimize(program, machine=None, tracer=None):
+    """Peephole-optimize a pre-encoded program; returns (program, changes)"""
+    return Optimizer(program, machine, tracer).run()
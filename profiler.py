@@ -0,0 +1,142 @@
+# profiler.py - Per-opcode, per-PC and per-addressing-mode profile of Program.run
+#
+# Program.run(profiler=Profiler()) swaps in timed copies of the opcode handlers and of
+# the operand readers/writers (Program.readers / Program.writers) for that one run, so
+# an unprofiled run pays nothing. Handler times include their operand reads and writes;
+# the collapsed stacks split them out again, one frame per opcode, PC and access path.
+# A JMP or conditional jump with a constant target at or before its own PC, when
+# taken, is a loop edge (CALL and RET are not): the report lists those with the number
+# of iterations and the time spent in the loop body.
+#
+#   python profiler.py isk.inc
+#   python profiler.py isk.inc --collapsed isk.folded     # flamegraph.pl isk.folded > isk.svg
+
+import argparse
+import time
+
+import storage
+from compiler import conditions
+from run import Program
+
+# 3-bit addressing mode -> name used in reports and stack frames (see Instruction.encodeOp)
+MODES = ["register", "register_indirect", "direct", "indirect",
+         "immediate", "stack_push", "stack_pop", "auto_incdec"]
+
+clock = time.perf_counter_ns
+
+BACKWARD = ("JMP",) + tuple(conditions)    # opcodes whose taken backward jump closes a loop
+
+
+class Profiler:
+    def __init__(self):
+        self.opcodes = {}       # opcode name -> [count, ns]
+        self.pcs = {}           # pc -> [count, ns]
+        self.names = {}         # pc -> opcode name last executed there
+        self.modes = {}         # ("read" | "write", mode name) -> [count, ns]
+        self.stacks = {}        # collapsed stack frames -> exclusive ns
+        self.loops = {}         # (jump target, jump pc) -> times taken
+        self.elapsed = 0        # ns spent in Program.run while attached
+        self.current = None     # (opcode, pc) of the handler being timed
+        self.child = 0          # ns spent in operand paths by the current handler
+
+    @staticmethod
+    def add(table, key, ns):
+        entry = table.get(key)
+        if entry is None:
+            table[key] = [1, ns]
+        else:
+            entry[0] += 1
+            entry[1] += ns
+
+    def attach(self, program):
+        # Timed handler table for this run; readers/writers are shadowed on the instance
+        program.readers = [self.timedPath(path, "read", mode) for mode, path in enumerate(Program.readers)]
+        program.writers = [self.timedPath(path, "write", mode) for mode, path in enumerate(Program.writers)]
+        self.started = clock()
+        return [handler and self.timedHandler(handler) for handler in program.handlers]
+
+    def detach(self, program):
+        self.elapsed += clock() - self.started
+        del program.readers, program.writers
+
+    def timedHandler(self, handler):
+        def timed(program, opcode, op1, op2, pc):
+            self.current, self.child = (opcode, pc), 0
+            start = clock()
+            try:
+                target = handler(program, opcode, op1, op2, pc)
+            finally:
+                ns = clock() - start
+                self.current = None
+            self.add(self.opcodes, opcode, ns)
+            self.add(self.pcs, pc, ns)
+            self.names[pc] = opcode
+            self.add(self.stacks, (opcode, f"{opcode}@{pc}"), ns - self.child)
+            if opcode in BACKWARD and op1 == (0b100, target) and target <= pc:
+                edge = (target, pc)
+                self.loops[edge] = self.loops.get(edge, 0) + 1
+            return target
+        return timed
+
+    def timedPath(self, path, kind, mode):
+        key = (kind, MODES[mode])
+        frame = f"{kind}:{MODES[mode]}"
+        def timed(program, *args):
+            start = clock()
+            try:
+                return path(program, *args)
+            finally:
+                ns = clock() - start
+                self.add(self.modes, key, ns)
+                if self.current is not None:
+                    self.child += ns
+                    opcode, pc = self.current
+                    self.add(self.stacks, (opcode, f"{opcode}@{pc}", frame), ns)
+        return timed
+
+    def instructions(self):
+        return sum(count for count, _ in self.opcodes.values())
+
+    def report(self, top=20):
+        total = self.elapsed or 1
+        lines = [f"Profiled {self.instructions()} instructions in {self.elapsed / 1e6:.3f} ms", ""]
+
+        def table(title, rows):
+            lines.append(f"{title:<28} {'count':>9} {'total ms':>10} {'avg us':>9} {'%':>6}")
+            for label, (count, ns) in rows:
+                lines.append(f"{label:<28} {count:>9} {ns / 1e6:>10.3f} {ns / count / 1e3:>9.2f} {100 * ns / total:>6.1f}")
+            lines.append("")
+
+        byTime = lambda item: -item[1][1]
+        table("opcode", sorted(self.opcodes.items(), key=byTime))
+        table("pc", [(f"{pc} {self.names[pc]}", entry) for pc, entry in sorted(self.pcs.items(), key=byTime)[:top]])
+        table("operand path", [(f"{kind} {mode}", entry) for (kind, mode), entry in sorted(self.modes.items(), key=byTime)])
+
+        lines.append(f"{'loop (target <- jump)':<28} {'taken':>9} {'body ms':>10} {'length':>9}")
+        for (target, pc), taken in sorted(self.loops.items(), key=lambda item: -item[1])[:top]:
+            body = sum(ns for at, (_, ns) in self.pcs.items() if target <= at <= pc)
+            lines.append(f"{f'{target} <- {pc}':<28} {taken:>9} {body / 1e6:>10.3f} {pc - target + 1:>9}")
+        return "\n".join(lines)
+
+    def collapsed(self, out, root="run"):
+        # One "frame;frame;... ns" line per stack, as flamegraph.pl and speedscope read them
+        for frames, (_, ns) in sorted(self.stacks.items()):
+            if ns > 0:
+                out.write(f"{';'.join((root,) + frames)} {ns}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile one .inc program per opcode, PC and addressing mode")
+    parser.add_argument("program", help=".inc file to run")
+    parser.add_argument("--top", type=int, default=20, help="rows in the PC and loop tables")
+    parser.add_argument("--collapsed", default=None, help="write collapsed stacks (flamegraph input) here")
+    parser.add_argument("--native", action="store_true", help="use NativeStorage registers and memory")
+    args = parser.parse_args()
+
+    machine = storage.Machine(args.native)
+    profiler = Profiler()
+    Program(Program.readFile(args.program), machine).run(profiler=profiler)
+    print(profiler.report(args.top))
+    if args.collapsed:
+        with open(args.collapsed, "w") as out:
+            profiler.collapsed(out, args.program)
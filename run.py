@@ -1,8 +1,10 @@
 # run(inc).py - Executes the program
 
+import devices
+import peephole
 import storage
-from compiler import Instruction, operations    #operation was imported from compiler.py
-from addressing import Access, AddressingMode
+import tracing
+from compiler import Instruction, arithmetic, conditions, opcodes, opnames    #opcode tables are built in compiler.py
 from convert import Precision, Length
 
 class Except:
@@ -25,16 +27,47 @@ class Except:
 
 
 class Program:
-    def __init__(self, program):
-        # Initialize PC to 8 (start of instruction memory)
-        storage.register.storeRegisterValue("PC", 8)
-        storage.register.storeRegisterValue("IR", 8)
-        storage.register.storeRegisterValue("BR", 8)
+    def __init__(self, program, machine=None, tracer=None, cache=None, optimize=False):
+        # Each program runs against its own machine state (default: storage.machine)
+        self.machine = machine or storage.machine
+        self.tracer = tracer or tracing.default
+
+        # Initialize PC to the start of instruction memory (8 by default)
+        self.machine.register.storeRegisterValue("PC", self.machine.codeBase)
+        self.machine.register.storeRegisterValue("IR", self.machine.codeBase)
+        self.machine.register.storeRegisterValue("BR", self.machine.codeBase)
         
-        # Parse and encode instructions
+        # Load the image from the cache directory, or parse and encode the instructions
+        path = cached = None
+        if cache is not None:
+            import image  # only cached runs need it (hashlib and json are slow to import)
+            path = image.path(cache, program, self.machine, optimize)
+            cached = image.load(path, self.machine)
+        if cached is not None:
+            self.program = None  # pre-encoded instructions (not kept for a cached image)
+            self.changes = cached.changes
+            return
         parsed = [[part.strip(',') for part in instr.split()] for instr in program]
         self.program = Instruction.preEncode(parsed)
-        Instruction.encodeProgram(self.program)
+        self.changes = []  # peephole rewrites, see peephole.Optimizer.changes
+        if optimize:
+            self.program, self.changes = peephole.optimize(self.program, self.machine, self.tracer)
+        if path is None:
+            Instruction.encodeProgram(self.program, self.machine, self.tracer)
+        else:
+            image.assemble(path, self.program, self.machine, self.tracer, self.changes)
+
+    @staticmethod
+    def readFile(filename):
+        # Convert text from file as list of instructions
+        instructions = []
+        with open(filename, "r") as f:
+            for line in f:
+                # Remove comments and whitespace
+                clean_line = line.split(";")[0].strip()
+                if clean_line and not clean_line.isspace():  # Only add non-empty lines
+                    instructions.append(clean_line)
+        return instructions
 
     @staticmethod
     def exception(name, value):
@@ -42,56 +75,97 @@ class Program:
             return Except("Division by zero error")
         return Except("No Exception", occur=False)
 
-    def getOp(self, code):
-        mode = code[:Length.opMode]
-        addr = int(code[Length.opMode:], 2)
+    @staticmethod
+    def decode(word):
+        """Decode a 32-bit instruction word into (word, opcode id, op1, op2, compared register);
+        each operand is a (mode, addr) pair"""
+        # opcode (5) | op1 mode (3) | op1 addr (8) | op2 mode (3) | op2 addr (8) | Jcc register (5)
+        op1 = (word >> 24 & 0b111, word >> 16 & 0xFF)
+        op2 = (word >> 13 & 0b111, word >> 5 & 0xFF)
+        return (word, word >> 27, op1, op2, word & 0x1F)
+
+    # Operand readers, one per addressing mode. The mode fixes the scope and the decoded
+    # address is the slot, so these index storage directly (Storage.get); a miss raises
+    # and getOp reports it.
+    def readRegister(self, addr):
+        return int(self.machine.register.get(addr))
+
+    def readRegisterIndirect(self, addr):
+        return int(self.machine.memory.get(int(self.machine.register.get(addr))))
+
+    def readDirect(self, addr):
+        return int(self.machine.memory.get(addr))
+
+    def readIndirect(self, addr):
+        memory = self.machine.memory
+        return int(memory.get(int(memory.get(addr))))
+
+    def readImmediate(self, addr):
+        return addr  # Return the value directly
+
+    def readStackPush(self, addr):
+        return self.machine.stack.reserve()
 
+    def readStackPop(self, addr):
+        return int(self.machine.stack.pop())
+
+    def readNone(self, addr):
+        return 0
+
+    # mode -> reader, indexed by the 3-bit addressing mode
+    readers = [readRegister, readRegisterIndirect, readDirect, readIndirect,
+               readImmediate, readStackPush, readStackPop, readNone]
+
+    def getOp(self, operand):
+        mode, addr = operand
         try:
-            if mode == "000":  # Register
-                return int(AddressingMode.register(addr))
-            elif mode == "001":  # Register indirect
-                return int(AddressingMode.register_indirect(addr))
-            elif mode == "010":  # Direct
-                return int(AddressingMode.direct(addr))
-            elif mode == "011":  # Indirect
-                return int(AddressingMode.indirect(addr))
-            elif mode == "100":  # Indexed 
-                return addr  # Return the value directly
-            elif mode == "101":  # Stack push
-                return int(AddressingMode.stack("push"))
-            elif mode == "110":  # Stack pop
-                return int(AddressingMode.stack("pop"))
-            return 0
+            return self.readers[mode](self, addr)
         except Exception as e:
-            print(f"[ERROR] GetOp failed: {str(e)}")
+            self.tracer.error("getop_failed", e)
             return 0
 
-    def write(self, dest_code, src_val, movcode):
-        mode = dest_code[:Length.opMode]
-        addr = int(dest_code[Length.opMode:], 2)
+    # Destination writers, one per addressing mode
+    def writeRegister(self, addr, src_val):
+        self.machine.register.put(addr, int(src_val))
+        if self.tracer.debugging:
+            self.tracer.debug("wrote_reg", src_val, addr)
+
+    def writeRegisterIndirect(self, addr, src_val):
+        reg_addr = int(self.machine.register.get(addr))
+        self.machine.memory.put(reg_addr, int(src_val))
+        if self.tracer.debugging:
+            self.tracer.debug("wrote_mem", src_val, reg_addr)
+
+    def writeDirect(self, addr, src_val):
+        self.machine.memory.put(addr, int(src_val))
+        if self.tracer.debugging:
+            self.tracer.debug("wrote_mem", src_val, addr)
+
+    def writeIndirect(self, addr, src_val):
+        indirect_addr = int(self.machine.memory.get(addr))
+        self.machine.memory.put(indirect_addr, int(src_val))
+        if self.tracer.debugging:
+            self.tracer.debug("wrote_mem", src_val, indirect_addr)
 
+    def writeStackPush(self, addr, src_val):
+        stack = self.machine.stack
+        stack.push(int(src_val))
+        if self.tracer.debugging:
+            self.tracer.debug("pushed", src_val, stack.sp - 1)
+
+    def writeNone(self, addr, src_val):
+        pass
+
+    # mode -> writer; immediate, pop and auto inc/dec are not writable
+    writers = [writeRegister, writeRegisterIndirect, writeDirect, writeIndirect,
+               writeNone, writeStackPush, writeNone, writeNone]
+
+    def write(self, dest, src_val, movcode):
+        mode, addr = dest
         try:
-            if mode == "000":  # Register
-                Access.store("reg", addr, int(src_val))
-                print(f"[DEBUG] Wrote {src_val} to R{addr}")
-            elif mode == "001":  # Register indirect
-                reg_addr = int(AddressingMode.register(addr))
-                Access.store("mem", reg_addr, int(src_val))
-                print(f"[DEBUG] Wrote {src_val} to memory[{reg_addr}]")
-            elif mode == "010":  # Direct
-                Access.store("mem", addr, int(src_val))
-                print(f"[DEBUG] Wrote {src_val} to memory[{addr}]")
-            elif mode == "011":  # Indirect
-                indirect_addr = int(AddressingMode.direct(addr))
-                Access.store("mem", indirect_addr, int(src_val))
-                print(f"[DEBUG] Wrote {src_val} to memory[{indirect_addr}]")
-            elif mode == "101":  # Stack push
-                sp = storage.register.getStackPointer()
-                Access.store("mem", sp, int(src_val))
-                storage.register.updateStackPointer(sp + 1)
-                print(f"[DEBUG] Pushed {src_val} to stack at {sp}")
+            self.writers[mode](self, addr, src_val)
         except Exception as e:
-            print(f"[ERROR] Write failed: {str(e)}")
+            self.tracer.error("write_failed", e)
 
     def execute(self, result, opcode):
         if opcode == "ADD":
@@ -110,82 +184,237 @@ class Program:
             return result[0] % result[1]
         return 0
 
-    def run(self):
-        pc = 8  # Start at instruction memory
-        print("\n[INFO] Starting program execution...")
+    # Opcode handlers: take the decoded operands and the current PC, return the next PC
+    # (None stops the program)
+    def execMOV(self, opcode, op1, op2, pc):
+        val = self.getOp(op2)  # Source
+        if self.tracer.debugging:
+            self.tracer.debug("move", val)
+        self.write(op1, val, opcode)  # Destination
+        return pc + 1
+
+    def execArithmetic(self, opcode, op1, op2, pc):
+        op1_val = self.getOp(op1)
+        op2_val = self.getOp(op2)
+        if self.tracer.debugging:
+            self.tracer.debug("arith", opcode, op1_val, op2_val)
+        if opcode in ("DIV", "MOD") and op2_val == 0:
+            result = 0
+        else:
+            result = arithmetic[opcode](op1_val, op2_val)
+        if self.tracer.debugging:
+            self.tracer.debug("result", result)
+        self.write(op1, result, opcode)
+        return pc + 1
+
+    def execPUSH(self, opcode, op1, op2, pc):
+        val = self.getOp(op1)
+        if self.tracer.debugging:
+            self.tracer.debug("push", val)
+        self.write((0b101, 0), val, opcode)
+        return pc + 1
+
+    def execPOP(self, opcode, op1, op2, pc):
+        try:
+            val = self.machine.stack.pop()
+        except storage.StackError as e:
+            self.tracer.error("stack_error", e)
+            return pc + 1
+        if self.tracer.debugging:
+            self.tracer.debug("pop", val)
+        self.write(op1, val, opcode)
+        return pc + 1
+
+    def execJMP(self, opcode, op1, op2, pc):
+        target = self.getOp(op1)
+        if self.tracer.debugging:
+            self.tracer.debug("jump", target)
+        if self.machine.codeBase <= target < self.machine.codeEnd:  # Stay within instruction memory
+            return target
+        return pc + 1
+
+    def execBranch(self, opcode, op1, op2, pc):
+        # Jcc target, a, b: register b comes decoded with the word (see Program.decode);
+        # dispatch has just cached it for pc
+        inst = self.machine.memory.decoded.get(pc) or self.decode(self.machine.memory.loadInstruction(pc))
+        target = self.getOp(op1)
+        a = self.getOp(op2)
+        b = self.getOp((0b000, inst[4]))
+        taken = conditions[opcode](a, b)
+        if self.tracer.debugging:
+            self.tracer.debug("branch", opcode, a, b, target if taken else pc + 1)
+        if taken and self.machine.codeBase <= target < self.machine.codeEnd:
+            return target
+        return pc + 1
+
+    def execCALL(self, opcode, op1, op2, pc):
+        target = self.getOp(op1)
+        if not self.machine.codeBase <= target < self.machine.codeEnd:
+            return pc + 1
+        try:
+            self.machine.stack.push(pc + 1)  # return address
+        except storage.StackError as e:
+            self.tracer.error("stack_error", e)
+            return pc + 1
+        if self.tracer.debugging:
+            self.tracer.debug("call", target, pc + 1)
+        return target
+
+    def execRET(self, opcode, op1, op2, pc):
+        try:
+            target = int(self.machine.stack.pop())
+        except storage.StackError as e:
+            self.tracer.error("stack_error", e)
+            return pc + 1
+        if self.tracer.debugging:
+            self.tracer.debug("return", target)
+        if self.machine.codeBase <= target < self.machine.codeEnd:
+            return target
+        return pc + 1
+
+    def execEOP(self, opcode, op1, op2, pc):
+        return None
+
+    def execPRNT(self, opcode, op1, op2, pc):
+        value = self.getOp(op1)
+        if self.tracer.debugging:
+            self.tracer.debug("print", value)
+        self.machine.output.write(value)
+        return pc + 1
+
+    def execSCAN(self, opcode, op1, op2, pc):
+        value = self.machine.input.read()  # raises devices.Blocked while an open channel is empty
+        if self.tracer.debugging:
+            self.tracer.debug("scan", value)
+        self.write(op1, value, opcode)
+        return pc + 1
+
+    def execNext(self, opcode, op1, op2, pc):
+        # Defined but not implemented by the interpreter: skip
+        return pc + 1
+
+    def run(self, translator=None, profiler=None):
+        # translator: optional jit.Translator; hot blocks then run as compiled Python
+        # profiler: optional profiler.Profiler; times every handler and operand access
+        handlers = self.handlers
+        tracer = self.tracer
+        tracer.info("run_start")
+
+        if tracer.debugging:
+            translator = None  # translated blocks do not emit trace records
+        if profiler is not None:
+            translator = None  # every instruction goes through the timed handlers
+            handlers = profiler.attach(self)
+
+        pc, _ = self.dispatch(self.machine.codeBase, -1, translator, handlers)  # Start at instruction memory
+        if pc is not None:
+            tracer.error("scan_blocked", pc)
+
+        if profiler is not None:
+            profiler.detach(self)
+        self.machine.output.flush()
+        tracer.info("run_done")
+        tracer.flush()
+
+    def start(self):
+        # Begin a run that step() executes a few instructions at a time (see scheduler.py)
+        self.pc = self.machine.codeBase
+        self.executed = 0
+        self.blocked = None  # input channel a SCAN is waiting on
+        self.tracer.info("run_start")
 
-        while pc < 72:  # Only execute within instruction memory range
+    def step(self, count, translator=None):
+        """Execute up to count more instructions of a start()ed run; returns False once it has ended.
+        Stops early at a SCAN with no input yet: self.blocked is then the channel to wait on"""
+        if self.pc is None:
+            return False
+        if self.tracer.debugging:
+            translator = None
+        self.pc, left = self.dispatch(self.pc, count, translator, self.handlers)
+        self.executed += count - left
+        self.blocked = self.machine.input if self.pc is not None and left else None
+        if self.pc is None:
+            self.machine.output.flush()
+            self.tracer.info("run_done")
+            self.tracer.flush()
+            return False
+        return True
+
+    def dispatch(self, pc, budget, translator, handlers):
+        # Run from pc until the program ends (returns None, budget left), budget
+        # instructions have run (returns the next pc, 0) or a SCAN has to wait for input
+        # (returns its pc, budget left); a budget of -1 never runs out. A translated block
+        # is charged every instruction it ran and only called when it fits the budget
+        # left. The PC register is only written when it returns (where the program
+        # stopped or will go on), not after every instruction.
+        decoded = self.machine.memory.decoded  # per-PC decode cache, invalidated by Storage.store
+        register = self.machine.register
+        tracer = self.tracer
+        debugging = tracer.debugging  # checked before every per-instruction record
+
+        codeEnd = self.machine.codeEnd
+        while budget:
+            if pc >= codeEnd:  # Only execute within instruction memory range
+                register.put("PC", pc)
+                return None, budget
             try:
-                code = storage.memory.loadInstruction(pc)
-                if not code or all(bit == '0' for bit in code):
-                    break
-
-                print(f"\n[DEBUG] Executing instruction at PC={pc}")
-                print(f"[DEBUG] Instruction code: {code}")
-                
-                # Decode opcode and operands
-                opcode_bin = code[:5]
-                op1_code = code[5:16]
-                op2_code = code[16:27]
-                
-                # Get operation name
-                op_group = int(opcode_bin[:2], 2)
-                cat_index = int(opcode_bin[2:], 2)
-                
-                try:
-                    opcode = operations[op_group][cat_index]
-                except (IndexError, KeyError):
+                if translator is not None:
+                    block = translator.enter(pc)
+                    if block is not None and (budget < 0 or block.length <= budget):
+                        pc, ran = block(budget)
+                        budget -= ran
+                        if pc is None:
+                            return None, budget
+                        continue
+
+                budget -= 1
+                inst = decoded.get(pc)
+                if inst is None:
+                    code = self.machine.memory.loadInstruction(pc)
+                    if not code and pc >= self.machine.programEnd:  # empty word past the program
+                        register.put("PC", pc)
+                        return None, budget
+                    inst = decoded[pc] = self.decode(code)
+                code, opid, op1_code, op2_code, _ = inst
+
+                if debugging:
+                    tracer.debug("execute", pc)
+                    tracer.debug("code", code)
+
+                handler = handlers[opid]
+                if handler is None:  # not an operation
                     pc += 1
                     continue
 
-                print(f"[DEBUG] Operation: {opcode}")
+                if debugging:
+                    tracer.debug("operation", opnames[opid])
 
                 # Execute instruction
-                if opcode == "MOV":
-                    val = self.getOp(op2_code)  # Source
-                    print(f"[DEBUG] Moving value {val}")
-                    self.write(op1_code, val, opcode)  # Destination
-                elif opcode in ["ADD", "SUB", "MUL", "DIV"]:
-                    op1_val = self.getOp(op1_code)
-                    op2_val = self.getOp(op2_code)
-                    print(f"[DEBUG] {opcode}: {op1_val} {opcode} {op2_val}")
-                    
-                    if opcode == "ADD": result = op1_val + op2_val
-                    elif opcode == "SUB": result = op1_val - op2_val
-                    elif opcode == "MUL": result = op1_val * op2_val
-                    elif opcode == "DIV" and op2_val != 0: result = op1_val / op2_val
-                    else: result = 0
-                    
-                    print(f"[DEBUG] Result: {result}")
-                    self.write(op1_code, result, opcode)
-                elif opcode == "PUSH":
-                    val = self.getOp(op1_code)
-                    print(f"[DEBUG] Pushing value {val}")
-                    self.write("101" + "0"*8, val, opcode)
-                elif opcode == "POP":
-                    sp = storage.register.getStackPointer()
-                    if sp > 0:
-                        val = storage.memory.load(sp - 1)
-                        print(f"[DEBUG] Popping value {val}")
-                        self.write(op1_code, val, opcode)
-                        storage.register.updateStackPointer(sp - 1)
-                elif opcode == "JMP":
-                    target = self.getOp(op1_code)
-                    print(f"[DEBUG] Jump target: {target}")
-                    if 8 <= target < 72:  # Stay within instruction memory
-                        pc = target
-                        continue
-                elif opcode == "EOP":
-                    break
-
-                pc += 1
-                storage.register.storeRegisterValue("PC", pc)
+                after = handler(self, opnames[opid], op1_code, op2_code, pc)
+                if after is None:
+                    register.put("PC", pc)
+                    return None, budget
+                pc = after
 
+            except devices.Blocked:
+                register.put("PC", pc)
+                return pc, budget + 1  # the SCAN runs again once there is input
             except Exception as e:
-                print(f"[ERROR] at PC={pc}: {str(e)}")
+                tracer.error("run_error", pc, e)
                 pc += 1
+        register.put("PC", pc)
+        return pc, budget
 
-        print("\n[Program Terminated]")
+# opcode id -> handler, built once; unlisted operations are skipped, unused ids are None
+Program.handlers = [Program.execNext if name else None for name in opnames]
+for name, handler in [("MOV", Program.execMOV), ("PUSH", Program.execPUSH), ("POP", Program.execPOP),
+                      ("JMP", Program.execJMP), ("CALL", Program.execCALL), ("RET", Program.execRET),
+                      ("EOP", Program.execEOP), ("PRNT", Program.execPRNT), ("SCAN", Program.execSCAN)]:
+    Program.handlers[opcodes[name]] = handler
+for name in conditions:
+    Program.handlers[opcodes[name]] = Program.execBranch
+for name in arithmetic:
+    Program.handlers[opcodes[name]] = Program.execArithmetic
 
 if __name__ == "__main__":
     try:
@@ -194,29 +423,16 @@ if __name__ == "__main__":
         
         print(f"[INFO] Loading program from {filename}...")
         
-        with open(filename, "r") as f:
-            lines = f.readlines()
-            # Convert text from file as list of instructions
-            instructions = []
-            for line in lines:
-                # Remove comments and whitespace
-                clean_line = line.split(";")[0].strip()
-                if clean_line and not clean_line.isspace():  # Only add non-empty lines
-                    instructions.append(clean_line)
+        instructions = Program.readFile(filename)
         
         print(f"[INFO] Loaded {len(instructions)} instructions")
         print("\nInstructions to execute:")
         for i, inst in enumerate(instructions):
             print(f"{i}: {inst}")
         
-        # Initialize storage
-        print("\n[INFO] Initializing storage...")
-        storage.register.store("SPR", 120)  # Set stack pointer
-        storage.register.store("TSP", 120)  # Set top of stack pointer
-        
-        # Pass instructions to Program class
+        # Pass instructions to Program class, tracing every step to the console
         print("\n[INFO] Creating program...")
-        program = Program(instructions)
+        program = Program(instructions, tracer=tracing.Tracer(tracing.DEBUG))
         
         # Program class calls run
         print("\n[INFO] Running program...")
@@ -0,0 +1,212 @@
+# scheduler.py - Runs many programs in one process, interleaved a quantum at a time
+#
+# A VM wraps a run.Program on its own storage.Machine and drives it through
+# Program.start / Program.step, so it can stop after any instruction and carry on later.
+# The Scheduler keeps the VMs that can still run in a heap ordered by stride scheduling:
+# every turn a VM gets adds quantum / priority to its pass and the lowest pass runs
+# next. Equal priorities take turns round-robin, priority 2 gets twice the turns of
+# priority 1, and a runaway program never gets more than its share. A VM stops with
+#   done      its program ended (EOP, an empty word past it or the end of code)
+#   budget    it has run `budget` instructions
+#   timeout   `timeout` wall-clock seconds have passed since its first turn
+#   error     Program.step raised (errors inside an instruction are traced and skipped)
+#   blocked   it was waiting on SCAN input when run() had nothing else left to run
+# Timeouts are checked before each turn, so a turn in progress finishes its quantum.
+# A VM whose SCAN finds its input channel empty (devices.py) leaves the heap until
+# the channel is fed or closed; runAsync() waits for that (timing parked VMs out while it
+# has nothing else to run), run() cannot.
+#
+#   scheduler = Scheduler(quantum=500)
+#   for source in sources:
+#       scheduler.add(Program(source, storage.Machine()), budget=10**6, timeout=2.)
+#   scheduler.run()                                 # or: await scheduler.runAsync()
+#
+# Inside asyncio code one VM can also be driven directly: `await vm.step(n)` runs up to
+# n instructions, yielding to the event loop after every quantum.
+#
+#   python scheduler.py a.inc b.inc --quantum 1000 --budget 1000000 --timeout 5
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import time
+
+import devices
+import storage
+import tracing
+from run import Program
+
+QUANTUM = 1000          # instructions per turn
+
+
+class VM:
+    def __init__(self, program, name=None, priority=1, budget=None, timeout=None, translator=None):
+        if priority <= 0:
+            raise ValueError(f"priority must be positive, not {priority}")
+        self.program = program
+        self.name = name
+        self.priority = priority
+        self.budget = budget            # instructions before the VM is stopped (None: no limit)
+        self.timeout = timeout          # wall-clock seconds from the first turn (None: no limit)
+        self.translator = translator    # optional jit.Translator; compiled blocks are charged every instruction they run
+        self.status = "ready"
+        self.error = ""
+        self.started = None             # time.monotonic() at the first turn
+        self.elapsed = 0.               # seconds spent executing
+        program.start()
+
+    @property
+    def executed(self):
+        return self.program.executed
+
+    def turn(self, count):
+        """Run up to count instructions; returns False once the VM has stopped"""
+        if self.status != "ready":
+            return False
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        elif self.timeout is not None and now - self.started >= self.timeout:
+            return self.stop("timeout")
+        program = self.program
+        if self.budget is not None:
+            count = min(count, self.budget - program.executed)
+        try:
+            if not program.step(count, self.translator):
+                self.status = "done"
+            elif self.budget is not None and program.executed >= self.budget:
+                self.status = "budget"
+        except Exception as e:
+            self.status = "error"
+            self.error = str(e)
+        self.elapsed += time.monotonic() - now
+        return self.running()
+
+    def running(self):
+        if self.status != "ready":
+            self.program.machine.output.flush()  # a stopped program's output still goes out
+            return False
+        return True
+
+    def stop(self, status):
+        self.status = status
+        return self.running()
+
+    async def step(self, n=QUANTUM, quantum=QUANTUM):
+        """Run up to n instructions, yielding to the event loop after every quantum; returns how many ran"""
+        start = self.program.executed
+        while self.program.executed - start < n:
+            if not self.turn(min(quantum, n - (self.program.executed - start))):
+                break
+            if self.program.blocked is not None:
+                await self.program.blocked.wait()
+            else:
+                await asyncio.sleep(0)
+        return self.program.executed - start
+
+
+class Scheduler:
+    def __init__(self, quantum=QUANTUM):
+        self.quantum = quantum
+        self.vms = []
+        self.queue = []                 # (pass, arrival, vm) of the VMs still running
+        self.parked = set()             # VMs waiting for SCAN input
+        self.waking = None              # future runAsync() waits on while every VM is parked
+        self.arrival = itertools.count()
+        self.clock = 0.                 # pass of the latest turn; new VMs join at it
+
+    def add(self, vm, **options):
+        """Queue a VM (or a run.Program, wrapped as VM(program, **options)); returns the VM"""
+        if not isinstance(vm, VM):
+            vm = VM(vm, **options)
+        if vm.name is None:
+            vm.name = f"vm{len(self.vms)}"
+        self.vms.append(vm)
+        heapq.heappush(self.queue, (self.clock, next(self.arrival), vm))
+        return vm
+
+    def turn(self):
+        """Give the next VM one quantum; returns False once no VM is left to run"""
+        if not self.queue:
+            return False
+        self.clock, _, vm = heapq.heappop(self.queue)
+        if vm.turn(self.quantum):
+            if vm.program.blocked is not None:
+                self.parked.add(vm)
+                vm.program.blocked.listen(lambda: self.wake(vm))
+            else:
+                heapq.heappush(self.queue, (self.clock + self.quantum / vm.priority, next(self.arrival), vm))
+        return bool(self.queue)
+
+    def wake(self, vm):
+        # vm's input channel was fed or closed: back into the heap at the current pass
+        self.parked.discard(vm)
+        heapq.heappush(self.queue, (self.clock, next(self.arrival), vm))
+        if self.waking is not None and not self.waking.done():
+            self.waking.set_result(None)
+
+    def run(self):
+        """Run every VM until it stops; returns the VMs in the order they were added"""
+        while self.turn():
+            pass
+        for vm in self.parked:
+            vm.stop("blocked")
+        self.parked.clear()
+        return self.vms
+
+    def expire(self):
+        # Stop the parked VMs past their timeout; returns seconds until the next one expires
+        now = time.monotonic()
+        left = None
+        for vm in list(self.parked):
+            if vm.timeout is None:
+                continue
+            remaining = vm.started + vm.timeout - now
+            if remaining <= 0:
+                self.parked.discard(vm)
+                vm.stop("timeout")
+            elif left is None or remaining < left:
+                left = remaining
+        return left
+
+    async def runAsync(self):
+        """run() that yields to the event loop between turns and waits for parked VMs' input"""
+        while self.queue or self.parked:
+            if not self.queue:
+                self.waking = asyncio.get_running_loop().create_future()
+                await asyncio.wait([self.waking], timeout=self.expire())
+                self.expire()
+                continue
+            self.turn()
+            await asyncio.sleep(0)
+        return self.vms
+
+    def report(self):
+        lines = [f"{'vm':<24} {'status':<8} {'executed':>10} {'seconds':>9}"]
+        for vm in self.vms:
+            lines.append(f"{vm.name:<24} {vm.status:<8} {vm.executed:>10} {vm.elapsed:>9.4f}"
+                         + (f"  {vm.error}" if vm.error else ""))
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several .inc programs interleaved in one process")
+    parser.add_argument("programs", nargs="+", help=".inc files to run")
+    parser.add_argument("--quantum", type=int, default=QUANTUM, help="instructions per turn")
+    parser.add_argument("--budget", type=int, default=None, help="instructions per program before it is stopped")
+    parser.add_argument("--timeout", type=float, default=None, help="wall-clock seconds per program")
+    parser.add_argument("--native", action="store_true", help="use NativeStorage registers and memory")
+    parser.add_argument("--input", type=float, nargs="*", default=[], help="values every program's SCAN reads")
+    args = parser.parse_args()
+
+    scheduler = Scheduler(args.quantum)
+    for filename in args.programs:
+        machine = storage.Machine(args.native)
+        machine.input = devices.InputChannel(args.input)
+        program = Program(Program.readFile(filename), machine, tracer=tracing.Tracer(tracing.OFF))
+        scheduler.add(program, name=filename, budget=args.budget, timeout=args.timeout)
+    start = time.perf_counter()
+    scheduler.run()
+    print(scheduler.report())
+    print(f"[INFO] {sum(vm.executed for vm in scheduler.vms)} instructions in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,108 @@
+# statediff.py - Compact serialization of Machine.diff() change sets
+#
+# A diff maps each storage ("variable", "register", "memory") to the cells that
+# changed since Machine.snapshot() / Machine.checkpoint(): address -> the stored
+# 32-bit word as an int (instruction words included), None for a removed cell.
+# Addresses are numbers or register/symbol names.
+#
+# JSON form: {"variable": [[address, value], ...], "register": [...], "memory": [...]}
+# (pairs, so numeric and named addresses keep their types).
+#
+# Binary layout (little endian):
+#   header   magic "ISKD", version, cell count per storage (3 x uint32)
+#   cells    kind byte, address, value:
+#              kind bit 0: named address (uint16 length, utf-8) else a double
+#              kind bits 1-2: value is 0 none, 1 uint32 word, 2 string (uint16 length, utf-8)
+#
+#   diff = machine.diff()
+#   assert statediff.loads(statediff.dumps(diff)) == diff
+
+import json
+import struct
+
+import storage
+
+MAGIC = b"ISKD"
+VERSION = 1
+HEADER = struct.Struct("<4sHIII")
+KIND = struct.Struct("<B")
+NUMBER = struct.Struct("<d")
+WORD = struct.Struct("<I")
+LENGTH = struct.Struct("<H")
+
+
+def toJSON(diff):
+    return json.dumps({name: [[address, value] for address, value in diff.get(name, {}).items()]
+                       for name in storage.parts}, separators=(",", ":"))
+
+
+def fromJSON(text):
+    return {name: {address: value for address, value in cells} for name, cells in json.loads(text).items()}
+
+
+def packText(text):
+    raw = text.encode()
+    return LENGTH.pack(len(raw)) + raw
+
+
+def unpackText(data, at):
+    length, = LENGTH.unpack_from(data, at)
+    at += LENGTH.size
+    return data[at:at + length].decode(), at + length
+
+
+def dumps(diff):
+    """Binary form of a Machine.diff() result"""
+    parts = [diff.get(name, {}) for name in storage.parts]
+    out = [HEADER.pack(MAGIC, VERSION, *[len(cells) for cells in parts])]
+    for cells in parts:
+        for address, value in cells.items():
+            kind = (isinstance(address, str)) | (0 if value is None else 2 if isinstance(value, int) else 4)
+            out.append(KIND.pack(kind))
+            out.append(packText(address) if kind & 1 else NUMBER.pack(address))
+            if kind & 6 == 2:
+                out.append(WORD.pack(value))
+            elif kind & 6 == 4:
+                out.append(packText(value))
+    return b"".join(out)
+
+
+def loads(data):
+    magic, version, *counts = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a version {VERSION} state diff")
+    at = HEADER.size
+    diff = {}
+    for name, count in zip(storage.parts, counts):
+        cells = diff[name] = {}
+        for _ in range(count):
+            kind, = KIND.unpack_from(data, at)
+            at += KIND.size
+            if kind & 1:
+                address, at = unpackText(data, at)
+            else:
+                address, = NUMBER.unpack_from(data, at)
+                at += NUMBER.size
+                if address.is_integer():
+                    address = int(address)
+            value = None
+            if kind & 6 == 2:
+                value, = WORD.unpack_from(data, at)
+                at += WORD.size
+            elif kind & 6 == 4:
+                value, at = unpackText(data, at)
+            cells[address] = value
+    return diff
+
+
+def compare(old, new):
+    """Cells on which two diffs disagree: {name: {address: (old value, new value)}},
+    with "unchanged" standing for a cell that only one of them lists"""
+    result = {}
+    for name in storage.parts:
+        a, b = old.get(name, {}), new.get(name, {})
+        cells = {address: (a.get(address, "unchanged"), b.get(address, "unchanged"))
+                 for address in a.keys() | b.keys() if a.get(address, "unchanged") != b.get(address, "unchanged")}
+        if cells:
+            result[name] = cells
+    return result
@@ -1,12 +1,60 @@
 from convert import Precision, Length
-import copy
+from array import array
+import mmap
+import devices
+
+# 32-bit string <-> number conversions are pure, so Storage.get/put memoize them
+spbinValues = {}
+valueSpbins = {}
+memo_len = 1<<16	# entries per memo before it is dropped and rebuilt
+def spbin2dec(word):
+	value = spbinValues.get(word)
+	if value is None:
+		if len(spbinValues) >= memo_len:
+			spbinValues.clear()
+		value = spbinValues[word] = Precision.spbin2dec(word)
+	return value
+def dec2spbin(value):
+	word = valueSpbins.get(value)
+	if word is None:
+		if len(valueSpbins) >= memo_len:
+			valueSpbins.clear()
+		word = valueSpbins[value] = Precision.dec2spbin(value)
+	return word
+
+missing = object()	# journal entry of an address that held nothing (see Storage.track)
+def diffValue(value):
+	# stored value as reported by Storage.changes: the 32-bit word as an int, None when absent
+	if value is missing:
+		return None
+	if type(value)!=type(str()):
+		value = dec2spbin(value)
+	if len(value)!=Length.precision:
+		return value
+	if "-" in value:
+		# dec2spbin writes a negative fraction field for 0 < |x| < 1: report the packed word
+		return int(Precision.dec2spword([Precision.spbin2dec(value)])[0])
+	return int(value,2)
 
 class Storage:
-	def __init__(self, data={}):
-		self.data = copy.deepcopy(data)
+	def __init__(self, data={}, codeBase=0, codeLen=0):
+		self.data = dict(data)	# values are strings and numbers: a shallow copy is enough
+		self.decoded = {}	# per-address decoded instructions (see Program.decode)
+		# instruction region codeBase..codeBase+codeLen-1, packed as unsigned 32-bit words
+		self.codeBase = codeBase
+		self.code = array('I', bytes(4*codeLen))
+		self.codeVersion = 0	# bumped on every write into the instruction region (see jit.Translator)
+		self.journal = None	# address -> what it held before its first write since track() (see Machine.snapshot)
+	def inCode(self, address):
+		return type(address)!=type(str()) and 0 <= address-self.codeBase < len(self.code)
 	def load(self, address, isCode=False):
 		if type(address)==type(str()) and len(address)==Length.precision:
 			address = Precision.spbin2dec(address)
+		if self.inCode(address):
+			word = self.code[int(address)-self.codeBase]
+			if isCode:
+				return word
+			return Precision.spbin2dec(Length.addZeros(word,Length.instrxn))
 		value = self.data[address]
 		if not isCode and isinstance(value, str) and len(value) == Length.precision:
 			value = Precision.spbin2dec(value)
@@ -14,20 +62,105 @@ class Storage:
 	def store(self,address,value):
 		if type(address)==type(str()) and len(address)==Length.precision:
 			address = Precision.spbin2dec(address)
-		if type(value)==type(str()):
+		if self.journal is not None and address not in self.journal:
+			self.remember(address)
+		if address in self.decoded:
+			del self.decoded[address]
+		if self.inCode(address):
+			# a 32-bit string is taken as the word itself, a number as its single precision bits
+			if type(value)==type(str()):
+				word = int(value,2)
+			else:
+				word = int(Precision.dec2spword([value])[0])
+			self.code[int(address)-self.codeBase] = word & 0xFFFFFFFF
+			self.codeVersion += 1
+		elif type(value)==type(str()):
 			self.data[address] = value
 		else:
 			self.data[address] = Precision.dec2spbin(value)
+	def resolve(self, address):
+		"""Key holding `address` (32-bit string addresses decoded), None when nothing is stored there"""
+		if type(address)==type(str()) and len(address)==Length.precision:
+			address = Precision.spbin2dec(address)
+		if address in self.data or self.inCode(address):
+			return address
+		return None
+	def get(self, address):
+		"""load() for a number, register name or resolve() key: no address decoding, KeyError on a miss"""
+		if self.inCode(address):
+			return spbin2dec(Length.addZeros(self.code[int(address)-self.codeBase],Length.instrxn))
+		value = self.data[address]
+		if isinstance(value, str) and len(value) == Length.precision:
+			value = spbin2dec(value)
+		return value
+	def put(self, address, value):
+		"""store() for a number, register name or resolve() key and a numeric value"""
+		if self.inCode(address):
+			return self.store(address, value)
+		if self.journal is not None and address not in self.journal:
+			self.remember(address)
+		self.data[address] = dec2spbin(value)
 	def setStorage(self,stolen):
+		zero = Precision.dec2spbin(0)
 		for i in range(stolen):
-			try:
-				self.load(i)
-			except:
-				self.store(i,0)
+			if i not in self.data and not self.inCode(i):
+				self.data[i] = zero
+	# snapshot support: capture/reinstate copy everything, track/rollback undo only what changed
+	def capture(self):
+		return dict(self.data), array('I', self.code)
+	def reinstate(self, state):
+		self.data = dict(state[0])
+		self.code[:] = state[1]
+		self.decoded.clear()
+		self.codeVersion += 1
+	def track(self):
+		"""Start recording the first write to every address (rollback() undoes them)"""
+		self.journal = {}
+	def remember(self, address):
+		if self.inCode(address):
+			self.journal[address] = self.code[int(address)-self.codeBase]
+		else:
+			self.journal[address] = self.data.get(address, missing)
+	def rollback(self):
+		"""Undo every write since track() (or the last rollback) and keep tracking"""
+		for address, old in self.journal.items():
+			if self.inCode(address):
+				self.undoCode(address, old)
+			elif old is missing:
+				self.data.pop(address, None)
+			else:
+				self.data[address] = old
+		self.journal.clear()
+	def changes(self):
+		"""(address, value) for every address whose content differs from when track() was
+		called; value is the stored 32-bit word as an int (instruction words included),
+		None once nothing is stored there"""
+		if self.journal is None:
+			raise Exception("No checkpoint: call Machine.snapshot() or Machine.checkpoint() first")
+		for address, old in self.journal.items():
+			value = self.changed(address, old)
+			if value is not missing:
+				yield address, value
+	def changed(self, address, old):
+		# diffValue of address if it no longer holds its journaled content, else missing
+		if self.inCode(address):
+			word = self.code[int(address)-self.codeBase]
+			return word if word != old else missing
+		value = self.data.get(address, missing)
+		return diffValue(value) if value != old else missing
+	def undoCode(self, address, word):
+		self.decoded.pop(address, None)
+		self.code[int(address)-self.codeBase] = word
+		self.codeVersion += 1
+	def items(self):
+		"""(address, value) pairs with values in their stored (32-bit string) form"""
+		yield from self.data.items()
+		for i,word in enumerate(self.code):
+			yield self.codeBase+i,Length.addZeros(word,Length.instrxn)
 	def dispStorage(self):
-		for k,v in self.data.items():
+		for k,v in self.items():
 			if isinstance(v, str) and len(v) == Length.precision:
-				if k >= 8 and k < 72:  # Instruction memory range
+				if self.inCode(k):  # Instruction memory range
 					print(f"{k}: {v} (instruction)")
 				else:
 					print(f"{k}: {v} = {Precision.spbin2dec(v)}")
@@ -42,23 +175,36 @@ class Storage:
 
 	# New methods for instruction handling
 	def loadInstruction(self, address):
-		"""Load an instruction without converting to decimal"""
+		"""Load an instruction word (unsigned 32-bit int) without converting to decimal"""
 		if type(address)==type(str()) and len(address)==Length.precision:
 			address = Precision.spbin2dec(address)
-		return self.data[address]
+		if self.inCode(address):
+			return self.code[int(address)-self.codeBase]
+		return int(self.data[address],2)
+
+	def storeInstruction(self, address, word):
+		"""Store an instruction word (unsigned 32-bit int) into the instruction region"""
+		if not self.inCode(address):
+			raise ValueError(f"Address {address} is outside the instruction region ({self.codeBase}-{self.codeBase+len(self.code)-1})")
+		if self.journal is not None and address not in self.journal:
+			self.remember(address)
+		if address in self.decoded:
+			del self.decoded[address]
+		self.code[int(address)-self.codeBase] = word
+		self.codeVersion += 1
 
 	def dispInstructionMemory(self):
 		"""Display instruction memory separately"""
-		print("\nInstruction Memory (8-71):")
-		for k in range(8, 72):
-			if k in self.data:
-				print(f"{k}: {self.data[k]}")
+		codeEnd = self.codeBase+len(self.code)
+		print(f"\nInstruction Memory ({self.codeBase}-{codeEnd-1}):")
+		for k in range(self.codeBase, codeEnd):
+			print(f"{k}: {Length.addZeros(self.loadInstruction(k),Length.instrxn)}")
 
 	def dispDataMemory(self):
 		"""Display data memory separately"""
 		print("\nData Memory:")
-		for k,v in self.data.items():
-			if k < 8 or k >= 72:  # Skip instruction memory range
+		for k,v in self.items():
+			if not self.inCode(k):  # Skip instruction memory range
 				if isinstance(v, str) and len(v) == Length.precision:
 					print(f"{k}: {v} = {Precision.spbin2dec(v)}")
 				else:
@@ -67,7 +213,7 @@ class Storage:
 	def dispRegisters(self):
 		"""Display registers with their values"""
 		print("\nRegisters:")
-		for k,v in self.data.items():
+		for k,v in self.items():
 			if isinstance(k, str):  # Named registers
 				if isinstance(v, str) and len(v) == Length.precision:
 					print(f"{k}: {v} = {Precision.spbin2dec(v)}")
@@ -103,36 +249,455 @@ class Storage:
 		self.storeRegisterValue("SPR", new_value)
 
 	@staticmethod
-	# predefined values
-	def setVariable(var,name,addr,value):
-		variable.store(name,addr)
+	# predefined values (symbols defaults to the module symbol table)
+	def setVariable(var,name,addr,value,symbols=None):
+		symbols = symbols or default().variable
+		symbols.store(name,addr)
 		var.store(addr,value)
-	def setVariables(name,base,stolen=0):
+	def setVariables(name,base,stolen=0,symbols=None):
+		symbols = symbols or default().variable
 		if len(name)>1:
 			stolen = len(name)
 		for i in range(stolen):
 			if len(name)>1:
-				variable.store(name[i],base+i)
+				symbols.store(name[i],base+i)
 			else:
-				variable.store(name+str(i+1),base+i)
+				symbols.store(name+str(i+1),base+i)
 	# temporary values
 	def setTmpVariable(name,addr,startswith="tmp_"):
-		data[0].store(startswith+name,addr)
+		default().variable.store(startswith+name,addr)
 	def setTmpVariables(name_arr,addr_arr,startswith="tmp_"):
 		for name,addr in zip(name_arr,addr_arr):
-			data[0].store(startswith+name,addr)
+			default().variable.store(startswith+name,addr)
 	def removeVariables(startsWith="tmp_"):
-		data[0] = {key: value for key, value in variable.items() if not key.startswith(startsWith)}
+		symbols = default().variable
+		symbols.data = {key: value for key, value in symbols.data.items() if not key.startswith(startsWith)}
 	def removeVariable(name,startsWith="tmp_"):
-		data[0].pop(startsWith+name)
+		default().variable.data.pop(startsWith+name)
 	
 
-			
-memory = Storage()
-register = Storage()
+
+class NativeStorage(Storage):
+	"""Storage engine that keeps the numbered slots as native doubles in an array('d').
+
+	Slots 0..size-1 always exist (zero-filled). Named keys and 32-bit strings stay
+	in self.data and instruction words in the code array; the single precision
+	encoding of a numeric slot is only produced when it is asked for (items).
+	"""
+	def __init__(self, size, data={}, codeBase=0, codeLen=0):
+		Storage.__init__(self, data, codeBase, codeLen)
+		self.size = size
+		self.values = array('d', bytes(8*size))
+	def slot(self, address):
+		if type(address)==type(str()) or not 0 <= address < self.size:
+			raise KeyError(address)
+		return int(address)
+	def resolve(self, address):
+		if type(address)==type(str()) and len(address)==Length.precision:
+			address = Precision.spbin2dec(address)
+		if address in self.data or self.inCode(address) or type(address)!=type(str()) and 0 <= address < self.size:
+			return address
+		return None
+	def get(self, address):
+		if address in self.data or self.inCode(address):
+			return Storage.get(self, address)
+		return self.values[self.slot(address)]
+	def put(self, address, value):
+		if type(address)!=type(str()) and 0 <= address < self.size and address not in self.data and not self.inCode(address):
+			if self.journal is not None and address not in self.journal:
+				self.remember(address)
+			self.values[int(address)] = value
+		else:
+			self.store(address, value)
+	def load(self, address, isCode=False):
+		if type(address)==type(str()) and len(address)==Length.precision:
+			address = Precision.spbin2dec(address)
+		if address in self.data or self.inCode(address):
+			return Storage.load(self, address, isCode)
+		return self.values[self.slot(address)]
+	def store(self,address,value):
+		if type(address)==type(str()) and len(address)==Length.precision:
+			address = Precision.spbin2dec(address)
+		if self.inCode(address):
+			return Storage.store(self, address, value)
+		if self.journal is not None and address not in self.journal:
+			self.remember(address)
+		if type(value)!=type(str()) and type(address)!=type(str()) and 0 <= address < len(self.values):
+			self.values[int(address)] = value
+			if address in self.data:
+				del self.data[address]
+		else:
+			self.data[address] = value
+	def loadInstruction(self, address):
+		if type(address)==type(str()) and len(address)==Length.precision:
+			address = Precision.spbin2dec(address)
+		if address in self.data or self.inCode(address):
+			return Storage.loadInstruction(self, address)
+		return int(Precision.dec2spword([self.values[self.slot(address)]])[0])
+	def capture(self):
+		return Storage.capture(self) + (array('d', self.values),)
+	def reinstate(self, state):
+		Storage.reinstate(self, state)
+		self.values[:] = state[2]
+	def numbered(self, address):
+		return type(address)!=type(str()) and 0 <= address < self.size and not self.inCode(address)
+	def remember(self, address):
+		if self.numbered(address):
+			# a numbered slot lives in values, or in data while it holds a string
+			self.journal[address] = (self.data.get(address, missing), self.values[int(address)])
+		else:
+			Storage.remember(self, address)
+	def rollback(self):
+		for address, old in self.journal.items():
+			if self.inCode(address):
+				self.undoCode(address, old)
+				continue
+			if self.numbered(address):
+				old, self.values[int(address)] = old
+			if old is missing:
+				self.data.pop(address, None)
+			else:
+				self.data[address] = old
+		self.journal.clear()
+	def changed(self, address, old):
+		if not self.numbered(address):
+			return Storage.changed(self, address, old)
+		value = self.data.get(address, missing)
+		if (value, self.values[int(address)]) == old:
+			return missing
+		return diffValue(self.values[int(address)] if value is missing else value)
+	def items(self):
+		for k,v in self.data.items():
+			if type(v)!=type(str()):
+				v = Precision.dec2spbin(v)
+			yield k,v
+		for i,word in enumerate(self.code):
+			yield self.codeBase+i,Length.addZeros(word,Length.instrxn)
+		for k,v in enumerate(self.values):
+			if k not in self.data and not self.inCode(k):
+				yield k,Precision.dec2spbin(v)
+
+class PagedStorage(NativeStorage):
+	"""NativeStorage over a sparse address space of fixed-size pages.
+
+	A page of doubles is allocated, zero-filled, on the first store into it; loads
+	from untouched pages return 0 without allocating anything, and items() only
+	lists touched pages. With `path` the pages are windows of a sparse file mapped
+	with mmap, so an address space larger than RAM costs only the pages written.
+	"""
+	def __init__(self, size, pageSize=None, path=None, data={}, codeBase=0, codeLen=0):
+		Storage.__init__(self, data, codeBase, codeLen)
+		self.size = size
+		self.pageSize = pageSize or page_len
+		self.pages = {}	# page number -> array('d') (or memoryview of the mapped file)
+		self.saved = {}	# page number -> copy taken before its first write since track(), None if untouched
+		self.file = self.map = None
+		if path is not None:
+			pages = -(-size//self.pageSize)
+			self.file = open(path, "w+b")
+			self.file.truncate(8*self.pageSize*pages)
+			self.map = mmap.mmap(self.file.fileno(), 8*self.pageSize*pages)
+	def page(self, number):
+		page = self.pages.get(number)
+		if page is None:
+			if self.map is None:
+				page = array('d', bytes(8*self.pageSize))
+			else:
+				start = 8*self.pageSize*number
+				page = memoryview(self.map)[start:start+8*self.pageSize].cast('d')
+			self.pages[number] = page
+		return page
+	def load(self, address, isCode=False):
+		if type(address)==type(str()) and len(address)==Length.precision:
+			address = Precision.spbin2dec(address)
+		if address in self.data or self.inCode(address):
+			return Storage.load(self, address, isCode)
+		number, offset = divmod(self.slot(address), self.pageSize)
+		page = self.pages.get(number)
+		return page[offset] if page is not None else 0.
+	def get(self, address):
+		if address in self.data or self.inCode(address):
+			return Storage.get(self, address)
+		number, offset = divmod(self.slot(address), self.pageSize)
+		page = self.pages.get(number)
+		return page[offset] if page is not None else 0.
+	def put(self, address, value):
+		if type(address)!=type(str()) and 0 <= address < self.size and address not in self.data and not self.inCode(address):
+			number, offset = divmod(int(address), self.pageSize)
+			if self.journal is not None and number not in self.saved:
+				self.save(number)
+			self.page(number)[offset] = value
+		else:
+			self.store(address, value)
+	def store(self,address,value):
+		if type(address)==type(str()) and len(address)==Length.precision:
+			address = Precision.spbin2dec(address)
+		if self.inCode(address):
+			return Storage.store(self, address, value)
+		if self.journal is not None and address not in self.journal:
+			self.remember(address)
+		if type(value)!=type(str()) and type(address)!=type(str()) and 0 <= address < self.size:
+			number, offset = divmod(int(address), self.pageSize)
+			self.page(number)[offset] = value
+			if address in self.data:
+				del self.data[address]
+		else:
+			self.data[address] = value
+	def loadInstruction(self, address):
+		if type(address)==type(str()) and len(address)==Length.precision:
+			address = Precision.spbin2dec(address)
+		if address in self.data or self.inCode(address):
+			return Storage.loadInstruction(self, address)
+		return int(Precision.dec2spword([self.load(address)])[0])
+	def capture(self):
+		return Storage.capture(self) + ({number: array('d', page) for number, page in self.pages.items()},)
+	def reinstate(self, state):
+		Storage.reinstate(self, state)
+		for number in list(self.pages):
+			if number not in state[2]:
+				self.drop(number)
+		for number, page in state[2].items():
+			self.page(number)[:] = page
+	def track(self):
+		Storage.track(self)
+		self.saved = {}
+	def remember(self, address):
+		# pages are copied whole on their first write (copy-on-write); only data entries go in the journal
+		Storage.remember(self, address)
+		if self.numbered(address) and int(address)//self.pageSize not in self.saved:
+			self.save(int(address)//self.pageSize)
+	def save(self, number):
+		page = self.pages.get(number)
+		self.saved[number] = None if page is None else array('d', page)
+	def drop(self, number):
+		page = self.pages.pop(number)
+		if self.map is not None:
+			page[:] = array('d', bytes(8*self.pageSize))
+	def rollback(self):
+		Storage.rollback(self)
+		for number, page in self.saved.items():
+			if page is None:
+				if number in self.pages:
+					self.drop(number)
+			elif self.map is None:
+				self.pages[number] = page
+			else:
+				self.pages[number][:] = page
+		self.saved = {}
+	def changed(self, address, old):
+		if not self.numbered(address):
+			return Storage.changed(self, address, old)
+		return missing	# numbered slots are compared page by page in changes()
+	def changes(self):
+		yield from Storage.changes(self)
+		for number, page in self.saved.items():
+			current = self.pages.get(number)
+			base = number*self.pageSize
+			for offset in range(min(self.pageSize, self.size-base)):
+				address = base+offset
+				if self.inCode(address):
+					continue
+				value = self.data.get(address, missing), current[offset] if current is not None else 0.
+				old = self.journal.get(address, value[0]), page[offset] if page is not None else 0.
+				if value != old:
+					yield address, diffValue(value[1] if value[0] is missing else value[0])
+	def items(self):
+		for k,v in self.data.items():
+			if type(v)!=type(str()):
+				v = Precision.dec2spbin(v)
+			yield k,v
+		for i,word in enumerate(self.code):
+			yield self.codeBase+i,Length.addZeros(word,Length.instrxn)
+		for number in sorted(self.pages):
+			page = self.pages[number]
+			for offset in range(min(self.pageSize, self.size-number*self.pageSize)):
+				k = number*self.pageSize+offset
+				if k not in self.data and not self.inCode(k):
+					yield k,Precision.dec2spbin(page[offset])
+	def close(self):
+		"""Release the mapped file (the storage is unusable afterwards)"""
+		if self.map is not None:
+			self.pages.clear()
+			self.map.close()
+			self.file.close()
+			self.file = self.map = None
+
+class StackError(Exception):
+	pass
+class StackOverflow(StackError):
+	pass
+class StackUnderflow(StackError):
+	pass
+
+class Stack:
+	"""Stack in memory base..limit-1, growing upward, with its pointer in a named register.
+
+	The pointer is kept as a native int and only decoded again when the register was
+	written by someone else (its stored value is no longer the one written here).
+	Pushing at or past limit raises StackOverflow, popping at or below base StackUnderflow.
+	"""
+	def __init__(self, register, memory, pointer="SPR", base=None, limit=None):
+		self.register = register
+		self.memory = memory
+		self.pointer = pointer
+		self.base = mspr if base is None else base
+		self.limit = mcpr if limit is None else limit
+		self.raw = self.sp = None	# stored register value the cached pointer was read from
+	def get(self):
+		raw = self.register.data.get(self.pointer, missing)
+		if raw is not self.raw:
+			self.sp = int(self.register.get(self.pointer))
+			self.raw = raw
+		return self.sp
+	def set(self, sp):
+		self.register.put(self.pointer, sp)
+		self.sp, self.raw = sp, self.register.data[self.pointer]
+	def room(self, sp, count):
+		# raise unless count more values fit above sp
+		if sp < self.base:
+			raise StackUnderflow(f"{self.pointer}={sp} is below the stack ({self.base}-{self.limit-1})")
+		if sp+count > self.limit:
+			raise StackOverflow(f"stack full: {self.pointer}={sp}, {count} more past {self.limit-1}")
+	def held(self, sp, count):
+		# raise unless count values sit below sp
+		if sp > self.limit:
+			raise StackOverflow(f"{self.pointer}={sp} is above the stack ({self.base}-{self.limit-1})")
+		if sp-count < self.base:
+			raise StackUnderflow(f"stack empty: {self.pointer}={sp}, {count} fewer past {self.base}")
+	def push(self, value):
+		sp = self.get()
+		self.room(sp, 1)
+		self.memory.put(sp, value)
+		self.set(sp+1)
+	def pop(self):
+		sp = self.get()
+		self.held(sp, 1)
+		value = self.memory.get(sp-1)
+		self.set(sp-1)
+		return value
+	def top(self):
+		sp = self.get()
+		self.held(sp, 1)
+		return self.memory.get(sp-1)
+	def reserve(self):
+		"""Claim the next slot without writing it; returns its address"""
+		sp = self.get()
+		self.room(sp, 1)
+		self.set(sp+1)
+		return sp
+	def pushMany(self, values):
+		"""Push values in order (the last ends on top) with one pointer update"""
+		sp = self.get()
+		self.room(sp, len(values))
+		for i,value in enumerate(values):
+			self.memory.put(sp+i, value)
+		self.set(sp+len(values))
+	def popMany(self, count):
+		"""Pop count values with one pointer update; returned top first"""
+		sp = self.get()
+		self.held(sp, count)
+		values = [self.memory.get(sp-1-i) for i in range(count)]
+		self.set(sp-count)
+		return values
+
+class Machine:
+	"""State of one VM: symbol table (variable), register file and memory.
+
+	Program, Instruction.encodeProgram, Access and AddressingMode take a machine
+	and default to the module-level one (storage.machine).
+
+	memLen/regLen size the address spaces and codeBase/codeLen the instruction
+	region (defaults: the map at the end of this file). With pageSize or path the
+	memory is a PagedStorage (path: mmap-backed file) and nothing is pre-filled.
+
+	The initial contents (special registers, symbols, zero-filled slots) are built once
+	per storage layout and kept in `templates`; later machines copy them in.
+	"""
+	def __init__(self, native=False, memLen=None, regLen=None, codeBase=None, codeLen=None, pageSize=None, path=None):
+		self.memLen = memLen or mem_len
+		self.regLen = regLen or reg_len
+		self.codeBase = mbr if codeBase is None else codeBase
+		self.codeEnd = self.codeBase+(codeLen or mapr-mbr)	# instructions codeBase..codeEnd-1
+		# one past the last word assembled (Instruction.encodeProgram, image.Image.apply): an
+		# empty word from there on ends a run, inside the program it is PRNT R0 (opcode 0)
+		self.programEnd = self.codeBase
+		codeLen = self.codeEnd-self.codeBase
+		self.variable = Storage()
+		if pageSize or path:
+			self.memory = PagedStorage(self.memLen, pageSize, path, codeBase=self.codeBase, codeLen=codeLen)
+			self.register = NativeStorage(self.regLen)
+		elif native:
+			self.memory = NativeStorage(self.memLen, codeBase=self.codeBase, codeLen=codeLen)
+			self.register = NativeStorage(self.regLen)
+		else:
+			self.memory = Storage(codeBase=self.codeBase, codeLen=codeLen)	# instructions 8-71
+			self.register = Storage()
+		self.data = [self.variable, self.register, self.memory]
+		key = (type(self.register), type(self.memory), self.memLen, self.regLen, self.codeBase, codeLen)
+		template = templates.get(key)
+		if template is None:
+			self.initialize()
+			template = templates[key] = tuple(part.capture() for part in self.data)
+		else:
+			for part, state in zip(self.data, template):
+				part.reinstate(state)
+		self.stack = Stack(self.register, self.memory, "SPR")	# PUSH/POP, stack operands, CALL/RET
+		self.active = None	# snapshot the storages are tracking writes for
+		self.output = devices.OutputChannel()	# PRNT (stdout)
+		self.input = devices.InputChannel()	# SCAN (empty: reads 0)
+	def initialize(self):
+		for i in range(len(register_list)):
+			Storage.setVariable(self.register,register_list[i],br+i,memory_list[i],self.variable)
+		Storage.setVariables("R",varpr,var_reglen,self.variable)	# R1 to R7
+		Storage.setVariables("M",varpr,var_reglen,self.variable)	# M1 to M7
+		Storage.setVariables("A",apr,array_reglen,self.variable)	# A1 to A4
+		Storage.setVariables("I",apr+array_reglen,index_reglen,self.variable)	# I1 to I2
+		if type(self.register) is Storage:
+			self.register.setStorage(self.regLen)
+		if type(self.memory) is Storage:
+			self.memory.setStorage(self.memLen)
+		# the pointer Stack moves starts where the SPR register points (the bottom of the stack, mspr)
+		self.register.store("SPR", self.register.load(br+register_list.index("SPR")))
+	def snapshot(self):
+		"""Capture symbols, registers and memory (instruction region included).
+
+		Taken once, e.g. after Program has loaded its code; from then on every storage
+		records the first write to each address (PagedStorage: each page), so restoring
+		the latest snapshot only puts back what a run changed.
+		"""
+		snapshot = [part.capture() for part in self.data]
+		for part in self.data:
+			part.track()
+		self.active = snapshot
+		return snapshot
+	def checkpoint(self):
+		"""Start tracking writes like snapshot() without copying the state (diff() only)"""
+		for part in self.data:
+			part.track()
+		self.active = None
+	def diff(self):
+		"""Cells changed since the last snapshot() or checkpoint():
+		{"variable"|"register"|"memory": {address: 32-bit word as int, None if removed}}
+		(see Storage.changes; statediff.py serializes it)"""
+		return {name: dict(part.changes()) for name, part in zip(parts, self.data)}
+	def restore(self, snapshot):
+		"""Return to `snapshot`: undoes the tracked writes, or copies it back if it is not the latest"""
+		if snapshot is self.active:
+			for part in self.data:
+				part.rollback()
+			return
+		for part, state in zip(self.data, snapshot):
+			part.reinstate(state)
+			part.track()
+		self.active = snapshot
+
+reg_len = 32
+mem_len = 256
+page_len = 4096	# slots per PagedStorage page
+parts = ["variable", "register", "memory"]	# Machine.data order, as named in Machine.diff
+native = False	# True: registers and memory use NativeStorage instead of 32-bit strings
 # R#, A#, I#, others
 register_list = ["BR","DR1","DR2","FR","IR","PC","SPR","TSP","CPR","NCP","BPR","NBP","VPR","NVP","MPR","NMP"]
-variable = Storage()
 #Registers
 br = 8	# acc = 9; ir = 12;
 		# pc = 13; spr = 14; cpr = 16;
@@ -146,8 +711,6 @@ mbpr = 168
 mvpr = 200
 mmpr = 216
 memory_list = [mbr,0,0,0,mbr,mbr,mspr,mspr,mcpr,mcpr,mbpr,mbpr,mvpr,mvpr,mmpr,mmpr]
-for i in range(len(register_list)):
-	Storage.setVariable(register,register_list[i],br+i,memory_list[i])
 # Storage.setVariable(register,"BR",br,mbr)
 # Storage.setVariable(register,"DR1",br+1,0)
 # Storage.setVariable(register,"DR2",br+2,0)
@@ -166,26 +729,35 @@ for i in range(len(register_list)):
 # Storage.setVariable(register,"NMP",br+15,mmpr+1)
 varpr = 1
 var_reglen = 7
-Storage.setVariables("R",varpr,var_reglen)	# R1 to R7
-Storage.setVariables("M",varpr,var_reglen)	# M1 to M7
 apr = 24
 array_reglen = 4
 index_reglen = 2
-Storage.setVariables("A",apr,array_reglen)	# A1 to A4
-Storage.setVariables("I",apr+array_reglen,index_reglen)	# I1 to I2
-reg_len = 32
-register.setStorage(reg_len)
-mem_len = 256
-memory.setStorage(mem_len)
-data = [variable, register, memory]
-#printing the specified list
-toShowStr = "000"
-toShow = [c=='1' for c in toShowStr]
-label = ["Variable", "Register", "Memory"]
-for i,show in enumerate(toShow):
-	if show:
-		print(label[i])
-		data[i].dispStorage()
+templates = {}	# storage layout -> initial Machine contents (see Machine.__init__)
+
+# The module-level machine (storage.machine, .variable, .register, .memory, .data) is
+# only built when first used, so importing storage costs nothing more than the module.
+def default():
+	global machine, variable, register, memory, data
+	if "machine" not in globals():
+		machine = Machine(native)
+		variable, register, memory = machine.variable, machine.register, machine.memory
+		data = machine.data
+	return machine
+def __getattr__(name):
+	if name in ("machine", "variable", "register", "memory", "data"):
+		default()
+		return globals()[name]
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if __name__ == "__main__":
+	#printing the specified list
+	toShowStr = "000"
+	toShow = [c=='1' for c in toShowStr]
+	label = ["Variable", "Register", "Memory"]
+	for i,show in enumerate(toShow):
+		if show:
+			print(label[i])
+			default().data[i].dispStorage()
 """
 Storages:
 Variable		Storage for special values in register and memory (variables, blocks, specialialized registers,etc.)
@@ -193,6 +765,24 @@ Variable		Storage for special values in register and memory (variables, blocks,
 Memory			Storage that mimics the computer memory with 256 slots (contains 32-bit instruction, 32-bit Precision values)
 Registers		Storage that mimics the computer register with 32 slots (contains only 32-bit Precision values)
 
+The sizes and the instruction region below are the defaults (mem_len, reg_len, mbr, mapr).
+Machine(memLen=, regLen=, codeBase=, codeLen=) configures them per machine, and
+Machine(pageSize=, path=) backs memory with PagedStorage: pages allocated on first touch,
+optionally in an mmap-backed file. Operand address fields stay 8 bits wide; cells above
+255 are reached through register, indirect and stack operands.
+
+Machine.snapshot() captures all three storages once (e.g. after a Program has loaded);
+Machine.restore(snapshot) then undoes only the addresses (pages for PagedStorage)
+written since, so many runs of one assembled program skip Machine() and assembly.
+Machine.stack (SPR) is the one stack PUSH/POP, the stack push/pop operands and CALL/RET
+share; it manages the stack region mspr..mcpr-1 (112-151), starts empty where the SPR
+register points (mspr) and raises StackOverflow/StackUnderflow outside it. TSP is
+reserved and nothing reads it.
+Machine.checkpoint() starts the same tracking without the copy; Machine.diff() lists
+the cells changed since either one (statediff.py serializes it as JSON or binary).
+Machine.output and Machine.input are the PRNT/SCAN channels (devices.py); they are not
+part of the captured state.
+
 Memmory:
 1-7 	GPM							(M#)
 8-71 	Instructions				(Y)
@@ -214,7 +804,7 @@ Register
 	12	Instruction Register		(IR)
 	13	Program Counter				(PC)
 	14	Stack Pointer				(SPR)
-	15	Top Stack Pointer			(TSP)
+	15	Top Stack Pointer			(TSP) - Non-Functional
 	16	Constant Pointer			(CPR)
 	17	Next Constant Pointer		(NCP)
 	18	Block Pointer				(BPR)
@@ -0,0 +1,139 @@
+# synth.py - Synthetic .inc programs with a configurable instruction mix
+#
+# A program is a short prologue (array pointers in M1-M7, a few register constants)
+# followed by instructions drawn from four kinds, weighted by the mix:
+#   arithmetic  ADD/SUB/MUL/DIV/MOD on registers and small immediates
+#   stack       balanced PUSH/POP runs on the SPR stack
+#   memory      direct, indirect and register indirect moves through the M1-M7 pointers
+#   jump        forward JMPs over one or two instructions
+#   loop        a counted loop: MOV R31, k / ADD, SUB, MOD and memory body / SUB R31, 1 /
+#               JGT label, R31, R0 (nothing else writes R31 or R0, so it runs k times)
+# Every program ends in EOP and fits the instruction region (64 words). JMPs only go
+# forward: an unconditional backward JMP never terminates.
+#
+#   python synth.py programs/ --count 20 --length 60 --mix arithmetic=3,memory=1
+
+import argparse
+import os
+import random
+
+import storage
+
+KINDS = ("arithmetic", "stack", "memory", "jump", "loop")
+
+MIXES = {
+    "arithmetic": {"arithmetic": 1},
+    "stack": {"stack": 1},
+    "memory": {"memory": 1},
+    "jump": {"jump": 1},
+    "loop": {"loop": 1},
+    "mixed": {"arithmetic": 2, "stack": 1, "memory": 1, "jump": 1, "loop": 1},
+}
+
+MAX_LENGTH = storage.mapr - storage.mbr     # instruction words, EOP included
+REGISTERS = ["R%d" % i for i in range(1, 8)]
+POINTERS = ["M%d" % i for i in range(1, 8)]
+ARRAY = (storage.mapr, storage.mspr)        # M# pointers and R1 point into the array region
+COUNTER = "R31"                             # loop counter; R0 stays 0 for the loop test
+LOOP_WORDS = 4                              # shortest loop: MOV, one body word, SUB, JGT
+
+
+def parseMix(text):
+    # "arithmetic=3,stack=1" or a preset name -> {kind: weight}
+    if text in MIXES:
+        return dict(MIXES[text])
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in KINDS:
+            raise ValueError(f"unknown instruction kind {kind!r} (expected one of {', '.join(KINDS)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def prologue(rng):
+    lines = [f"MOV {pointer}, {rng.randrange(*ARRAY)}" for pointer in POINTERS]
+    lines.append(f"MOV R1, {rng.randrange(*ARRAY)}")
+    lines += [f"MOV {register}, {rng.randint(1, 9)}" for register in REGISTERS[1:]]
+    return lines
+
+
+def arithmetic(rng, room, ops=("ADD", "SUB", "MUL", "DIV", "MOD")):
+    op = rng.choice(ops)
+    source = rng.choice(REGISTERS[1:] + [str(rng.randint(1, 9))])
+    return [f"{op} {rng.choice(REGISTERS[1:])}, {source}"]
+
+
+def stack(rng, room):
+    depth = min(rng.randint(1, 4), room // 2)
+    pushes = [f"PUSH {rng.choice(REGISTERS)}" for _ in range(depth)]
+    pops = [f"POP {rng.choice(REGISTERS[1:])}" for _ in range(depth)]
+    return pushes + pops
+
+
+def memory(rng, room):
+    pointer = rng.choice(POINTERS)
+    register = rng.choice(REGISTERS[1:])
+    return [rng.choice([f"MOV {register}, *{pointer}", f"MOV *{pointer}, {register}",
+                        f"MOV {register}, {pointer}", f"MOV {register}, *R1", f"MOV *R1, {register}"])]
+
+
+def jump(rng, room):
+    skipped = min(rng.randint(1, 2), room - 1)
+    return ["JMP {}"] + [f"MOV {rng.choice(REGISTERS[1:])}, {rng.randint(1, 9)}" for _ in range(skipped)]
+
+
+def loop(rng, room):
+    body = []
+    for _ in range(rng.randint(1, min(3, room - 3))):
+        # no MUL/DIV: repeated every iteration they would compound to huge values
+        body += arithmetic(rng, room, ("ADD", "SUB", "MOD")) if rng.random() < 0.5 else memory(rng, room)
+    return ([f"MOV {COUNTER}, {rng.randint(2, 5)}", "LOOP{}:"] + body
+            + [f"SUB {COUNTER}, 1", f"JGT LOOP{{}}, {COUNTER}, R0"])
+
+
+GENERATORS = {"arithmetic": arithmetic, "stack": stack, "memory": memory, "jump": jump, "loop": loop}
+
+
+def generate(length=MAX_LENGTH, mix="mixed", seed=0):
+    """Source lines of one program with `length` instruction words (EOP included)"""
+    rng = random.Random(seed)
+    mix = parseMix(mix) if isinstance(mix, str) else mix
+    kinds = [kind for kind in KINDS if mix.get(kind)]
+    weights = [mix[kind] for kind in kinds]
+    length = max(1, min(length, MAX_LENGTH))
+    lines = prologue(rng)[:length - 1]
+    words = len(lines)                      # instruction words so far (labels take none)
+    while words < length - 1:
+        room = length - 1 - words
+        kind = rng.choices(kinds, weights)[0]
+        if kind in ("stack", "jump") and room < 2 or kind == "loop" and room < LOOP_WORDS:
+            kind = "arithmetic"
+        part = GENERATORS[kind](rng, room)
+        size = sum(not line.endswith(":") for line in part)
+        if part[0] == "JMP {}":
+            # jump over the rest of the part: target is the address after it
+            part[0] = part[0].format(storage.mbr + words + size)
+        elif kind == "loop":
+            # the label is named after the address of the first body word
+            part = [line.replace("{}", str(storage.mbr + words + 1)) for line in part]
+        lines += part
+        words += size
+    return lines + ["EOP"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic .inc programs")
+    parser.add_argument("directory", help="output directory")
+    parser.add_argument("--count", type=int, default=10, help="programs to write")
+    parser.add_argument("--length", type=int, default=MAX_LENGTH, help=f"instruction words per program (max {MAX_LENGTH})")
+    parser.add_argument("--mix", default="mixed", help=f"preset ({', '.join(MIXES)}) or kind=weight,...")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first program")
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    for i in range(args.count):
+        path = os.path.join(args.directory, f"synth_{args.seed + i:04d}.inc")
+        with open(path, "w") as f:
+            f.write("\n".join(generate(args.length, args.mix, args.seed + i)) + "\n")
+    print(f"[INFO] Wrote {args.count} programs to {args.directory}")
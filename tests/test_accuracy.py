@@ -0,0 +1,26 @@
+# accuracy.sweepChunk: both encoders, and the columns flagging where they part ways
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import accuracy
+
+
+def test_sweep_chunk_flags_scalar_strings_below_one():
+    # 0.00 .. 1.99 at two places: the scalar path round-trips every value, but writes
+    # malformed strings for 0 < x < 1 except the powers of two 0.25 and 0.5
+    bands, samples = accuracy.sweepChunk(0, 200, 2, 8, 23, show=3)
+    totals = {column: sum(counts[column][0] for _, counts in bands.values())
+              for column in accuracy.columns(accuracy.ENCODERS)}
+    assert totals["scalar"] == totals["bulk"] == 0
+    assert totals["malformed"] == totals["disagree"] == 99 - 2
+    assert all(counts["malformed"][0] == 0 for band, (_, counts) in bands.items() if band >= 0)
+    assert [sample[:2] for sample in samples if sample[0] == "malformed"] == [("malformed", .01), ("malformed", .02), ("malformed", .03)]
+    assert "-" in samples[0][2]
+
+
+def test_columns():
+    assert accuracy.columns(("bulk",)) == ["bulk"]
+    assert accuracy.columns(("scalar",)) == ["scalar", "malformed"]
+    assert accuracy.columns(accuracy.ENCODERS) == ["scalar", "malformed", "bulk", "disagree"]
@@ -0,0 +1,43 @@
+# batch.runFile: status, limits and the reported state (batch.py)
+
+import batch
+
+HANG = "MOV R1, 5\nL:\nJMP L\n"
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_ok(tmp_path):
+    result = batch.runFile(write(tmp_path, "ok.inc", "MOV R1, 5\nADD R1, 2\nEOP\n"))
+    assert (result["status"], result["error"]) == ("ok", "")
+    assert result["registers"]["1"] == 7
+
+
+def test_budget(tmp_path):
+    result = batch.runFile(write(tmp_path, "hang.inc", HANG), budget=5000, timeout=None)
+    assert result["status"] == "budget"
+    assert result["error"] == "stopped after 5000 instructions"
+    assert result["registers"]["1"] == 5
+
+
+def test_timeout(tmp_path):
+    result = batch.runFile(write(tmp_path, "hang.inc", HANG), budget=None, timeout=0.05)
+    assert result["status"] == "timeout"
+    assert result["run_seconds"] >= 0.05
+
+
+def test_error(tmp_path):
+    result = batch.runFile(write(tmp_path, "bad.inc", "FOO R1\nEOP\n"))
+    assert (result["status"], result["error"]) == ("error", "unknown mnemonic FOO")
+
+
+def test_check(tmp_path):
+    result = batch.runFile(write(tmp_path, "hang.inc", HANG), check=True)
+    assert result["status"] == "rejected"
+    # zeroes its own JMP and stops: not provably endless
+    result = batch.runFile(write(tmp_path, "patch.inc", "MOV R1, 0\nMOV R2, 11\nMOV *R2, R1\nJMP 10\n"), check=True)
+    assert (result["status"], result["error"]) == ("ok", "")
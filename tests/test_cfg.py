@@ -0,0 +1,74 @@
+# Control-flow graph, loops, liveness and termination of small programs (cfg.py)
+
+import storage
+import tracing
+from cfg import EXIT, Graph
+from run import Program
+
+
+def graph(source, **options):
+    machine = storage.Machine()
+    Program(source, machine, tracer=tracing.Tracer(tracing.OFF))
+    return Graph(machine, **options)
+
+
+def test_blocks_and_edges():
+    g = graph(["MOV R1, 3", "LOOP:", "SUB R1, 1", "JGT LOOP, R1, R0", "EOP"])
+    base = storage.mbr
+    assert sorted(g.blocks) == [base, base + 1, base + 3]
+    assert g.blocks[base].succs == {base + 1: "fall"}
+    assert g.blocks[base + 1].succs == {base + 1: "branch", base + 3: "fall"}
+    assert g.blocks[base + 3].succs == {EXIT: "exit"}
+
+
+def test_loops_nest():
+    g = graph(["OUTER:", "MOV R2, 3", "INNER:", "SUB R2, 1", "JGT INNER, R2, R0",
+               "SUB R1, 1", "JGT OUTER, R1, R0", "EOP"])
+    base = storage.mbr
+    assert [(loop.header, loop.depth) for loop in g.loops] == [(base + 1, 2), (base, 1)]
+    assert g.loops[0].parent is g.loops[1]
+    assert g.blocks[base + 1].depth == 2
+
+
+def test_call_ret_edges():
+    g = graph(["CALL F", "EOP", "F:", "MOV R1, 1", "RET"])
+    base = storage.mbr
+    assert g.blocks[base].succs == {base + 2: "call", base + 1: "fall"}
+    assert g.blocks[base + 2].succs == {base + 1: "return", EXIT: "fall"}     # fall: RET on an empty stack
+    assert g.unreachable() == []
+
+
+def test_liveness_and_dead_stores():
+    g = graph(["MOV R1, 1", "MOV R1, 2", "MOV R2, R1", "EOP"], observable={2})
+    assert g.deadStores() == [(storage.mbr, 1)]
+    assert g.blocks[storage.mbr].liveIn == set()
+    assert "SPR" in graph(["PUSH R1", "EOP"]).blocks[storage.mbr].liveIn
+
+
+def test_unreachable():
+    g = graph(["JMP END", "MOV R1, 1", "END:", "EOP"])
+    assert g.unreachable() == [storage.mbr + 1]
+
+
+def test_never_terminates():
+    g = graph(["MOV R1, 1", "LOOP:", "ADD R1, 1", "JMP LOOP"])
+    assert g.neverTerminates()
+    assert g.stuck() == [storage.mbr, storage.mbr + 1]
+    assert not graph(["LOOP:", "ADD R1, 1", "JLT LOOP, R1, R2", "EOP"]).neverTerminates()
+
+
+def test_self_modifying_can_terminate():
+    # the indirect MOV zeroes the JMP: the program stops although the graph has no exit
+    source = ["MOV R1, 0", "MOV R2, 11", "MOV *R2, R1", "JMP 10"]
+    g = graph(source)
+    assert g.selfModifying and g.stuck()
+    assert not g.neverTerminates()
+    machine = storage.Machine()
+    program = Program(source, machine, tracer=tracing.Tracer(tracing.OFF))
+    program.start()
+    assert not program.step(100)
+
+
+def test_scan_writes_code():
+    assert graph(["MOV R2, 20", "SCAN *R2", "EOP"]).selfModifying
+    assert not graph(["SCAN R1", "EOP"]).selfModifying
@@ -0,0 +1,81 @@
+# Two-pass assembly: label resolution, Jcc encoding and the branches, CALL and RET it
+# feeds (compiler.py, run.py)
+
+import pytest
+
+import storage
+import tracing
+from compiler import Instruction, opcodes
+from run import Program
+
+
+def load(source):
+    sink = tracing.RingSink()
+    program = Program(source, storage.Machine(), tracer=tracing.Tracer(tracing.ERROR, sink))
+    return program, sink
+
+
+def reg(program, k):
+    return int(program.machine.register.get(k))
+
+
+def test_labels():
+    program = Instruction.preEncode(["START:", "MOV R1, 1", "DEF X, 5", "LOOP: ADD R1, 1", "JMP END",
+                                     "END:", "EOP"])
+    assert Instruction.labels(program, 8) == {"START": 8, "LOOP": 9, "END": 11}
+
+
+def test_forward_and_backward_targets():
+    program, _ = load(["JMP SKIP", "MOV R1, 9", "SKIP:", "MOV R2, 3", "BACK: SUB R2, 1", "JGT BACK, R2, R0", "EOP"])
+    memory, base = program.machine.memory, program.machine.codeBase
+    decode = lambda pc: Program.decode(memory.loadInstruction(pc))
+    assert decode(base)[2] == (0b100, base + 2)
+    assert decode(base + 4)[2] == (0b100, base + 3)
+    program.run()
+    assert (reg(program, 1), reg(program, 2)) == (0, 0)
+
+
+def test_label_past_the_operand_field():
+    machine = storage.Machine(memLen=512, codeBase=254, codeLen=20)     # L lands on 256
+    with pytest.raises(ValueError, match="past the 8-bit operand field"):
+        Program(["JMP L", "MOV R1, 1", "L: EOP"], machine, tracer=tracing.Tracer(tracing.OFF))
+
+
+def test_jcc_keeps_the_compared_register():
+    word = Instruction.encode(["JLT", "10", "R1", "R7"], storage.Machine())
+    assert word >> 27 == opcodes["JLT"]
+    assert Program.decode(word)[4] == 7
+    with pytest.raises(ValueError, match="compares with a register"):
+        Instruction.encode(["JLT", "10", "R1", "5"], storage.Machine())
+
+
+@pytest.mark.parametrize("name, taken", [("JEQ", [0, 1, 0]), ("JNE", [1, 0, 1]), ("JLT", [1, 0, 0]),
+                                         ("JLE", [1, 1, 0]), ("JGT", [0, 0, 1]), ("JGE", [0, 1, 1])])
+def test_conditions(name, taken):
+    # R1 against R2 = 5 for R1 = 4, 5, 6; R3 = 1 when the jump was taken
+    for a, expected in zip((4, 5, 6), taken):
+        program, _ = load([f"MOV R1, {a}", "MOV R2, 5", f"{name} YES, R1, R2", "EOP", "YES: MOV R3, 1", "EOP"])
+        program.run()
+        assert reg(program, 3) == expected, (name, a)
+
+
+def test_nested_calls():
+    program, sink = load(["CALL A", "ADD R1, 100", "EOP",
+                          "A:", "ADD R1, 1", "CALL B", "ADD R1, 10", "RET",
+                          "B:", "MUL R1, 2", "RET"])
+    program.run()
+    assert reg(program, 1) == (1 * 2 + 10) + 100
+    assert program.machine.stack.get() == storage.mspr
+    assert not sink.records
+
+
+def test_ret_on_an_empty_stack_falls_through():
+    program, sink = load(["RET", "MOV R1, 1", "EOP"])
+    program.run()
+    assert reg(program, 1) == 1
+    assert [record[1] for record in sink.records] == ["stack_error"]
+
+
+def test_unknown_mnemonic():
+    with pytest.raises(ValueError, match="unknown mnemonic FOO"):
+        Instruction.encode(["FOO", "R1"], storage.Machine())
@@ -0,0 +1,60 @@
+# Bulk Precision conversions against the scalar dec2spbin/spbin2dec path (convert.py)
+
+import random
+
+import pytest
+
+import convert
+from convert import Length, Precision
+
+
+def values(count=2000, seed=0):
+    rng = random.Random(seed)
+    out = [0., 1., -1., 2., 255.99, -128.5, 65535.99]
+    out += [rng.randint(100, 2**16 * 100) / 100 * rng.choice((1, -1)) for _ in range(count)]
+    return out
+
+
+def small(count=500, seed=1):
+    rng = random.Random(seed)
+    return [rng.randint(1, 99) / 100 * rng.choice((1, -1)) for _ in range(count)]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    # run the bulk functions with NumPy and with their plain Python fallback
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        convert.numpy()
+    else:
+        monkeypatch.setattr(convert, "np", False)
+    return request.param
+
+
+def test_words_match_scalar_bits(backend):
+    # 0 and |x| >= 1: the packed word is the scalar 32-bit string read as an integer
+    xs = values()
+    assert [int(w) for w in Precision.dec2spword(xs)] == [int(Precision.dec2spbin(x), 2) for x in xs]
+
+
+def test_decoded_values_match_scalar(backend):
+    xs = values() + small()
+    words = Precision.dec2spword(xs)
+    assert [float(x) for x in Precision.spword2dec(words)] == [Precision.spbin2dec(Precision.dec2spbin(x)) for x in xs]
+
+
+def test_small_values_get_normalized_words(backend):
+    # dec2spbin writes a negative fraction field for 0 < |x| < 1; the bulk words are normalized
+    xs = small()
+    for x, word in zip(xs, Precision.dec2spword(xs)):
+        assert int(word) >> Length.fraction & (2**Length.whole - 1) < 2**(Length.whole - 1) - 1
+        assert Precision.spbin2dec(Length.addZeros(int(word), Length.precision)) == round(x, Length.dec_place)
+
+
+def test_strings_round_trip(backend):
+    xs = values()
+    words = Precision.dec2spword(xs)
+    strings = Precision.spword2spbin(words)
+    assert strings == [Precision.dec2spbin(x) for x in xs]
+    assert [int(w) for w in Precision.spbin2spword(strings)] == [int(w) for w in words]
+    assert len(Precision.spbin2spword([])) == 0
@@ -0,0 +1,165 @@
+# PRNT/SCAN channels and VMs waiting on input (devices.py, run.py, scheduler.py)
+
+import asyncio
+
+import pytest
+
+import cfg
+import devices
+import jit
+import storage
+import tracing
+from run import Program
+from scheduler import Scheduler
+
+ECHO = ["SCAN R1", "MOV R2, R1", "EOP"]
+PRNT_R0 = ["MOV R0, 7", "PRNT R0", "MOV R2, 3", "EOP"]
+
+
+def load(source, values=None, native=False):
+    # values: None leaves the default closed, empty input; a list feeds an open channel
+    machine = storage.Machine(native)
+    machine.output = devices.OutputChannel(devices.MemorySink())
+    if values is not None:
+        machine.input = devices.InputChannel(values, closed=False)
+    return Program(source, machine, tracer=tracing.Tracer(tracing.OFF))
+
+
+def register(vm, k):
+    return int(vm.program.machine.register.get(k))
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_prnt_r0(native):
+    # PRNT R0 encodes as the all-zero word; inside the program it is not the end
+    program = load(PRNT_R0, native=native)
+    machine = program.machine
+    assert machine.memory.loadInstruction(machine.codeBase + 1) == 0
+    program.run()
+    assert machine.output.sink.values == [7]
+    assert int(machine.register.get(2)) == 3
+    assert not cfg.Graph(machine).neverTerminates()
+
+
+def test_prnt_r0_in_a_compiled_loop():
+    program = load(["MOV R1, 3", "L:", "PRNT R0", "SUB R1, 1", "JGT L, R1, R0", "MOV R2, 1", "EOP"])
+    program.run(jit.Translator(program.machine, threshold=1))
+    assert program.machine.output.sink.values == [0, 0, 0]
+    assert int(program.machine.register.get(2)) == 1
+
+
+def test_empty_word_past_the_program_ends_it():
+    program = load(["MOV R1, 1", "JMP 20"])
+    program.run()
+    assert int(program.machine.register.get("PC")) == 20
+    assert program.machine.output.sink.values == []
+
+
+def test_output_is_written_in_batches():
+    program = load(["MOV R1, 5", "L:", "PRNT R1", "SUB R1, 1", "JGT L, R1, R0", "EOP"])
+    sink = program.machine.output.sink
+    program.machine.output.capacity = 2
+    program.start()
+    program.step(6)         # two PRNTs: one full batch
+    assert sink.values == [5, 4]
+    program.step(3)
+    assert sink.values == [5, 4]
+    assert not program.step(100)    # the end of the run flushes the rest
+    assert sink.values == [5, 4, 3, 2, 1]
+
+
+def test_stream_and_file_sinks(tmp_path, capsys):
+    channel = devices.OutputChannel()
+    channel.write(1)
+    channel.write(2.5)
+    assert capsys.readouterr().out == ""
+    channel.flush()
+    assert capsys.readouterr().out == "1\n2.5\n"
+    path = tmp_path / "out.txt"
+    channel = devices.OutputChannel(devices.FileSink(str(path), "w"))
+    channel.write(3)
+    channel.close()
+    assert path.read_text() == "3\n"
+
+
+def test_scan():
+    program = load(["SCAN R1", "SCAN R2", "SCAN R3", "EOP"])
+    program.machine.input = devices.InputChannel([4, 5])
+    program.run()
+    assert [int(program.machine.register.get(k)) for k in (1, 2, 3)] == [4, 5, 0]    # closed and empty: 0
+
+
+def test_scan_waits_in_step():
+    program = load(ECHO, [])
+    program.start()
+    assert program.step(10)
+    assert program.blocked is program.machine.input
+    assert program.executed == 0
+    program.machine.input.feed(6)
+    assert not program.step(10)
+    assert int(program.machine.register.get(2)) == 6
+
+
+def test_pump():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"1 2\n3\n")
+        reader.feed_eof()
+        channel = devices.InputChannel()
+        await channel.pump(reader)
+        return channel
+
+    channel = asyncio.run(main())
+    assert [channel.read() for _ in range(4)] == [1., 2., 3., 0]
+
+
+def test_blocked():
+    # run() cannot wait for input: a VM parked at SCAN ends blocked, the others finish
+    scheduler = Scheduler()
+    waiting = scheduler.add(load(ECHO, []))
+    other = scheduler.add(load(["MOV R1, 1", "EOP"]))
+    scheduler.run()
+    assert waiting.status == "blocked"
+    assert other.status == "done"
+    assert waiting.program.blocked is waiting.program.machine.input
+
+
+def test_fed_input():
+    scheduler = Scheduler()
+    vm = scheduler.add(load(ECHO, [4]))
+    scheduler.run()
+    assert vm.status == "done"
+    assert register(vm, 2) == 4
+
+
+def test_async_wakes_on_feed():
+    async def main():
+        scheduler = Scheduler()
+        vm = scheduler.add(load(ECHO, []))
+        task = asyncio.create_task(scheduler.runAsync())
+        await asyncio.sleep(0.01)
+        assert vm in scheduler.parked
+        vm.program.machine.input.feed(9)
+        await task
+        return vm
+
+    vm = asyncio.run(main())
+    assert vm.status == "done"
+    assert register(vm, 2) == 9
+
+
+def test_async_parked_timeout():
+    async def main():
+        scheduler = Scheduler()
+        vm = scheduler.add(load(ECHO, []), timeout=0.05)
+        await asyncio.wait_for(scheduler.runAsync(), 5)
+        return vm
+
+    assert asyncio.run(main()).status == "timeout"
+
+
+def test_func_ends_the_program():
+    program = load(["MOV R1, 1", "FUNC", "PRNT R1"])
+    program.run()
+    assert program.machine.output.sink.values == []
+    assert int(program.machine.register.get("PC")) == program.machine.codeBase + 1
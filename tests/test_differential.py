@@ -0,0 +1,45 @@
+# Synthetic programs (synth.py) run through the plain interpreter and through every
+# faster path must end in the same state: the peephole pass here, the JIT in
+# test_jit.py, lanes in test_lanes.py
+
+import pytest
+
+import storage
+import synth
+import tracing
+from run import Program
+
+SEEDS = range(4)
+MIXES = sorted(synth.MIXES)
+
+
+def load(source, native=False, **options):
+    return Program(source, storage.Machine(native), tracer=tracing.Tracer(tracing.OFF), **options)
+
+
+def cell(part, address):
+    return int(part.get(address)) if part.resolve(address) is not None else 0
+
+
+def state(machine):
+    # Registers, the stack pointer and data memory; PUSH x / POP d rewritten to MOV d, x
+    # leaves no value behind on the stack, so the stack slots (mspr..mcpr-1) are left out
+    registers = [cell(machine.register, k) for k in range(machine.regLen)]
+    memory = [cell(machine.memory, k) for k in range(machine.memLen)
+              if not machine.memory.inCode(k) and not storage.mspr <= k < storage.mcpr]
+    return registers, int(machine.register.get("SPR")), memory
+
+
+def interpreted(source, native=False):
+    program = load(source, native)
+    program.run()
+    return state(program.machine)
+
+
+@pytest.mark.parametrize("mix", MIXES)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_peephole(mix, seed):
+    source = synth.generate(synth.MAX_LENGTH, mix, seed)
+    program = load(source, optimize=True)
+    program.run()
+    assert state(program.machine) == interpreted(source)
@@ -0,0 +1,80 @@
+# Program images cached on disk (image.py)
+
+import pytest
+
+import image
+import storage
+import synth
+import tracing
+from run import Program
+
+MIXES = sorted(synth.MIXES)
+
+
+def load(source, machine=None, **options):
+    machine = machine or storage.Machine()
+    return Program(source, machine, tracer=tracing.Tracer(tracing.OFF), **options)
+
+
+def state(machine):
+    registers = [int(machine.register.get(k)) for k in range(machine.regLen)]
+    memory = [int(machine.memory.get(k)) for k in range(machine.memLen)]
+    return registers, memory
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+@pytest.mark.parametrize("mix", MIXES)
+def test_hit_runs_like_a_fresh_assembly(mix, optimize, tmp_path):
+    source = synth.generate(synth.MAX_LENGTH, mix, 1)
+    plain = load(source, optimize=optimize)
+    plain.run()
+    first = load(source, cache=str(tmp_path), optimize=optimize)
+    second = load(source, cache=str(tmp_path), optimize=optimize)
+    assert first.program is not None and second.program is None     # assembled, then a hit
+    assert second.changes == first.changes
+    for program in (first, second):
+        program.run()
+        assert state(program.machine) == state(plain.machine)
+
+
+def test_hit_keeps_the_machine_data(tmp_path):
+    source = ["MOV R1, 100", "MOV R2, *R1", "EOP"]
+    seeded = storage.Machine()
+    seeded.memory.store(100, 7)
+    load(source, seeded, cache=str(tmp_path))
+    other = storage.Machine()
+    other.memory.store(100, 42)
+    program = load(source, other, cache=str(tmp_path))
+    assert program.program is None
+    program.run()
+    assert other.register.get(2) == 42
+    fresh = load(source, cache=str(tmp_path))
+    assert fresh.program is None and fresh.machine.memory.get(100) == 0
+
+
+def test_hit_sets_the_program_end(tmp_path):
+    # a trailing PRNT R0 is an all-zero word; the image still tells the run where the program ends
+    source = ["MOV R2, 3", "PRNT R0"]
+    load(source, cache=str(tmp_path))
+    program = load(source, cache=str(tmp_path))
+    assert program.program is None
+    assert program.machine.programEnd == program.machine.codeBase + 2
+
+
+def test_key_follows_the_layout(tmp_path):
+    source = ["MOV R1, 1", "EOP"]
+    paths = {image.path(str(tmp_path), source, machine)
+             for machine in (storage.Machine(), storage.Machine(), storage.Machine(codeBase=10),
+                             storage.Machine(memLen=512), storage.Machine(regLen=64))}
+    assert len(paths) == 4
+    assert image.path(str(tmp_path), source, storage.Machine(), optimize=True) not in paths
+
+
+def test_read_round_trip(tmp_path):
+    program = load(synth.generate(synth.MAX_LENGTH, "mixed", 2), cache=str(tmp_path), optimize=True)
+    path = image.path(str(tmp_path), synth.generate(synth.MAX_LENGTH, "mixed", 2), storage.Machine(), True)
+    cached = image.Image.read(path)
+    machine = program.machine
+    assert list(cached.words) == [machine.memory.loadInstruction(a) for a in range(cached.start, cached.pc)]
+    assert cached.changes == program.changes
+    assert dict(cached.symbols) == {name: machine.variable.load(name) for name in machine.variable.data}
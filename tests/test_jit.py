@@ -0,0 +1,88 @@
+# Compiled blocks against the interpreter: final state, instruction budgets and snapshot
+# journals (jit.py)
+
+import pytest
+
+import jit
+import storage
+import synth
+import tracing
+from run import Program
+from scheduler import VM
+from test_differential import MIXES, SEEDS, interpreted, load, state
+
+COUNTED = ["MOV R1, 0", "MOV R3, 250", "LOOP:", "ADD R1, 1", "ADD R2, R1", "JLT LOOP, R1, R3", "EOP"]
+FOREVER = ["LOOP:", "ADD R1, 1", "JMP LOOP"]
+SPINNING = ["LOOP:", "ADD R1, 1", "JGE LOOP, R1, R0"]
+
+
+@pytest.mark.parametrize("native", [False, True])
+@pytest.mark.parametrize("mix", MIXES)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_translator(mix, seed, native):
+    source = synth.generate(synth.MAX_LENGTH, mix, seed)
+    program = load(source, native)
+    translator = jit.Translator(program.machine, threshold=1)
+    program.run(translator)
+    assert state(program.machine) == interpreted(source, native)
+    if mix == "loop":
+        assert translator.blocks
+
+
+@pytest.mark.parametrize("native", [False, True])
+@pytest.mark.parametrize("count", [1, 7, 50, 1000])
+def test_step_counts_every_instruction(count, native):
+    # step(count) stops at the same instruction with and without compiled blocks
+    plain, compiled = load(COUNTED, native), load(COUNTED, native)
+    translator = jit.Translator(compiled.machine, threshold=1)
+    plain.start()
+    compiled.start()
+    while plain.step(count):
+        assert compiled.step(count, translator)
+        assert compiled.executed == plain.executed
+        assert state(compiled.machine) == state(plain.machine)
+    assert not compiled.step(count, translator)
+    assert compiled.executed == plain.executed
+    assert translator.blocks
+
+
+@pytest.mark.parametrize("source", [FOREVER, SPINNING])
+def test_budget_stops_a_spinning_block(source):
+    plain, compiled = load(source), load(source)
+    vms = [VM(plain, budget=5000), VM(compiled, budget=5000, translator=jit.Translator(compiled.machine, threshold=1))]
+    for vm in vms:
+        while vm.turn(1000):
+            pass
+    assert [vm.status for vm in vms] == ["budget", "budget"]
+    assert [vm.executed for vm in vms] == [5000, 5000]
+    assert state(compiled.machine) == state(plain.machine)
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_blocks_write_through_the_journal(native):
+    # a block compiled before the snapshot still records its writes, so restore undoes them
+    program = load(COUNTED, native)
+    machine = program.machine
+    translator = jit.Translator(machine, threshold=1)
+    program.run(translator)
+    before = state(machine)
+    snapshot = machine.snapshot()
+    machine.register.put(1, 0)
+    program.run(translator)
+    assert int(machine.register.get(2)) == 2 * before[0][2]
+    machine.restore(snapshot)
+    assert state(machine) == before
+
+
+def test_blocks_follow_reinstated_data():
+    # restoring an older snapshot replaces the string storage's dicts the blocks indexed
+    program = load(COUNTED)
+    machine = program.machine
+    translator = jit.Translator(machine, threshold=1)
+    first = machine.snapshot()
+    program.run(translator)
+    done = state(machine)
+    machine.snapshot()
+    machine.restore(first)
+    program.run(translator)
+    assert state(machine) == done
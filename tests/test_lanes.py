@@ -0,0 +1,113 @@
+# Lanes against one scalar run per lane: divergent jumps, divide-by-zero flags and the
+# lanes left to the interpreter (lanes.py)
+
+import pytest
+
+import devices
+import storage
+import synth
+from test_differential import MIXES, load, state
+
+np = pytest.importorskip("numpy")
+lanes = pytest.importorskip("lanes")
+
+COUNT = 8
+
+
+def scalar(source, seed):
+    # final state of one scalar run with registers seeded from {register: value}
+    program = load(source, native=True)
+    for k, value in seed.items():
+        program.machine.register.put(k, value)
+    program.run()
+    return state(program.machine)
+
+
+def laneState(engine, lane):
+    machine = engine.machine
+    registers = [int(x) for x in engine.registers[lane]]
+    memory = [int(engine.memory[lane, k]) for k in range(machine.memLen)
+              if not machine.memory.inCode(k) and not storage.mspr <= k < storage.mcpr]
+    return registers, int(engine.spr[lane]), memory
+
+
+def run(source, seeds):
+    engine = lanes.Lanes(load(source, native=True), len(seeds))
+    for lane, seed in enumerate(seeds):
+        for k, value in seed.items():
+            engine.registers[lane, k] = value
+    return engine.run()
+
+
+@pytest.mark.parametrize("mix", MIXES)
+def test_lanes(mix):
+    source = synth.generate(synth.MAX_LENGTH, mix, 0)
+    rng = np.random.default_rng(0)
+    array = np.arange(storage.mapr, storage.mspr)
+    values = rng.integers(0, 50, size=(COUNT, len(array))).astype(float)
+    engine = lanes.Lanes(load(source, native=True), COUNT)
+    engine.memory[:, array] = values
+    engine.run()
+    for lane in range(COUNT):
+        program = load(source, native=True)
+        for address, value in zip(array, values[lane]):
+            program.machine.memory.put(int(address), value)
+        program.run()
+        assert laneState(engine, lane) == state(program.machine)
+
+
+def test_divergent_loops():
+    # every lane runs its own number of iterations and takes its own branch afterwards
+    source = ["L:", "ADD R2, R1", "SUB R1, 1", "JGT L, R1, R0", "JEQ EVEN, R2, R3", "MOV R4, 1", "EOP",
+              "EVEN:", "MOV R4, 2", "EOP"]
+    seeds = [{1: n, 3: n * (n + 1) // 2 if n % 2 else -1} for n in range(1, COUNT + 1)]
+    engine = run(source, seeds)
+    assert not engine.fallback.any() and engine.halted.all()
+    for lane, seed in enumerate(seeds):
+        assert laneState(engine, lane) == scalar(source, seed)
+    assert [int(x) for x in engine.registers[:, 4]] == [2 if n % 2 else 1 for n in range(1, COUNT + 1)]
+
+
+def test_div_by_zero():
+    source = ["MOV R3, 10", "DIV R3, R1", "MOD R1, R2", "EOP"]
+    seeds = [{1: lane % 3, 2: lane % 2} for lane in range(COUNT)]
+    engine = run(source, seeds)
+    assert list(engine.divByZero) == [seed[1] == 0 or seed[2] == 0 for seed in seeds]
+    for lane, seed in enumerate(seeds):
+        assert laneState(engine, lane) == scalar(source, seed)
+
+
+def test_call_ret():
+    source = ["CALL F", "ADD R1, 1", "EOP", "F:", "MUL R1, 2", "RET"]
+    seeds = [{1: lane} for lane in range(COUNT)]
+    engine = run(source, seeds)
+    assert not engine.fallback.any()
+    assert [int(x) for x in engine.registers[:, 1]] == [2 * lane + 1 for lane in range(COUNT)]
+
+
+def test_code_writes_fall_back():
+    # lanes with R2 inside the instruction region patch their own copy of the program
+    source = ["MOV *R2, R0", "MOV R1, 5", "EOP"]
+    seeds = [{2: storage.mbr + 1 if lane % 2 else 200} for lane in range(COUNT)]
+    engine = run(source, seeds)
+    assert list(engine.fallback) == [bool(lane % 2) for lane in range(COUNT)]
+    for lane, seed in enumerate(seeds):
+        assert laneState(engine, lane) == scalar(source, seed)
+
+
+def test_prnt_falls_back_in_lane_order():
+    program = load(["MOV R2, R1", "PRNT R1", "EOP"], native=True)
+    program.machine.output = devices.OutputChannel(devices.MemorySink())
+    engine = lanes.Lanes(program, 4)
+    engine.registers[:, 1] = [3, 1, 4, 1]
+    engine.run()
+    assert engine.fallback.all()
+    assert program.machine.output.sink.values == [3, 1, 4, 1]
+    assert [int(x) for x in engine.registers[:, 2]] == [3, 1, 4, 1]
+
+
+def test_limit():
+    engine = lanes.Lanes(load(["L:", "ADD R1, 1", "JMP L"], native=True), 2, limit=100)
+    engine.run()
+    assert list(engine.executed) == [100, 100]
+    assert not engine.halted.any()
@@ -0,0 +1,54 @@
+# Peephole rewrites on small programs: which instructions change and that the run ends
+# in the same state (peephole.py; synthetic programs in test_differential.py)
+
+import os
+
+from run import Program
+from test_differential import interpreted, load, state
+
+
+def optimized(source):
+    program = load(source, optimize=True)
+    program.run()
+    assert state(program.machine) == interpreted(source)
+    return [(kind, inst, replacement) for kind, _, inst, replacement in program.changes]
+
+
+def test_push_pop():
+    assert optimized(["MOV R1, 5", "PUSH R1", "POP R3", "EOP"])[:2] == [
+        ("stack", "PUSH R1", "MOV R3, R1"), ("stack", "POP R3", None)]
+
+
+def test_push_mov_pop():
+    # the MOV forms of push and pop (isk.inc pops with MOV R3, POP)
+    assert optimized(["MOV R1, 5", "PUSH R1", "MOV R3, POP", "EOP"])[:2] == [
+        ("stack", "PUSH R1", "MOV R3, R1"), ("stack", "MOV R3, POP", None)]
+    assert optimized(["MOV R1, 5", "MOV PUSH, R1", "POP 100", "EOP"])[:2] == [
+        ("stack", "MOV PUSH, R1", "MOV 100, R1"), ("stack", "POP 100", None)]
+
+
+def test_pop_into_the_stack_is_kept():
+    assert optimized(["MOV R1, 5", "PUSH R1", "MOV PUSH, POP", "POP R2", "EOP"]) == []
+
+
+def test_indirect_operand_only_ends_its_block():
+    # the instruction with the indirect operand is kept; the blocks around it are optimized
+    changes = optimized(["MOV R1, 100", "MOV 100, 7", "MOV R2, 1", "ADD R2, 2", "MOV R3, *R1",
+                         "MOV R4, 1", "ADD R4, 2", "EOP"])
+    assert ("fold", "ADD R2, 2", "MOV R2, 3") in changes
+    assert ("fold", "ADD R4, 2", "MOV R4, 3") in changes
+    assert all(inst != "MOV R3, *R1" for _, inst, _ in changes)
+
+
+def test_call_ret():
+    source = ["MOV R1, 1", "CALL F", "ADD R1, 10", "EOP", "F:", "MOV R2, 1", "MOV R2, 2", "ADD R1, R2", "RET"]
+    assert ("dead", "MOV R2, 1", None) in optimized(source)
+
+
+def test_computed_jump_skips_the_program():
+    assert optimized(["MOV R1, 11", "JMP R1", "MOV R2, 1", "MOV R2, 2", "EOP"]) == []
+
+
+def test_isk():
+    changes = optimized(Program.readFile(os.path.join(os.path.dirname(__file__), "..", "isk.inc")))
+    assert ("stack", "PUSH R11", "MOV R12, R11") in changes
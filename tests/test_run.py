@@ -0,0 +1,37 @@
+# Program.run: the per-PC decode cache and the PC register it leaves (run.py)
+
+import storage
+import tracing
+from run import Program
+
+
+def load(source, native=False):
+    return Program(source, storage.Machine(native), tracer=tracing.Tracer(tracing.OFF))
+
+
+def test_pc_after_run():
+    program = load(["MOV R1, 5", "ADD R1, 2", "EOP", "MOV R1, 0"])
+    program.run()
+    machine = program.machine
+    assert int(machine.register.get(1)) == 7
+    assert int(machine.register.get("PC")) == machine.codeBase + 2     # stopped at EOP
+
+
+def test_pc_after_step():
+    program = load(["MOV R1, 1", "ADD R1, 1", "ADD R1, 1", "EOP"])
+    program.start()
+    assert program.step(2)
+    assert int(program.machine.register.get("PC")) == program.machine.codeBase + 2
+
+
+def test_decode_cache_sees_stores():
+    # a store into the instruction region drops the cached decode of that word
+    for native in (False, True):
+        program = load(["MOV R1, 1", "ADD R1, R1", "EOP"], native)
+        machine = program.machine
+        program.run()
+        assert int(machine.register.get(1)) == 2
+        patched = load(["MOV R1, 1", "ADD R1, 5"], native).machine.memory.loadInstruction(machine.codeBase + 1)
+        machine.memory.store(machine.codeBase + 1, format(patched, "032b"))
+        program.run()
+        assert int(machine.register.get(1)) == 6
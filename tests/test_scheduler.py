@@ -0,0 +1,124 @@
+# Scheduler stop conditions, priorities and VM.step (scheduler.py; SCAN parking in test_devices.py)
+
+import asyncio
+
+import pytest
+
+import devices
+import storage
+import tracing
+from run import Program
+from scheduler import Scheduler
+
+FOREVER = ["LOOP:", "ADD R1, 1", "JMP LOOP"]
+
+
+def load(source):
+    return Program(source, storage.Machine(), tracer=tracing.Tracer(tracing.OFF))
+
+
+def register(vm, k):
+    return int(vm.program.machine.register.get(k))
+
+
+def test_done():
+    scheduler = Scheduler(quantum=10)
+    vm = scheduler.add(load(["MOV R1, 5", "ADD R1, 2", "EOP"]))
+    scheduler.run()
+    assert vm.status == "done"
+    assert register(vm, 1) == 7
+
+
+def test_budget():
+    scheduler = Scheduler(quantum=64)
+    vm = scheduler.add(load(FOREVER), budget=1000)
+    scheduler.run()
+    assert vm.status == "budget"
+    assert vm.executed == 1000
+
+
+def test_timeout():
+    scheduler = Scheduler(quantum=100)
+    vm = scheduler.add(load(FOREVER), timeout=0.05)
+    scheduler.run()
+    assert vm.status == "timeout"
+    assert vm.elapsed >= 0.04
+
+
+def test_priority():
+    scheduler = Scheduler(quantum=100)
+    low = scheduler.add(load(FOREVER), priority=1)
+    high = scheduler.add(load(FOREVER), priority=2)
+    for _ in range(30):
+        scheduler.turn()
+    assert high.executed == 2 * low.executed
+
+
+def test_vm_step():
+    async def main():
+        scheduler = Scheduler()
+        vm = scheduler.add(load(FOREVER))
+        ran = await vm.step(250, quantum=100)
+        return vm, ran
+
+    vm, ran = asyncio.run(main())
+    assert ran == 250
+    assert vm.executed == 250
+    assert vm.status == "ready"
+
+
+def test_round_robin():
+    scheduler = Scheduler(quantum=50)
+    vms = [scheduler.add(load(FOREVER)) for _ in range(3)]
+    for _ in range(6):
+        scheduler.turn()
+    assert [vm.executed for vm in vms] == [100, 100, 100]
+
+
+def test_late_vm_gets_its_share_only():
+    # a VM added later joins at the current pass instead of catching up on missed turns
+    scheduler = Scheduler(quantum=10)
+    early = scheduler.add(load(FOREVER))
+    for _ in range(20):
+        scheduler.turn()
+    late = scheduler.add(load(FOREVER))
+    for _ in range(10):
+        scheduler.turn()
+    assert (early.executed, late.executed) == (250, 50)
+
+
+def test_bad_priority():
+    with pytest.raises(ValueError):
+        Scheduler().add(load(FOREVER), priority=0)
+
+
+def test_error():
+    scheduler = Scheduler()
+    broken = scheduler.add(load(FOREVER))
+    other = scheduler.add(load(["MOV R1, 1", "EOP"]))
+    def fail(count, translator=None):
+        raise RuntimeError("lost the machine")
+    broken.program.step = fail
+    scheduler.run()
+    assert (broken.status, broken.error) == ("error", "lost the machine")
+    assert other.status == "done"
+
+
+def test_stopped_vm_flushes_its_output():
+    program = load(["L:", "PRNT R1", "JMP L"])
+    program.machine.output = devices.OutputChannel(devices.MemorySink())
+    scheduler = Scheduler(quantum=10)
+    vm = scheduler.add(program, budget=25)
+    scheduler.run()
+    assert vm.status == "budget"
+    assert len(program.machine.output.sink.values) == 13
+
+
+def test_many_vms():
+    scheduler = Scheduler(quantum=5)
+    vms = [scheduler.add(load([f"MOV R1, {n % 200}", "L:", "SUB R1, 1", "JGT L, R1, R0", "EOP"]))
+           for n in range(1000)]
+    scheduler.run()
+    assert all(vm.status == "done" for vm in vms)
+    assert sum(vm.executed for vm in vms) == sum(2 * max(n % 200, 1) + 2 for n in range(1000))  # MOV, SUB+JGT per pass, EOP
+    assert len(scheduler.report().splitlines()) == 1001
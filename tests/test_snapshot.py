@@ -0,0 +1,89 @@
+# Machine.snapshot/restore: undoing a run through the write journal or copying an older
+# snapshot back, on every storage engine (storage.py)
+
+import pytest
+
+import storage
+import tracing
+from run import Program
+
+SOURCE = ["MOV R1, 100", "MOV R2, *R1", "ADD R2, 1", "MOV *R1, R2", "PUSH R2", "MOV R3, 5", "EOP"]
+MACHINES = {
+    "string": lambda: storage.Machine(),
+    "native": lambda: storage.Machine(True),
+    "paged": lambda: storage.Machine(pageSize=16),
+}
+
+
+def dump(machine):
+    return [sorted(part.items(), key=lambda kv: str(kv[0])) for part in machine.data]
+
+
+@pytest.fixture(params=sorted(MACHINES))
+def program(request):
+    return Program(SOURCE, MACHINES[request.param](), tracer=tracing.Tracer(tracing.OFF))
+
+
+def test_restore_undoes_a_run(program):
+    machine = program.machine
+    snapshot = machine.snapshot()
+    loaded = dump(machine)
+    for _ in range(3):
+        program.run()
+        assert int(machine.memory.get(100)) == 1
+        assert dump(machine) != loaded
+        machine.restore(snapshot)
+        assert dump(machine) == loaded
+
+
+def test_restore_with_new_inputs(program):
+    # one assembly, many runs: seed the input, run, restore
+    machine = program.machine
+    snapshot = machine.snapshot()
+    for value in (3, 10, 41):
+        machine.memory.put(100, value)
+        program.run()
+        assert int(machine.register.get(2)) == value + 1
+        assert machine.stack.get() == storage.mspr + 1
+        machine.restore(snapshot)
+        assert machine.stack.get() == storage.mspr
+
+
+def test_restore_an_older_snapshot(program):
+    machine = program.machine
+    first = machine.snapshot()
+    loaded = dump(machine)
+    program.run()
+    second = machine.snapshot()
+    ran = dump(machine)
+    machine.memory.put(100, 9)
+    machine.restore(first)          # not the latest: copied back, then tracked again
+    assert dump(machine) == loaded
+    assert machine.active is first
+    program.run()
+    machine.restore(first)
+    assert dump(machine) == loaded
+    machine.restore(second)
+    assert dump(machine) == ran
+
+
+def test_code_writes_are_undone():
+    machine = storage.Machine()
+    program = Program(["MOV R1, 0", "MOV R2, 10", "MOV *R2, R1", "EOP"], machine, tracer=tracing.Tracer(tracing.OFF))
+    snapshot = machine.snapshot()
+    word = machine.memory.loadInstruction(machine.codeBase + 2)
+    program.run()
+    assert machine.memory.loadInstruction(machine.codeBase + 2) == 0
+    machine.restore(snapshot)
+    assert machine.memory.loadInstruction(machine.codeBase + 2) == word
+
+
+def test_paged_rollback_drops_new_pages():
+    machine = storage.Machine(memLen=1 << 16, pageSize=64)
+    snapshot = machine.snapshot()
+    pages = set(machine.memory.pages)
+    machine.memory.put(40000, 1)
+    assert set(machine.memory.pages) == pages | {40000 // 64}
+    machine.restore(snapshot)
+    assert set(machine.memory.pages) == pages
+    assert machine.memory.get(40000) == 0.
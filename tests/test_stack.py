@@ -0,0 +1,90 @@
+# The SPR stack: bounds, bulk pushes and pops, and the instructions that use it on a
+# default machine (storage.Stack, run.py)
+
+import pytest
+
+import storage
+import tracing
+from run import Program
+
+
+def load(source, native=False):
+    sink = tracing.RingSink()
+    program = Program(source, storage.Machine(native), tracer=tracing.Tracer(tracing.ERROR, sink))
+    return program, sink
+
+
+def errors(sink):
+    return [record[1] for record in sink.records if record[0] == tracing.ERROR]
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_starts_at_the_spr_register(native):
+    machine = storage.Machine(native)
+    assert machine.stack.get() == storage.mspr
+    assert int(machine.register.get("SPR")) == int(machine.register.get(storage.br + 6))
+
+
+def test_overflow_and_underflow():
+    stack = storage.Machine().stack
+    with pytest.raises(storage.StackUnderflow):
+        stack.pop()
+    stack.pushMany(list(range(storage.mcpr - storage.mspr)))
+    with pytest.raises(storage.StackOverflow):
+        stack.push(1)
+    assert stack.get() == storage.mcpr
+    assert stack.top() == storage.mcpr - storage.mspr - 1
+
+
+def test_push_pop_many():
+    stack = storage.Machine().stack
+    stack.push(1)
+    stack.pushMany([2, 3, 4])
+    assert stack.get() == storage.mspr + 4
+    assert stack.popMany(3) == [4, 3, 2]
+    with pytest.raises(storage.StackUnderflow):
+        stack.popMany(2)
+    assert stack.get() == storage.mspr + 1      # a failed popMany leaves the pointer alone
+    assert stack.pop() == 1
+
+
+def test_room_is_checked_before_writing():
+    machine = storage.Machine()
+    stack = machine.stack
+    stack.pushMany([0] * (storage.mcpr - storage.mspr - 1))
+    with pytest.raises(storage.StackOverflow):
+        stack.pushMany([7, 7])
+    assert int(machine.memory.get(storage.mcpr - 1)) == 0
+
+
+def test_pointer_written_by_someone_else():
+    machine = storage.Machine()
+    machine.stack.push(5)
+    machine.register.put("SPR", storage.mspr + 10)
+    assert machine.stack.get() == storage.mspr + 10
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_push_pop_instructions(native):
+    program, sink = load(["MOV R1, 5", "PUSH R1", "MOV R3, POP", "PUSH 7", "POP R4", "EOP"], native)
+    program.run()
+    machine = program.machine
+    assert [int(machine.register.get(k)) for k in (3, 4)] == [5, 7]
+    assert machine.stack.get() == storage.mspr
+    assert errors(sink) == []
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_call_ret(native):
+    program, sink = load(["MOV R1, 1", "CALL F", "ADD R1, 10", "EOP", "F:", "ADD R1, 1", "RET"], native)
+    program.run()
+    assert int(program.machine.register.get(1)) == 12
+    assert program.machine.stack.get() == storage.mspr
+    assert errors(sink) == []
+
+
+def test_pop_on_an_empty_stack():
+    program, sink = load(["POP R1", "MOV R2, 1", "EOP"])
+    program.run()
+    assert errors(sink) == ["stack_error"]
+    assert int(program.machine.register.get(2)) == 1
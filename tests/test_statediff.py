@@ -0,0 +1,79 @@
+# Machine.diff change sets and their JSON/binary forms (storage.py, statediff.py)
+
+import pytest
+
+import statediff
+import storage
+import tracing
+from convert import Precision
+from run import Program
+
+
+def word(value):
+    return int(Precision.dec2spbin(value), 2)
+
+
+@pytest.fixture(params=[False, True], ids=["string", "native"])
+def machine(request):
+    return storage.Machine(request.param)
+
+
+def test_diff_lists_only_the_changed_cells(machine):
+    program = Program(["MOV R1, 100", "MOV R2, 5", "MOV *R1, R2", "MOV R2, 0", "EOP"], machine,
+                      tracer=tracing.Tracer(tracing.OFF))
+    machine.checkpoint()
+    program.run()
+    diff = machine.diff()
+    assert diff["memory"] == {100: word(5)}
+    assert diff["register"][1] == word(100)
+    assert 2 not in diff["register"]        # written, then put back to what it held
+    assert diff["register"]["PC"] == word(machine.codeBase + 4)
+    assert diff["variable"] == {}
+
+
+def test_removed_and_named_cells(machine):
+    machine.checkpoint()
+    machine.variable.store("COUNT", 3)
+    machine.register.put("SPR", 120)
+    del machine.register.data["SPR"]        # nothing left where the journal saw a value
+    diff = machine.diff()
+    assert diff["variable"] == {"COUNT": word(3)}
+    assert diff["register"] == {"SPR": None}
+
+
+def test_fractions(machine):
+    # values below 1 are reported as their packed word (dec2spbin's string is not one)
+    machine.checkpoint()
+    machine.memory.put(100, 0.25)
+    machine.memory.put(101, -0.3)
+    diff = machine.diff()["memory"]
+    assert diff == {100: int(Precision.dec2spword([0.25])[0]), 101: int(Precision.dec2spword([-0.3])[0])}
+
+
+def test_needs_a_checkpoint():
+    with pytest.raises(Exception, match="No checkpoint"):
+        storage.Machine().diff()
+
+
+def test_round_trip(machine):
+    machine.checkpoint()
+    machine.register.put(3, 12)
+    machine.memory.put(200, 1.5)
+    machine.variable.store("X", 7)
+    machine.register.put("SPR", 120)
+    del machine.register.data["SPR"]
+    diff = machine.diff()
+    assert statediff.loads(statediff.dumps(diff)) == diff
+    assert statediff.fromJSON(statediff.toJSON(diff)) == diff
+
+
+def test_compare():
+    old = {"register": {1: 5, 2: 6}, "memory": {}}
+    new = {"register": {1: 5, 2: 7}, "memory": {100: None}}
+    assert statediff.compare(old, new) == {"register": {2: (6, 7)}, "memory": {100: ("unchanged", None)}}
+    assert statediff.compare(old, old) == {}
+
+
+def test_loads_rejects_other_data():
+    with pytest.raises(ValueError):
+        statediff.loads(b"ISKX" + bytes(statediff.HEADER.size))
@@ -0,0 +1,77 @@
+# Paged and mmap-backed memory and configurable address spaces (storage.PagedStorage, Machine)
+
+import struct
+
+import pytest
+
+import storage
+import tracing
+from run import Program
+
+FAR = ["MOV R1, 250", "MUL R1, 200", "MOV R2, 7", "MOV *R1, R2", "MOV R3, *R1", "EOP"]     # mem[50000] = 7
+
+
+def load(source, machine):
+    return Program(source, machine, tracer=tracing.Tracer(tracing.OFF))
+
+
+def test_pages_are_allocated_on_first_write():
+    memory = storage.PagedStorage(1 << 20, pageSize=256)
+    assert memory.get(123456) == 0. and memory.load(999999) == 0.
+    assert memory.pages == {}
+    memory.put(123456, 5)
+    memory.store(123457, 6)
+    assert list(memory.pages) == [123456 // 256]
+    assert (memory.get(123456), memory.get(123457)) == (5, 6)
+    assert len(list(memory.items())) == 256
+
+
+def test_out_of_range():
+    memory = storage.PagedStorage(1000, pageSize=64)
+    with pytest.raises(KeyError):
+        memory.get(1000)
+
+
+def test_large_address_space():
+    machine = storage.Machine(memLen=1 << 20, pageSize=1024)
+    load(FAR, machine).run()
+    assert int(machine.register.get(3)) == 7
+    assert int(machine.memory.get(50000)) == 7
+    assert 50000 // 1024 in machine.memory.pages
+    assert len(machine.memory.pages) <= 3           # the stack page and the written one
+
+
+def test_paged_runs_like_the_default_machine():
+    source = ["MOV R1, 3", "L:", "ADD R2, R1", "PUSH R2", "SUB R1, 1", "JGT L, R1, R0",
+              "POP R4", "MOV R5, *R4", "EOP"]
+    plain, paged = storage.Machine(), storage.Machine(pageSize=16)
+    load(source, plain).run()
+    load(source, paged).run()
+    for k in range(plain.regLen):
+        assert int(paged.register.get(k)) == int(plain.register.get(k))
+    for k in range(plain.memLen):
+        if not plain.memory.inCode(k):
+            assert int(paged.memory.get(k)) == int(plain.memory.get(k))
+
+
+def test_mmap(tmp_path):
+    path = tmp_path / "memory.bin"
+    machine = storage.Machine(memLen=1 << 20, path=str(path))
+    load(FAR, machine).run()
+    assert int(machine.register.get(3)) == 7
+    assert path.stat().st_size == 8 << 20
+    machine.memory.map.flush()
+    with open(path, "rb") as f:
+        f.seek(8 * 50000)
+        assert struct.unpack("d", f.read(8)) == (7.,)
+    machine.memory.close()
+    assert machine.memory.map is None
+
+
+def test_long_program():
+    # a code region past the default 64 words
+    machine = storage.Machine(codeLen=200)
+    source = ["ADD R1, 1"] * 150 + ["EOP"]
+    load(source, machine).run()
+    assert int(machine.register.get(1)) == 150
+    assert int(machine.register.get("PC")) == machine.codeBase + 150
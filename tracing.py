@@ -0,0 +1,152 @@
+# tracing.py - Levelled tracing for the assembler and interpreter
+#
+# Callers check tracer.debugging (a plain bool) before emitting per-instruction
+# records, so a disabled tracer costs one attribute test and no formatting.
+# A record is a small tuple (level, event, args); the text for an event comes from
+# MESSAGES and is only built when a sink actually writes it out.
+
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+ERROR = 40
+OFF = 100
+
+MESSAGES = {
+    # compiler.Instruction.encodeProgram
+    "encode_start": "[INFO] Encoding program instructions...",
+    "encode_skip": "[DEBUG] Skipping {} instruction",
+    "encoded": "[DEBUG] Encoded {}: {:032b}",
+    "encode_done": "[INFO] Program encoding complete",
+    # peephole.Optimizer
+    "optimize_skip": "[INFO] Peephole pass skipped: {}",
+    "optimized": "[DEBUG] Peephole {} at {}: {} -> {}",
+    "optimize_done": "[INFO] Peephole pass: {} -> {} instructions",
+    # run.Program
+    "run_start": "\n[INFO] Starting program execution...",
+    "execute": "\n[DEBUG] Executing instruction at PC={}",
+    "code": "[DEBUG] Instruction code: {:032b}",
+    "operation": "[DEBUG] Operation: {}",
+    "move": "[DEBUG] Moving value {}",
+    "arith": "[DEBUG] {0}: {1} {0} {2}",
+    "result": "[DEBUG] Result: {}",
+    "push": "[DEBUG] Pushing value {}",
+    "pop": "[DEBUG] Popping value {}",
+    "jump": "[DEBUG] Jump target: {}",
+    "branch": "[DEBUG] {}: {} vs {}, next PC={}",
+    "call": "[DEBUG] Call {} (return to {})",
+    "return": "[DEBUG] Return to {}",
+    "print": "[DEBUG] Printing {}",
+    "scan": "[DEBUG] Scanned {}",
+    "wrote_reg": "[DEBUG] Wrote {} to R{}",
+    "wrote_mem": "[DEBUG] Wrote {} to memory[{}]",
+    "pushed": "[DEBUG] Pushed {} to stack at {}",
+    "getop_failed": "[ERROR] GetOp failed: {}",
+    "write_failed": "[ERROR] Write failed: {}",
+    "stack_error": "[ERROR] Stack: {}",
+    "run_error": "[ERROR] at PC={}: {}",
+    "scan_blocked": "[ERROR] SCAN at PC={} is waiting for input; run() stops here",
+    "run_done": "\n[Program Terminated]",
+}
+
+
+def formatRecord(record):
+    level, event, args = record
+    return MESSAGES[event].format(*args)
+
+
+class NullSink:
+    # Drops every record
+    def write(self, record):
+        pass
+
+    def flush(self):
+        pass
+
+
+class ConsoleSink:
+    # Prints each record as it arrives (the pre-tracing behaviour)
+    def write(self, record):
+        print(formatRecord(record))
+
+    def flush(self):
+        pass
+
+
+class RingSink:
+    # Keeps the last `size` records in memory, unformatted
+    def __init__(self, size=4096):
+        self.records = deque(maxlen=size)
+
+    def write(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        pass
+
+    def lines(self):
+        return [formatRecord(record) for record in self.records]
+
+    def clear(self):
+        self.records.clear()
+
+
+class FileSink:
+    # Collects records and writes them to a file in batches of `batch` records
+    def __init__(self, path, batch=1024):
+        self.file = open(path, "w")
+        self.batch = batch
+        self.pending = []
+
+    def write(self, record):
+        self.pending.append(record)
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        self.file.write("".join(formatRecord(record) + "\n" for record in self.pending))
+        self.file.flush()
+        self.pending.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class Tracer:
+    def __init__(self, level=ERROR, sink=None):
+        self.configure(level, sink or ConsoleSink())
+
+    def configure(self, level=None, sink=None):
+        if level is not None:
+            self.level = level
+        if sink is not None:
+            self.sink = sink
+        self.debugging = self.level <= DEBUG
+        self.informing = self.level <= INFO
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def emit(self, level, event, *args):
+        if level >= self.level:
+            self.sink.write((level, event, args))
+
+    def debug(self, event, *args):
+        if self.debugging:
+            self.sink.write((DEBUG, event, args))
+
+    def info(self, event, *args):
+        if self.informing:
+            self.sink.write((INFO, event, args))
+
+    def error(self, event, *args):
+        if self.level <= ERROR:
+            self.sink.write((ERROR, event, args))
+
+    def flush(self):
+        self.sink.flush()
+
+
+# Shared tracer for programs that are not given their own: errors only
+default = Tracer()
@@ -3,93 +3,107 @@ from convert import Precision
 
 class Access:
     @staticmethod
-    def data(addr, flow=["var", "register", "memory"]):
+    def data(addr, flow=["var", "register", "memory"], machine=None):
         #Try to load data from storage based on the flow priority.
+        # Each scope is asked with Storage.resolve, so a miss is a lookup, not a caught exception.
+        machine = machine or storage.machine
         for scope in flow:
-            try:
-                if scope == "var":
-                    return storage.variable.load(addr)
-                elif scope == "register":
-                    return storage.register.load(addr)
-                elif scope == "memory":
-                    return storage.memory.load(addr)
-            except:
-                continue
+            target = Access.scope(scope, machine)
+            if target is not None:
+                key = target.resolve(addr)
+                if key is not None:
+                    return target.get(key)
         raise Exception(f"Address {addr} not found in storage.")
 
     @staticmethod
-    def store(scope, addr, value):
+    def scope(scope, machine):
+        if scope == "var":
+            return machine.variable
+        elif scope == "register":
+            return machine.register
+        elif scope == "memory":
+            return machine.memory
+        return None
+
+    @staticmethod
+    def store(scope, addr, value, machine=None):
         #Store value in the specified storage scope (register or memory).
+        machine = machine or storage.machine
         if scope == "register":
-            storage.register.store(addr, value)
+            machine.register.store(addr, value)
         elif scope == "memory":
-            storage.memory.store(addr, value)
+            machine.memory.store(addr, value)
         elif scope == "var":
-            storage.variable.store(addr, value)
+            machine.variable.store(addr, value)
         else:
             raise Exception(f"Invalid storage scope: {scope}")
 
 class AddressingMode:
     @staticmethod
-    def register(reg_addr):
+    def register(reg_addr, machine=None):
         #Register addressing mode (returns value stored in register).
-        return storage.register.load(reg_addr)
+        machine = machine or storage.machine
+        return machine.register.get(reg_addr)
 
     @staticmethod
-    def register_indirect(reg_addr):
+    def register_indirect(reg_addr, machine=None):
         #Register indirect addressing (get address from register, then load from memory).
-        addr = storage.register.load(reg_addr)
-        return storage.memory.load(int(addr))
+        machine = machine or storage.machine
+        addr = machine.register.get(reg_addr)
+        return machine.memory.get(int(addr))
 
     @staticmethod
-    def direct(var_addr):
+    def direct(var_addr, machine=None):
         # Direct memory access by address.
-        return storage.memory.load(int(var_addr))
+        machine = machine or storage.machine
+        return machine.memory.get(int(var_addr))
 
     @staticmethod
-    def indirect(var_addr):
+    def indirect(var_addr, machine=None):
         # Indirect memory access: fetch address from memory, then load value.
-        addr = storage.memory.load(int(var_addr))
-        return storage.memory.load(int(addr))
+        machine = machine or storage.machine
+        addr = machine.memory.get(int(var_addr))
+        return machine.memory.get(int(addr))
 
     @staticmethod
-    def indexed(displace):
+    def indexed(displace, machine=None):
         # Indexed mode: use I1 or I2 to compute address offset.
-        base = int(storage.register.load("I1"))
-        return storage.memory.load(base + int(displace))
+        machine = machine or storage.machine
+        base = int(machine.register.get("I1"))
+        return machine.memory.get(base + int(displace))
 
     @staticmethod
-    def autoinc(reg_addr):
+    def autoinc(reg_addr, machine=None):
         # Auto-increment: get value from address, then increment register.
-        addr = storage.register.load(reg_addr)
-        value = storage.memory.load(int(addr))
-        storage.register.store(reg_addr, int(addr) + 1)
+        machine = machine or storage.machine
+        addr = machine.register.get(reg_addr)
+        value = machine.memory.get(int(addr))
+        machine.register.put(reg_addr, int(addr) + 1)
         return value
 
     @staticmethod
-    def autodec(reg_addr):
+    def autodec(reg_addr, machine=None):
         # Auto-decrement: decrement register, then get value from new address.
-        addr = int(storage.register.load(reg_addr)) - 1
-        storage.register.store(reg_addr, addr)
-        return storage.memory.load(addr)
+        machine = machine or storage.machine
+        addr = int(machine.register.get(reg_addr)) - 1
+        machine.register.put(reg_addr, addr)
+        return machine.memory.get(addr)
 
     @staticmethod
-    def stack(stack_option):
-        # Stack operations using SPR (Stack Pointer Register) and TSP (Top Stack Pointer).
-        spr = int(storage.register.load("SPR"))
-        tsp = int(storage.register.load("TSP"))
+    def stack(stack_option, machine=None):
+        # Stack operations on SPR (Stack Pointer Register), the stack PUSH/POP use too
+        # (machine.stack); out of the stack region raises storage.StackError
+        machine = machine or storage.machine
+        stack = machine.stack
 
         if stack_option == "push":
-            # Store value at TSP, then increment TSP
-            return_address = tsp
-            storage.register.store("TSP", tsp + 1)
-            return return_address  # Caller should write to this address
+            # Claim the slot at SPR, then increment SPR
+            return stack.reserve()  # Caller should write to this address
         elif stack_option == "pop":
-            # Decrement TSP, then return the popped value
-            storage.register.store("TSP", tsp - 1)
-            return storage.memory.load(tsp - 1)
+            # Decrement SPR, then return the popped value
+            return stack.pop()
         elif stack_option == "top":
             # Return value at current top
-            return storage.memory.load(tsp - 1)
+            return stack.top()
         else:
             raise Exception("Invalid stack option. Use 'push', 'pop', or 'top'.")